@@ -1,20 +1,28 @@
 """
-The Fire CLI code as well as the commands that the users type to get around the CLI
+The CLI code as well as the commands that the users type to get around the CLI
+
+Each command only imports the modules it needs when it is run, so keep
+imports at the top of this file to the few modules every command uses.
 """
 
-from modules.habit_manager import create_habit, delete_habit, mark_done
-from modules.habit_analysis import show_habits, show_longest
-from modules.predef_habits import predefined_habits
+import sys
+
+from modules.daemon import forward, serve
+from modules.dispatch import dispatch
+import modules.profiling as profiling
 
-# Rich modules to display formatted data in a table
-from rich.console import Console
-from rich.table import Table
+# Console to display strings and tables with styling, which only imports
+# rich once something is printed
+from modules.console import console
 
-# The python fire package to work with the CLI
-import fire
+# --profile can be given to any command, so take it out of the arguments
+argv, profile = profiling.parse_flag(sys.argv[1:])
 
-# Initialize a default rich console
-console = Console()
+# If "serve" is running, send the command to it and print its answer
+# before anything else is imported or loaded. Profiled commands are always
+# run here, since that is where the time is being measured
+if __name__ == "__main__" and profile is None and forward(argv):
+    sys.exit()
 
 # Function to view the applications functionality
 def app_help():
@@ -44,6 +52,9 @@ def app_help():
 
         PARAMETERS:
             --name="NAME"                   | Mark this habit as done for its period
+            --name='["NAME","NAME"]'        | Mark all of these habits as done
+            NAME NAME ...                   | Mark all of these habits as done
+            --from-file="PATH"              | Mark the habits named in this file (one per line, "-" for stdin) as done
         """)
     console.print("""
     "show habits"
@@ -51,6 +62,10 @@ def app_help():
 
         PARAMETERS:
             --period="PERIOD"               | View only the habits that have this periodicity
+            --page-size=NUMBER              | How many habits to show in each table (default 100)
+            --limit=NUMBER                  | View at most this many habits
+            --format="FORMAT"               | Print jsonl, csv or tsv for other programs instead of tables (default table)
+            --after="TOKEN"                 | Show the page after the one that printed this token
         """)
     console.print("""
     "longest streak"
@@ -58,26 +73,119 @@ def app_help():
 
         PARAMETERS:
             --name="NAME"               | View the longest streak for only this habit
+            --page-size=NUMBER              | How many habits to show in each table (default 100)
+            --limit=NUMBER                  | View at most this many habits
+            --top=NUMBER                    | View a ranked leaderboard of this many habits (default 10)
+            --period="PERIOD"               | Rank only the habits that have this periodicity
+            --format="FORMAT"               | Print jsonl, csv or tsv for other programs instead of tables (default table)
+        """)
+    console.print("""
+    "stats"
+        View the streaks, gaps and completion rates of all habits worked out from their check in history.
+        Streaks count periods in a row with a check in, so several check ins in one period count once
+
+        PARAMETERS:
+            --period="PERIOD"               | View only the habits that have this periodicity
+            --window=NUMBER                 | How many recent periods to work out adherence for (default 4)
+        """)
+    console.print("""
+    "summary"
+        View how many habits of each periodicity you have, how many are late and their average streaks
+        """)
+    console.print("""
+    "trend"
+        View how many times your habits were marked as done in each of the last few days, weeks or months
+
+        PARAMETERS:
+            --name="NAME"                   | View the trend of only this habit
+            --bucket="BUCKET"               | Count check ins by day, week or month (default week)
+            --last=NUMBER                   | How many days, weeks or months to show (default 30, 26 or 12)
+            --table                         | Also show the check ins of each one in a table
+        """)
+    console.print("""
+    "backfill trends"
+        Add check ins made before trends were kept to them, a chunk at a time so it can be stopped and carried on later
+
+        PARAMETERS:
+            --chunk-size=NUMBER             | How many check ins to add in each transaction (default 10000)
+            --rebuild                       | Make the trends again from every check in
+        """)
+    console.print("""
+    "export"
+        Export every habit and check in as memory mappable NumPy columns for analysis scripts, read with modules/columnar.py
+
+        PARAMETERS:
+            --format="FORMAT"               | The format of the export, only columnar for now (default columnar)
+            --output="PATH"                 | The folder to write the export to (default habits.columnar)
+        """)
+    console.print("""
+    "fleet report"
+        View the habits of many databases together, e.g. fleet report "users/*/habits.db", read in parallel by a process pool
+
+        PARAMETERS:
+            --top=NUMBER                    | How many of the longest streaks to show (default 10)
+            --workers=NUMBER                | How many processes to read with (default one per core)
+        """)
+    console.print("""
+    "seed"
+        Fill a database with synthetic habits named after the predefined habits, for capacity and load testing
+
+        PARAMETERS:
+            --habits=NUMBER                 | How many habits to add (default 1000)
+            --output="PATH"                 | The database to add them to (default seed.db)
+            --seed=NUMBER                   | The seed of the random number generator, the same seed makes the same habits (default 0)
+            --history                       | Also add every check in of each habit since it was started
+            --years=NUMBER                  | How many years before today habits are started on at most (default 2)
+            --force                         | Add the habits even if the database already has habits
         """)
+    console.print("""
+    "serve"
+        Keep all your habits in memory and answer the commands above much faster until stopped with CTRL + C.
+        While it is running, commands called from the same folder are sent to it, unless they need to ask you something
+        """)
+    console.print("""
+    --profile
+        Can be added to any command to print how long each part of it took, and add how long the command took to habits.prom
+
+        PARAMETERS:
+            --profile="PATH"                | Also save a cProfile of the command to this file, which can be read with pstats
+        """)
+    console.print("""
+    "api"
+        Serve your habits as an HTTP/JSON API until stopped with CTRL + C
+
+        PARAMETERS:
+            --host="HOST"                   | The address to listen on (default 127.0.0.1)
+            --port=NUMBER                   | The port to listen on (default 8080)
+            --readers=NUMBER                | How many database connections to read with at once (default 4)
+        """)
+
+
+# Function to run the habit server
+def serve_commands():
+    """
+    Keep all habits in memory and answer the commands that other
+    commands called from this folder send to it until stopped with CTRL + C
+    """
+    serve(commands)
+
 
 # Function to view all the predefined habits
 def view_predefined_habits():
     """
     View some predefined habits to see what an active habit tracker will look like
     """
-    table = Table(show_lines=True)
-    table.add_column("Name", justify="center", vertical="middle")
-    table.add_column("Repeat once every", justify="center", vertical="middle")
-    table.add_column("Started on", justify="center", vertical="middle")
-    table.add_column("Last checked on", justify="center", vertical="middle")
-    table.add_column("Longest streak", justify="center", vertical="middle")
-    table.add_column("Current streak", justify="center", vertical="middle")
+    # The predefined habits are only made for this command
+    from modules.predef_habits import predefined_habits
+    from modules.habit_analysis import make_habits_table
+
+    table = make_habits_table()
     for habit in predefined_habits:
         table.add_row(
             str(habit.name),
             str(habit.period),
-            str(habit.started_on),
-            str(habit.last_checked_on),
+            str(habit.started),
+            str(habit.last_checked),
             str(habit.streak_longest),
             str(habit.streak_current)
         )
@@ -86,13 +194,30 @@ def view_predefined_habits():
     console.print(table)
 
 
+# The commands and the functions they run. Functions in other modules are
+# given as "module:function" so they are only imported when they are run
+commands = {
+    "help": app_help,
+    "create habit": "modules.habit_manager:create_habit",
+    "delete habit": "modules.habit_manager:delete_habit",
+    "show habits": "modules.habit_analysis:show_habits",
+    "longest streak": "modules.habit_analysis:show_longest",
+    "stats": "modules.habit_analysis:show_stats",
+    "summary": "modules.habit_analysis:show_summary",
+    "trend": "modules.habit_analysis:show_trend",
+    "backfill trends": "modules.habit_analysis:backfill_trends",
+    "export": "modules.columnar:export",
+    "fleet report": "modules.fleet:fleet_report",
+    "seed": "modules.seed:seed_habits",
+    "view predef habits": view_predefined_habits,
+    "mark done": "modules.habit_manager:mark_done",
+    "serve": serve_commands,
+    "api": "modules.api:serve_api"
+}
+
 if __name__ == "__main__":
-    fire.Fire({
-        "help": app_help,
-        "create habit": create_habit,
-        "delete habit": delete_habit,
-        "show habits": show_habits,
-        "longest streak": show_longest,
-        "view predef habits": view_predefined_habits,
-        "mark done": mark_done
-    })
+    if profile is None:
+        dispatch(commands, argv)
+    else:
+        profiling.profile(lambda: dispatch(commands, argv),
+                          argv[0] if argv else "", profile)
@@ -0,0 +1,113 @@
+"""
+Load test for the habit API. Opens many keep-alive connections to a running
+API server (python HT_FOLDER_NAME api) and sends requests on all of them for
+a fixed time, then reports the requests per second and the p50/p99 latency.
+
+Usage:
+
+    python benchmarks/api_load_test.py --connections=50 --seconds=10
+
+By default only reads are sent. Use --writes=0.1 to make 10% of the
+requests mark a habit as done.
+"""
+
+# Argparse to read the load test settings
+import argparse
+
+# Asyncio to keep many connections busy at once
+import asyncio
+
+# Json module to read the habits to request
+import json
+
+# Random module to pick which request to send
+import random
+
+# Time module to measure latency
+import time
+
+# Quote to put habit names in the request paths
+from urllib.parse import quote
+
+
+async def send(reader: asyncio.StreamReader, writer: asyncio.StreamWriter, method: str, path: str) -> tuple:
+    """
+    Send one request on an open connection and return its status code and body
+    """
+    writer.write(
+        f"{method} {path} HTTP/1.1\r\nHost: localhost\r\nContent-Length: 0\r\n\r\n".encode())
+    await writer.drain()
+
+    status = int((await reader.readline()).split()[1])
+    length = 0
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b""):
+            break
+        key, _, value = line.decode().partition(":")
+        if key.lower() == "content-length":
+            length = int(value)
+    return status, await reader.readexactly(length)
+
+
+async def worker(host: str, port: int, names: list, writes: float, deadline: float, latencies: list, errors: list):
+    """
+    Send requests on one connection until the deadline
+    """
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        while time.perf_counter() < deadline:
+            # Names can have any character in them, "/" and "?" included
+            name = quote(random.choice(names), safe="")
+            if random.random() < writes:
+                method, path = "POST", f"/habits/{name}/done"
+            else:
+                method, path = random.choice([
+                    ("GET", f"/habits/{name}"),
+                    ("GET", "/habits?limit=10"),
+                    ("GET", "/longest?limit=10")
+                ])
+
+            start = time.perf_counter()
+            status, _ = await send(reader, writer, method, path)
+            latencies.append(time.perf_counter() - start)
+            if status >= 400:
+                errors.append(status)
+    finally:
+        writer.close()
+
+
+async def main(host: str, port: int, connections: int, seconds: float, writes: float):
+    reader, writer = await asyncio.open_connection(host, port)
+    _, body = await send(reader, writer, "GET", "/habits?limit=1000")
+    writer.close()
+    names = [habit["name"] for habit in json.loads(body)["habits"]]
+    if not names:
+        print("There are no habits to request, create some first")
+        return
+
+    latencies, errors = [], []
+    start = time.perf_counter()
+    await asyncio.gather(*(
+        worker(host, port, names, writes, start + seconds, latencies, errors)
+        for _ in range(connections)))
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    print(f"{len(latencies)} requests in {elapsed:.1f}s over {connections} connections ({len(errors)} errors)")
+    print(f"{len(latencies) / elapsed:.0f} requests/sec")
+    print(f"p50 {latencies[len(latencies) // 2] * 1000:.2f}ms")
+    print(f"p99 {latencies[int(len(latencies) * 0.99)] * 1000:.2f}ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--connections", type=int, default=50)
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--writes", type=float, default=0.0,
+                        help="the fraction of requests that mark a habit as done")
+    args = parser.parse_args()
+    asyncio.run(main(args.host, args.port, args.connections,
+                args.seconds, args.writes))
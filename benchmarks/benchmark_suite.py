@@ -0,0 +1,283 @@
+"""
+Benchmark suite for the habit app. Makes synthetic habit databases with a
+check in history at each size and times the public entry points of the
+app against them, then writes the results as JSON so they can be compared
+between runs.
+
+Usage:
+
+    python benchmarks/benchmark_suite.py --output=before.json
+    python benchmarks/benchmark_suite.py --baseline=before.json --output=after.json
+
+The databases are made once and kept in benchmarks/data, and every run
+works on a copy of them so one run doesn't change the numbers of the
+next. With --baseline, every benchmark whose median is more than
+--threshold slower than in the baseline is listed and the script exits
+with status 1.
+"""
+
+# Argparse to read the benchmark settings
+import argparse
+
+# Io and redirect_stdout to throw away what the commands print
+import io
+from contextlib import redirect_stdout
+
+# Json module to write and read the results
+import json
+
+# Os, shutil and tempfile to make the databases and copies of them
+import os
+import shutil
+import tempfile
+
+# Platform module to record what the benchmarks were run on
+import platform
+
+# Random module to make the synthetic habits
+import random
+
+# Subprocess and sys to time starting the app
+import subprocess
+import sys
+
+# Time module to time the benchmarks
+import time
+
+# Datetime module to make the dates of the synthetic habits
+from datetime import datetime, timedelta
+
+# Statistics module to summarize the timings
+from statistics import median
+
+# The app is run from the folder above this one
+APP = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, APP)
+
+import modules.database as database  # noqa: E402
+import modules.habit_analysis as habit_analysis  # noqa: E402
+import modules.habit_manager as habit_manager  # noqa: E402
+import modules.habit_repository as repository  # noqa: E402
+from modules.habit_class import Habit  # noqa: E402
+
+# Where the synthetic databases are kept between runs
+DATA = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data")
+
+# The number of habits in each synthetic database
+SIZES = [1_000, 10_000, 100_000, 1_000_000]
+
+# Check ins are added by habit id, since the ids of a new table are known
+INSERT_CHECKIN_ID = "INSERT INTO checkins (habit_id, checked_on) VALUES (?, ?)"
+
+# Differences smaller than this, in milliseconds, are never a regression,
+# since they are mostly noise
+MIN_DIFFERENCE_MS = 0.5
+
+
+def habit_name(number: int) -> str:
+    """
+    The name of a synthetic habit
+    """
+    return f"habit {number:07d}"
+
+
+def make_database(path: str, size: int, checkins: int, seed: int):
+    """
+    Make a database with this many synthetic habits, each with on average
+    this many check ins spread between the day it was started and today
+    """
+    rng = random.Random(seed + size)
+    today = datetime.today().replace(microsecond=0)
+    habits, history = [], []
+
+    for number in range(size):
+        started_on = today - timedelta(days=rng.randint(30, 730),
+                                       seconds=rng.randint(0, 86399))
+        span = int((today - started_on).total_seconds())
+        days = sorted(started_on + timedelta(seconds=rng.randint(0, span))
+                      for _ in range(rng.randint(0, 2 * checkins)))
+        history.extend((number + 1, database.to_seconds(day))
+                       for day in days)
+
+        streak_current = rng.randint(1, len(days)) if days else 0
+        habits.append((
+            habit_name(number),
+            rng.choice(["day", "week", "month"]),
+            database.to_seconds(started_on),
+            database.to_seconds(days[-1]) if days else None,
+            max(streak_current, rng.randint(0, len(days))),
+            streak_current
+        ))
+
+    db = database.Database(path, synchronous="OFF")
+    with db.connection:
+        db.connection.executemany(database.INSERT_HABIT, habits)
+        db.connection.executemany(INSERT_CHECKIN_ID, history)
+    db.close()
+
+
+def get_database(size: int, checkins: int, seed: int) -> str:
+    """
+    Return the path to the synthetic database of this size, making it if
+    it hasn't been made yet
+    """
+    # The schema version is part of the name, so databases made for an
+    # older schema are made again instead of migrated on every run
+    path = os.path.join(DATA, f"habits-v{database.SCHEMA_VERSION}-{size}-{checkins}-{seed}.db")
+    if not os.path.exists(path):
+        os.makedirs(DATA, exist_ok=True)
+        print(f"Making a database with {size} habits...", flush=True)
+        start = time.perf_counter()
+        make_database(path + ".tmp", size, checkins, seed)
+        os.replace(path + ".tmp", path)
+        print(f"Made it in {time.perf_counter() - start:.1f}s", flush=True)
+    return path
+
+
+def measure(function, repeats: int) -> dict:
+    """
+    Call function(i) for i in range(repeats) and return the median,
+    fastest and slowest time in milliseconds. It is called once more
+    first without being timed, so imports and caches that are only made on
+    the first call aren't counted. Anything it prints is thrown away
+    """
+    times = []
+    with redirect_stdout(io.StringIO()):
+        function(repeats)
+        for i in range(repeats):
+            start = time.perf_counter()
+            function(i)
+            times.append((time.perf_counter() - start) * 1000)
+
+    return {
+        "median_ms": round(median(times), 3),
+        "min_ms": round(min(times), 3),
+        "max_ms": round(max(times), 3)
+    }
+
+
+def benchmarks(size: int, directory: str) -> dict:
+    """
+    The benchmarks to run against a database of this size, by name. Each
+    one is given the number of the repeat, so the benchmarks that change
+    the database can use a different habit each time
+    """
+    step = max(size // 97, 1)
+
+    def existing(i: int) -> str:
+        return habit_name(i * step % size)
+
+    def startup(i: int):
+        subprocess.run([sys.executable, APP, "mark done", f"--name={existing(i + 50)}"],
+                       cwd=directory, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True)
+
+    return {
+        "get_habits": lambda i: database.get_habits(),
+        "add": lambda i: database.add(Habit(f"new habit {i}", "day")),
+        "update": lambda i: database.update(Habit(*database.get_habit(existing(i)))),
+        "create_habit_validation": lambda i: habit_manager.validate_inputs(f"other habit {i}", "week"),
+        "show_habits": lambda i: habit_analysis.show_habits(limit=100),
+        "show_longest": lambda i: habit_analysis.show_longest(limit=100),
+        "show_longest_name": lambda i: habit_analysis.show_longest(name=existing(i)),
+        "mark_done": lambda i: habit_manager.mark_done(name=existing(i + 25)),
+        "startup": startup
+    }
+
+
+def run(sizes: list, checkins: int, seed: int, repeats: int, only: list) -> dict:
+    """
+    Run the benchmarks at every size and return their results, by size and
+    then by benchmark name
+    """
+    results = {}
+    cwd = os.getcwd()
+
+    for size in sizes:
+        source = get_database(size, checkins, seed)
+        with tempfile.TemporaryDirectory() as directory:
+            shutil.copyfile(source, os.path.join(directory, "habits.db"))
+
+            # The default database opens habits.db in the working folder
+            # when it is first used
+            os.chdir(directory)
+            try:
+                results[str(size)] = {}
+                for name, function in benchmarks(size, directory).items():
+                    if only and name not in only:
+                        continue
+
+                    # Every benchmark starts with nothing read into memory
+                    database.db.close()
+                    repository.habits.clear()
+
+                    results[str(size)][name] = result = measure(
+                        function, repeats)
+                    print(f"{size:>9} {name:<24} {result['median_ms']:>10.2f}ms", flush=True)
+            finally:
+                database.db.close()
+                repository.habits.clear()
+                os.chdir(cwd)
+
+    return results
+
+
+def compare(results: dict, baseline: dict, threshold: float) -> list:
+    """
+    Return every benchmark that is more than threshold (a fraction) slower
+    than in the baseline, as (size, name, baseline ms, ms) tuples
+    """
+    regressions = []
+    for size, timings in results.items():
+        for name, result in timings.items():
+            old = baseline.get(size, {}).get(name)
+            if old is None:
+                continue
+            new_ms, old_ms = result["median_ms"], old["median_ms"]
+            if new_ms > old_ms * (1 + threshold) and new_ms - old_ms > MIN_DIFFERENCE_MS:
+                regressions.append((size, name, old_ms, new_ms))
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--sizes", default=",".join(str(size) for size in SIZES),
+                        help="the numbers of habits to benchmark, separated by commas")
+    parser.add_argument("--checkins", type=int, default=5,
+                        help="the average number of check ins of each habit")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--only", default="",
+                        help="run only these benchmarks, separated by commas")
+    parser.add_argument("--output", default="",
+                        help="the file to write the results to")
+    parser.add_argument("--baseline", default="",
+                        help="results of an earlier run to compare against")
+    parser.add_argument("--threshold", type=float, default=0.25,
+                        help="how much slower than the baseline counts as a regression")
+    args = parser.parse_args()
+
+    sizes = [int(size) for size in args.sizes.split(",") if size]
+    only = [name for name in args.only.split(",") if name]
+    report = {
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "checkins": args.checkins,
+        "seed": args.seed,
+        "repeats": args.repeats,
+        "results": run(sizes, args.checkins, args.seed, args.repeats, only)
+    }
+
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(report, file, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as file:
+            baseline = json.load(file)["results"]
+        regressions = compare(report["results"], baseline, args.threshold)
+        for size, name, old_ms, new_ms in regressions:
+            print(f"Regression: {name} with {size} habits took {new_ms:.2f}ms, was {old_ms:.2f}ms (+{(new_ms / old_ms - 1) * 100:.0f}%)")
+        if regressions:
+            sys.exit(1)
+        print(f"No regressions over {args.threshold * 100:.0f}% against {args.baseline}")
@@ -0,0 +1,412 @@
+"""
+The module containing the HTTP/JSON API, which serves the same habit
+operations as the CLI to many clients from one process using only the
+standard library.
+
+Requests are handled with asyncio. The blocking sqlite calls are run in
+two thread pools: a bounded pool of reader threads, each with its own
+connection, and a single writer thread that makes every change. Since
+the database uses write ahead logging, reads never wait for a write.
+
+Routes
+---
+GET /habits?period=PERIOD&limit=NUMBER&after=TOKEN
+    List a page of habits, sorted by descending order of longest streak,
+    PAGE_LIMIT of them unless a limit is given and never more than
+    MAX_LIMIT. The response has the token of the next page in "next",
+    which is null on the last page
+GET /habits/NAME
+    Get one habit
+POST /habits            {"name": "NAME", "period": "PERIOD"}
+    Create a habit
+DELETE /habits/NAME
+    Delete a habit
+POST /habits/NAME/done
+    Mark a habit as done
+GET /longest?limit=NUMBER
+    List the longest streaks, of at most MAX_LIMIT habits
+"""
+
+# Asyncio to handle many connections at once
+import asyncio
+
+# Json module to encode and decode request and response bodies
+import json
+
+# Threading to give each reader thread its own database connection
+import threading
+
+# Thread pools to run the blocking database calls in
+from concurrent.futures import ThreadPoolExecutor
+
+# Url parsing to read the path and query of requests
+from urllib.parse import parse_qs, unquote, urlsplit
+
+# Database module to read habits with
+import modules.database as database
+
+# Habit repository to make changes through
+import modules.habit_repository as repository
+
+from modules.habit_class import Habit
+import modules.habit_manager as habit_manager
+
+# How many habits are on a page when no limit is given, and the most a
+# response can have, so no request makes the server read every habit
+PAGE_LIMIT = 100
+MAX_LIMIT = 1000
+
+# The largest request body that is read, in bytes
+MAX_BODY = 64 * 1024
+
+# The reason phrases of the status codes the API responds with
+REASONS = {
+    200: "OK",
+    201: "Created",
+    400: "Bad Request",
+    404: "Not Found",
+    405: "Method Not Allowed",
+    409: "Conflict",
+    500: "Internal Server Error"
+}
+
+
+class HTTPError(Exception):
+    """
+    An error to respond to the request with
+
+    ...
+
+    Attributes
+    ---
+    status: int
+        The HTTP status code
+    message: str
+        The error message
+    """
+
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+def habit_to_dict(row) -> dict:
+    """
+    Convert a habit row from the database to a dictionary that can be
+    encoded as JSON
+
+    ...
+
+    Parameter
+    ---
+    row: tuple
+        The habit, in the order of database.HABIT_COLUMNS
+    """
+    return {
+        "name": row[0],
+        "period": row[1],
+        "started_on": database.format_date(row[2]),
+        "last_checked_on": database.format_date(row[3]),
+        "streak_longest": row[4],
+        "streak_current": row[5]
+    }
+
+
+class HabitAPI:
+    """
+    The habit operations of the API, each one run in the right thread pool
+
+    ...
+
+    Methods
+    ---
+    list_habits_page
+        Return one page of habits and the token of the next page
+    get_habit
+        Return one habit
+    longest
+        Return the longest streak of each habit
+    create
+        Create a habit
+    delete
+        Delete a habit
+    mark_done
+        Mark a habit as done
+    close
+        Stop the thread pools
+
+    Attributes
+    ---
+    readers: int
+        How many reader threads, and so reader connections, there are
+    """
+
+    def __init__(self, readers: int = 4):
+        self.readers = readers
+        self._reader_pool = ThreadPoolExecutor(
+            max_workers=readers, thread_name_prefix="habits-reader")
+
+        # A single writer thread means writes never wait on each other
+        # for the database lock, they simply run one after the other
+        self._writer_pool = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="habits-writer")
+        self._local = threading.local()
+        self._data_version = None
+
+    def _reader(self) -> database.Database:
+        """
+        The database connection of the current reader thread
+        """
+        if not hasattr(self._local, "db"):
+            self._local.db = database.Database(database.db.path)
+        return self._local.db
+
+    async def read(self, function, *args):
+        """
+        Run function(db, *args) in a reader thread
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._reader_pool, lambda: function(self._reader(), *args))
+
+    async def write(self, function, *args):
+        """
+        Run function(*args) in the writer thread, which uses the default
+        database and habit repository
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._writer_pool, self._write, function, args)
+
+    def _write(self, function, args):
+        """
+        Run a write after making sure the habit repository isn't out of
+        date because another process wrote to the database
+        """
+        version = database.db.connection.execute(
+            "PRAGMA data_version").fetchone()[0]
+        if version != self._data_version:
+            repository.habits.clear()
+            self._data_version = version
+        return function(*args)
+
+    async def list_habits_page(self, period: str, limit: int, after: str = "") -> dict:
+        try:
+            rows, token = await self.read(lambda db: db.get_habits_page(period, limit, after))
+        except ValueError as e:
+            raise HTTPError(400, str(e))
+        return {"habits": [habit_to_dict(row) for row in rows], "next": token or None}
+
+    async def get_habit(self, name: str) -> dict:
+        row = await self.read(lambda db: db.get_habit(name))
+        if row is None:
+            raise HTTPError(404, f"You do not have a habit called \"{name}\"")
+        return habit_to_dict(row)
+
+    async def longest(self, limit: int = 0) -> list:
+        rows = await self.read(lambda db: db.iter_longest(limit).fetchall())
+        return [{"name": name, "streak_longest": streak_longest} for name, streak_longest in rows]
+
+    async def create(self, name: str, period: str) -> dict:
+        def create():
+            if not habit_manager.validate_inputs(name, period):
+                raise HTTPError(409 if name in repository.habits else 400,
+                                habit_manager.error_message.strip())
+            habit = Habit(name, period)
+            response = repository.habits.add(habit)
+            if response != 'added':
+                raise HTTPError(500, str(response))
+            return habit_to_dict(database.db.get_habit(name))
+
+        return await self.write(create)
+
+    async def delete(self, name: str) -> dict:
+        def delete():
+            habit = repository.habits.get(name)
+            if habit is None:
+                raise HTTPError(
+                    404, f"You do not have a habit called \"{name}\"")
+            response = repository.habits.delete(habit)
+            if response != 'deleted':
+                raise HTTPError(500, str(response))
+            return {"deleted": name}
+
+        return await self.write(delete)
+
+    async def mark_done(self, name: str) -> dict:
+        def mark_done():
+            habit = repository.habits.get(name)
+            if habit is None:
+                raise HTTPError(
+                    404, f"You do not have a habit called \"{name}\"")
+            result = habit.mark_as_done(quiet=True)
+            if result not in ('checked', 'restarted and checked'):
+                raise HTTPError(500, str(result))
+            return {"result": result, "habit": habit_to_dict(database.db.get_habit(name))}
+
+        return await self.write(mark_done)
+
+    def close(self):
+        self._reader_pool.shutdown()
+        self._writer_pool.shutdown()
+
+
+async def route(api: HabitAPI, method: str, target: str, body: bytes) -> tuple:
+    """
+    Run the operation for this request and return the status code and the
+    data to respond with
+    """
+    url = urlsplit(target)
+    parts = [unquote(part) for part in url.path.strip("/").split("/")]
+    query = {key: values[-1] for key, values in parse_qs(url.query).items()}
+
+    try:
+        limit = int(query.get("limit", 0))
+    except ValueError:
+        raise HTTPError(400, "limit must be a number")
+    if not 0 <= limit <= MAX_LIMIT:
+        raise HTTPError(400, f"limit must be a number from 0 to {MAX_LIMIT}")
+
+    if parts == ["habits"]:
+        if method == "GET":
+            period = query.get("period", "")
+            if period and period not in ["day", "week", "month"]:
+                raise HTTPError(400, f"\"{period}\" is not a valid period")
+            return 200, await api.list_habits_page(period, limit or PAGE_LIMIT, query.get("after", ""))
+        if method == "POST":
+            try:
+                data = json.loads(body or b"{}")
+                name = str(data["name"]).lower()
+                period = str(data["period"]).lower()
+            except (ValueError, KeyError, TypeError):
+                raise HTTPError(
+                    400, "The body must be JSON with a name and a period")
+            return 201, await api.create(name, period)
+        raise HTTPError(405, f"{method} is not allowed here")
+
+    if len(parts) == 2 and parts[0] == "habits":
+        if method == "GET":
+            return 200, await api.get_habit(parts[1])
+        if method == "DELETE":
+            return 200, await api.delete(parts[1])
+        raise HTTPError(405, f"{method} is not allowed here")
+
+    if len(parts) == 3 and parts[0] == "habits" and parts[2] == "done":
+        if method == "POST":
+            return 200, await api.mark_done(parts[1])
+        raise HTTPError(405, f"{method} is not allowed here")
+
+    if parts == ["longest"]:
+        if method == "GET":
+            return 200, {"habits": await api.longest(limit or MAX_LIMIT)}
+        raise HTTPError(405, f"{method} is not allowed here")
+
+    raise HTTPError(404, f"There is nothing at {url.path}")
+
+
+def content_length(headers: dict) -> int:
+    """
+    The length of the body of a request, from its headers
+    """
+    try:
+        length = int(headers.get("content-length", 0))
+    except ValueError:
+        length = -1
+    if not 0 <= length <= MAX_BODY:
+        raise HTTPError(400, f"Content-Length must be a number from 0 to {MAX_BODY}")
+    return length
+
+
+async def handle(api: HabitAPI, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+    """
+    Answer every request sent over one connection, keeping it open
+    between requests unless the client asks to close it
+    """
+    try:
+        while True:
+            request_line = await reader.readline()
+            if not request_line.strip():
+                break
+
+            try:
+                method, target, version = request_line.decode(
+                    "latin-1").split()
+            except ValueError:
+                break
+
+            headers = {}
+            while True:
+                line = await reader.readline()
+                if line in (b"\r\n", b"\n", b""):
+                    break
+                key, _, value = line.decode("latin-1").partition(":")
+                headers[key.strip().lower()] = value.strip()
+
+            body = None
+            try:
+                body = await reader.readexactly(content_length(headers))
+                status, data = await route(api, method.upper(), target, body)
+            except asyncio.IncompleteReadError:
+                raise
+            except HTTPError as e:
+                status, data = e.status, {"error": e.message}
+            except Exception as e:
+                status, data = 500, {"error": str(e)}
+
+            # Without a body that could be read, where the next request
+            # starts isn't known, so the connection is closed
+            keep_alive = body is not None and headers.get("connection", "").lower() != "close" \
+                and version != "HTTP/1.0"
+
+            # Anything that isn't JSON is written as text, so a response
+            # is always sent
+            payload = json.dumps(data, default=str).encode()
+            writer.write((
+                f"HTTP/1.1 {status} {REASONS[status]}\r\n"
+                "Content-Type: application/json\r\n"
+                f"Content-Length: {len(payload)}\r\n"
+                f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n"
+                "\r\n").encode("latin-1") + payload)
+            await writer.drain()
+
+            if not keep_alive:
+                break
+    except (ConnectionError, asyncio.IncompleteReadError):
+        pass
+    finally:
+        writer.close()
+
+
+async def run_api(host: str, port: int, readers: int):
+    """
+    Run the API server until it is cancelled
+    """
+    api = HabitAPI(readers)
+    server = await asyncio.start_server(
+        lambda reader, writer: handle(api, reader, writer), host, port)
+    print(f"Serving the habit API on http://{host}:{port} with {readers} readers. Press CTRL + C to stop.")
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        api.close()
+
+
+def serve_api(host: str = "127.0.0.1", port: int = 8080, readers: int = 4):
+    """
+    Serve the habit API over HTTP until stopped with CTRL + C
+
+    ...
+
+    Parameters
+    ---
+    host: str, optional
+        The address to listen on
+    port: int, optional
+        The port to listen on
+    readers: int, optional
+        How many database connections to read with at once
+    """
+    try:
+        asyncio.run(run_api(host, int(port), max(int(readers), 1)))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,404 @@
+"""
+The module containing the columnar export of habits and check ins, for
+analysis scripts that would otherwise query the database and make a habit
+class out of every row each time they run.
+
+An export is a folder with one NumPy .npy file per column and a
+manifest.json that lists them. Every column is a fixed width integer, so
+the reader maps the files into memory instead of reading them, and a
+script can scan millions of habits without parsing a single string or
+loading more than the pages it touches.
+
+Layout
+---
+manifest.json
+    {"format": 1, "created": "...", "missing": -2147483648,
+     "tables": {"habits": {"rows": N, "columns": {"id": "habits.id.npy", ...},
+                           "strings": {"name": {"offsets": "habits.name.offsets.npy",
+                                                "data": "habits.name.utf8"}}},
+                "checkins": {"rows": M, "columns": {...}}},
+     "dictionaries": {"period": ["day", "week", "month"]}}
+
+habits.id.npy               int32   the id of the habit in the database
+habits.period.npy           int8    the code of its period in the period dictionary
+habits.started_on.npy       int32   the day it was started on
+habits.last_checked_on.npy  int32   the day it was last marked as done
+habits.streak_longest.npy   int32
+habits.streak_current.npy   int32
+checkins.habit.npy          int32   the row of the habit in the habits columns
+checkins.checked_on.npy     int32   the day it was marked as done
+habits.name.offsets.npy     int64   where the name of each habit starts in habits.name.utf8, and where the last one ends
+habits.name.utf8                    the name of every habit in row order, encoded as UTF-8 one after another
+
+Days are counted from 1970-01-01, and "missing" is stored instead of a
+day for habits that were never marked as done. Check ins are sorted by
+habit and then by day, so the check ins of one habit are next to each
+other. Names are unique, so they are stored once per row rather than
+as codes into a dictionary, which only the periods repeat enough for.
+
+Writing an export only needs the standard library, and the files are
+read with NumPy.
+
+Usage
+---
+python . export --format=columnar --output=habits.columnar
+
+export = columnar.open_export("habits.columnar")
+late = export.habits["last_checked_on"] < today - 1
+"""
+
+# Array module to gather each column before it is written
+from array import array
+
+# ExitStack to close every column file even when writing one fails
+from contextlib import ExitStack
+
+# Datetime module to record when an export was made
+from datetime import datetime
+
+# Json module to write and read the manifest
+import json
+
+# Os and shutil modules to make and replace the export folder
+import os
+import shutil
+
+# Sys module to find the byte order the columns are written in
+import sys
+
+# Console to print the progress of an export
+from modules.console import console
+
+# Database module to read the habits and check ins from
+import modules.database as database
+
+# Profiling module to time exports when --profile is given
+import modules.profiling as profiling
+
+# Bump whenever the layout of an export changes
+FORMAT = 2
+
+# Stored instead of a day when there is no date
+MISSING = -(2 ** 31)
+
+# The columns of each table, the typecode of the array module they are
+# gathered in and the NumPy type they are written as
+ENDIAN = "<" if sys.byteorder == "little" else ">"
+HABIT_COLUMNS = {
+    "id": ("i", "i4"),
+    "period": ("b", "i1"),
+    "started_on": ("i", "i4"),
+    "last_checked_on": ("i", "i4"),
+    "streak_longest": ("i", "i4"),
+    "streak_current": ("i", "i4")
+}
+CHECKIN_COLUMNS = {
+    "habit": ("i", "i4"),
+    "checked_on": ("i", "i4")
+}
+
+# The periods get the first codes, in this order, so the codes are the
+# same in every export
+PERIODS = ["day", "week", "month"]
+
+# How many rows are read from the database before they are written
+CHUNK_SIZE = 50000
+
+# Every .npy header is padded to this many bytes, which is enough for any
+# number of rows, so it can be written again once the rows are counted
+HEADER_SIZE = 128
+
+
+class _ColumnFile:
+    """
+    A .npy file written a chunk at a time, with its header filled in when
+    it is closed since the number of rows isn't known until then
+
+    ...
+
+    Attributes
+    ---
+    rows: int
+        How many values have been written
+    """
+
+    def __init__(self, path: str, descr: str):
+        self.file = open(path, "wb")
+        self.descr = descr
+        self.rows = 0
+        self.file.write(self._header())
+
+    def _header(self) -> bytes:
+        """
+        The header of a version 1.0 .npy file holding the rows written
+        """
+        header = f"{{'descr': '{self.descr}', 'fortran_order': False, 'shape': ({self.rows},), }}"
+        header = header.ljust(HEADER_SIZE - 10 - 1) + "\n"
+        return b"\x93NUMPY\x01\x00" + len(header).to_bytes(2, "little") + header.encode("latin1")
+
+    def write(self, values: array):
+        """
+        Add values to the end of the column
+        """
+        values.tofile(self.file)
+        self.rows += len(values)
+
+    def close(self):
+        self.file.seek(0)
+        self.file.write(self._header())
+        self.file.close()
+
+
+def _to_day(day) -> int:
+    """
+    The day stored for a date sqlite has turned into a number of days, or
+    MISSING if it couldn't
+    """
+    return MISSING if day is None else day
+
+
+@profiling.timed("columnar.write")
+def write_export(path: str, db: database.Database = None) -> dict:
+    """
+    Write every habit and check in of a database to a columnar export,
+    replacing the one already at this path. Both are read from the same
+    version of the database, and the export is written next to the path
+    and moved there once it is complete, so an export is never half
+    written. Returns its manifest
+
+    ...
+
+    Parameters
+    ---
+    path: str
+        The folder to write the export to
+    db: Database, optional
+        The database to export, the default one if none is given
+    """
+    db = db or database.db
+    if os.path.exists(path) and not os.path.exists(os.path.join(path, "manifest.json")):
+        raise FileExistsError(f"{path} already exists and is not a columnar export")
+
+    temporary = f"{path}.{os.getpid()}.tmp"
+    os.makedirs(temporary)
+    try:
+        manifest = _write_tables(temporary, db)
+        with open(os.path.join(temporary, "manifest.json"), "w") as file:
+            json.dump(manifest, file, indent=2)
+
+        if os.path.exists(path):
+            shutil.rmtree(path)
+        os.replace(temporary, path)
+    except BaseException:
+        shutil.rmtree(temporary, ignore_errors=True)
+        raise
+    return manifest
+
+
+def _write_tables(directory: str, db: database.Database) -> dict:
+    """
+    Write the columns of the habits and check ins to a folder and return
+    the manifest that describes them
+    """
+    periods = {period: code for code, period in enumerate(PERIODS)}
+
+    # The row of every habit by its id, to store with its check ins
+    rows = {}
+    offset = 0
+
+    with ExitStack() as stack:
+        def open_column(file: str, descr: str) -> _ColumnFile:
+            column = _ColumnFile(os.path.join(directory, file), ENDIAN + descr)
+            stack.callback(column.close)
+            return column
+
+        habit_files = {name: open_column(f"habits.{name}.npy", descr)
+                       for name, (_, descr) in HABIT_COLUMNS.items()}
+        checkin_files = {name: open_column(f"checkins.{name}.npy", descr)
+                         for name, (_, descr) in CHECKIN_COLUMNS.items()}
+        offset_file = open_column("habits.name.offsets.npy", "i8")
+        names = stack.enter_context(open(os.path.join(directory, "habits.name.utf8"), "wb"))
+        stack.enter_context(db.reading())
+
+        habits = db.get_export_habits()
+        while True:
+            chunk = habits.fetchmany(CHUNK_SIZE)
+            if not chunk:
+                break
+
+            columns = {name: array(typecode) for name, (typecode, _) in HABIT_COLUMNS.items()}
+            offsets = array("q")
+            for habit_id, name, period, started_on, last_checked_on, streak_longest, streak_current in chunk:
+                rows[habit_id] = len(rows)
+                encoded = name.encode()
+                offsets.append(offset)
+                offset += len(encoded)
+                names.write(encoded)
+
+                columns["id"].append(habit_id)
+                columns["period"].append(periods.setdefault(period, len(periods)))
+                columns["started_on"].append(_to_day(started_on))
+                columns["last_checked_on"].append(_to_day(last_checked_on))
+                columns["streak_longest"].append(streak_longest)
+                columns["streak_current"].append(streak_current)
+
+            for name, values in columns.items():
+                habit_files[name].write(values)
+            offset_file.write(offsets)
+        offset_file.write(array("q", [offset]))
+
+        checkins = db.get_checkin_days()
+        while True:
+            chunk = checkins.fetchmany(CHUNK_SIZE)
+            if not chunk:
+                break
+            checkin_files["habit"].write(array("i", [rows[habit_id] for habit_id, _ in chunk]))
+            checkin_files["checked_on"].write(array("i", [_to_day(day) for _, day in chunk]))
+
+    return {
+        "format": FORMAT,
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "missing": MISSING,
+        "tables": {
+            "habits": {
+                "rows": len(rows),
+                "columns": {name: f"habits.{name}.npy" for name in HABIT_COLUMNS},
+                "strings": {"name": {"offsets": "habits.name.offsets.npy", "data": "habits.name.utf8"}}
+            },
+            "checkins": {
+                "rows": checkin_files["habit"].rows,
+                "columns": {name: f"checkins.{name}.npy" for name in CHECKIN_COLUMNS}
+            }
+        },
+        "dictionaries": {
+            "period": list(periods)
+        }
+    }
+
+
+class ColumnarExport:
+    """
+    A columnar export with every column mapped into memory, so nothing is
+    read from disk until it is used
+
+    ...
+
+    Methods
+    ---
+    name
+        Return the name of the habit in a row
+    period
+        Return the period of the habit in a row
+    checkins_of
+        Return the days a habit was marked as done on
+
+    Attributes
+    ---
+    path: str
+        The folder of the export
+    manifest: dict
+        The manifest of the export
+    habits: dict
+        The read only NumPy array of each habit column, by column name
+    checkins: dict
+        The read only NumPy array of each check in column, by column name
+    periods: list
+        The period of each period code
+    missing: int
+        The day stored when there is no date
+    """
+
+    def __init__(self, path: str):
+        # Only imported by the reader, so exporting doesn't pay for it
+        import numpy as np
+
+        self.path = path
+        with open(os.path.join(path, "manifest.json")) as file:
+            self.manifest = json.load(file)
+        if self.manifest.get("format") != FORMAT:
+            raise ValueError(
+                f"{path} is a format {self.manifest.get('format')} export, only format {FORMAT} can be read")
+
+        def load(file: str):
+            file = os.path.join(path, file)
+            # Columns with no rows can't be mapped, so they are read instead
+            return np.load(file, mmap_mode="r" if os.path.getsize(file) > HEADER_SIZE else None)
+
+        tables = self.manifest["tables"]
+        self.habits = {name: load(file) for name, file in tables["habits"]["columns"].items()}
+        self.checkins = {name: load(file) for name, file in tables["checkins"]["columns"].items()}
+        self.periods = self.manifest["dictionaries"]["period"]
+        self.missing = self.manifest["missing"]
+
+        names = tables["habits"]["strings"]["name"]
+        self._offsets = load(names["offsets"])
+        data = os.path.join(path, names["data"])
+        self._names = np.memmap(data, dtype=np.uint8, mode="r") if os.path.getsize(data) \
+            else np.zeros(0, dtype=np.uint8)
+
+    def __len__(self) -> int:
+        return len(self.habits["id"])
+
+    def name(self, row: int) -> str:
+        """
+        Return the name of the habit in a row of the habit columns
+        """
+        return self._names[self._offsets[row]:self._offsets[row + 1]].tobytes().decode()
+
+    def period(self, row: int) -> str:
+        """
+        Return the period of the habit in a row of the habit columns
+        """
+        return self.periods[self.habits["period"][row]]
+
+    def checkins_of(self, row: int):
+        """
+        Return the days the habit in a row of the habit columns was marked
+        as done on, oldest first, without copying them
+        """
+        habit = self.checkins["habit"]
+        start, end = habit.searchsorted([row, row + 1])
+        return self.checkins["checked_on"][start:end]
+
+
+def open_export(path: str) -> ColumnarExport:
+    """
+    Open a columnar export for reading
+
+    ...
+
+    Parameter
+    ---
+    path: str
+        The folder of the export
+    """
+    return ColumnarExport(path)
+
+
+def export(format: str = "columnar", output: str = "habits.columnar"):
+    """
+    Export every habit and check in for analysis scripts to read
+
+    ...
+
+    Parameters
+    ---
+    format: str, optional
+        The format of the export, only "columnar" for now
+    output: str, optional
+        The folder to write the export to
+    """
+    if format != "columnar":
+        console.print(f"\n\"{format}\" is not a valid export format, use columnar.\n")
+        return
+
+    try:
+        manifest = write_export(str(output))
+    except FileExistsError as e:
+        console.print(f"\n{e}\n")
+        return
+
+    tables = manifest["tables"]
+    console.print(
+        f"\nExported {tables['habits']['rows']} habits and {tables['checkins']['rows']} check ins to {output}\n",
+        style="green")
@@ -0,0 +1,27 @@
+"""
+The module containing the console that every other module prints with
+"""
+
+
+class LazyConsole:
+    """
+    A stand in for a rich console that only imports rich and makes the
+    console the first time something is printed, so commands that don't
+    print anything (or print before failing early) never pay for
+    importing rich. Every attribute of the rich console can be used on it.
+    """
+
+    def __init__(self):
+        self._console = None
+
+    def __getattr__(self, name: str):
+        if self._console is None:
+            # Rich console to print things with styling
+            from rich.console import Console
+
+            self._console = Console()
+        return getattr(self._console, name)
+
+
+# The default console shared by all modules
+console = LazyConsole()
@@ -0,0 +1,266 @@
+"""
+The module containing the habit server, which keeps the habits and the
+database connection in memory and answers commands sent over a unix
+socket, and the client that sends commands to it.
+
+The client side of this module only imports the standard library, and
+only once it has found the socket file, so commands start as fast as
+possible whether the server is running or not.
+
+Protocol
+---
+Each request and response is a single line of JSON. A request holds the
+command line arguments, exactly as they would be given to the CLI:
+
+    {"argv": ["show habits", "--period=day"]}
+
+and the response holds everything the command printed:
+
+    {"output": "...", "exit_code": 0}
+"""
+
+# Os module to find and remove the socket file
+import os
+
+# Sys module to print the output of commands
+import sys
+
+# The name of the socket file, made next to the database in the folder
+# the command was called from
+SOCKET_PATH = "habits.sock"
+
+# The commands the server answers
+COMMANDS = ["create habit", "delete habit", "mark done",
+            "show habits", "longest streak", "stats", "summary", "trend"]
+
+# How long the client waits for the server to answer, in seconds
+TIMEOUT = 30
+
+
+def needs_prompt(argv: list) -> bool:
+    """
+    Return True if this command would ask the user for input or read
+    stdin, which the server can't do, so it has to run in this process
+    instead
+
+    ...
+
+    Parameter
+    ---
+    argv: list
+        The command followed by its arguments
+    """
+    # Already imported by __main__, so this costs the client nothing. The
+    # arguments are parsed the same way the command will parse them
+    from modules.dispatch import parse_args
+
+    command, parsed = argv[0], parse_args(argv[1:])
+    if parsed is None:
+        # Only fire understands these arguments, so run it here
+        return True
+    values, keywords = parsed
+    flags = set(keywords)
+
+    if command == "create habit":
+        return len(flags & {"name", "period"}) + len(values) < 2
+    if command == "delete habit":
+        return "name" not in flags and not values
+    if command == "mark done":
+        from_file = keywords.get("from_file")
+        stdin = "-" in values or from_file == "-" or (isinstance(from_file, list) and "-" in from_file)
+        return ("name" not in flags and "from_file" not in flags and not values) or stdin
+    return False
+
+
+def streams(argv: list) -> bool:
+    """
+    Return True if this command writes its output as it goes instead of
+    printing tables, which the server can't do since it only sends back
+    what a command printed once it has finished
+
+    ...
+
+    Parameter
+    ---
+    argv: list
+        The command followed by its arguments
+    """
+    args = argv[1:]
+    for index, arg in enumerate(args):
+        if arg.startswith("--format="):
+            return arg.partition("=")[2] != "table"
+        if arg == "--format":
+            return index + 1 < len(args) and args[index + 1] != "table"
+    return False
+
+
+def request(argv: list, path: str = SOCKET_PATH) -> dict:
+    """
+    Send a command to the server and return its response
+
+    ...
+
+    Parameters
+    ---
+    argv: list
+        The command followed by its arguments
+    path: str, optional
+        The path to the servers socket
+    """
+    # Json module to encode requests and responses
+    import json
+
+    # Socket module to connect to the server
+    import socket
+
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+        client.settimeout(TIMEOUT)
+        client.connect(path)
+        client.sendall(json.dumps({"argv": argv}).encode() + b"\n")
+        with client.makefile("rb") as response:
+            line = response.readline()
+
+    if not line:
+        raise ConnectionError("the server closed the connection")
+    return json.loads(line)
+
+
+def forward(argv: list, path: str = SOCKET_PATH) -> bool:
+    """
+    Send a command to the server if it is running and print what it
+    printed. Returns False if the command has to be run in this process
+    instead, because the server isn't running or can't answer it. If the
+    command failed on the server, exits with its exit code
+
+    ...
+
+    Parameters
+    ---
+    argv: list
+        The command followed by its arguments
+    path: str, optional
+        The path to the servers socket
+    """
+    if not argv or argv[0] not in COMMANDS or not os.path.exists(path):
+        return False
+    if needs_prompt(argv) or streams(argv):
+        return False
+
+    try:
+        response = request(argv, path)
+    except (OSError, ValueError):
+        return False
+
+    sys.stdout.write(response["output"])
+    sys.stdout.flush()
+    if response.get("exit_code"):
+        sys.exit(response["exit_code"])
+    return True
+
+
+def serve(commands: dict, path: str = SOCKET_PATH):
+    """
+    Run the server until it is stopped with CTRL + C
+
+    ...
+
+    Parameters
+    ---
+    commands: dict
+        The CLI commands, the same dictionary that is given to dispatch
+    path: str, optional
+        The path to make the socket at
+    """
+
+    # Only the server needs these, so they aren't imported by clients
+    import io
+    import json
+    import socketserver
+    from contextlib import redirect_stderr, redirect_stdout
+
+    import modules.database as database
+    from modules.dispatch import dispatch, resolve
+    from modules.habit_repository import habits
+
+    # Import every command now instead of on its first request, then keep
+    # the connection open and every habit in memory
+    for command in COMMANDS:
+        resolve(commands[command])
+    habits.load()
+    data_version = database.db.connection.execute(
+        "PRAGMA data_version").fetchone()[0]
+
+    def run(argv: list) -> dict:
+        """
+        Run one command and return everything it printed
+        """
+        nonlocal data_version
+
+        # data_version changes whenever another process writes to the
+        # database, in which case the habits in memory may be out of date
+        version = database.db.connection.execute(
+            "PRAGMA data_version").fetchone()[0]
+        if version != data_version:
+            habits.clear()
+            data_version = version
+
+        output = io.StringIO()
+        exit_code = 0
+        stdin = sys.stdin
+
+        # There is nobody to answer prompts, so they get an empty input
+        sys.stdin = io.StringIO()
+        try:
+            with redirect_stdout(output), redirect_stderr(output):
+                dispatch(commands, argv)
+        except SystemExit as e:
+            exit_code = e.code if isinstance(e.code, int) else 1
+        except Exception as e:
+            output.write(f"\nThere was an error ({e})\n")
+            exit_code = 1
+        finally:
+            sys.stdin = stdin
+
+        return {"output": output.getvalue(), "exit_code": exit_code}
+
+    class Handler(socketserver.StreamRequestHandler):
+        """
+        Answer every request sent over one connection
+        """
+
+        def handle(self):
+            for line in self.rfile:
+                try:
+                    argv = json.loads(line)["argv"]
+                except (ValueError, KeyError, TypeError):
+                    response = {"output": "Invalid request\n", "exit_code": 1}
+                else:
+                    if argv and argv[0] in COMMANDS:
+                        response = run([str(arg) for arg in argv])
+                    else:
+                        response = {
+                            "output": f"Unknown command {argv[:1]}\n", "exit_code": 1}
+                self.wfile.write(json.dumps(response).encode() + b"\n")
+                self.wfile.flush()
+
+    # Remove the socket left behind by a server that didn't stop cleanly,
+    # but never one that is still being used
+    if os.path.exists(path):
+        try:
+            request(["show habits", "--limit=1"], path)
+        except OSError:
+            os.remove(path)
+        else:
+            print(f"A server is already running at {path}")
+            return
+
+    # Requests are answered one at a time, so only one command ever uses
+    # the database connection at once
+    with socketserver.UnixStreamServer(path, Handler) as server:
+        print(f"Serving habits from {os.path.abspath(database.db.path)} at {path}. Press CTRL + C to stop.")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            os.remove(path)
@@ -5,33 +5,844 @@ The module used to store user habits to a database
 # SQLite 3 module to work with a database
 import sqlite3
 
-# Rich console to print out strings with styles
-from rich.console import Console
+# Base64 module to make page tokens that can be given on the command line
+import base64
 
-# Instantiate a default rich console
-console = Console()
+# Os module to read the database settings from the environment
+import os
 
-# 'With' is used to close the connection after doing an action
-with sqlite3.connect('habits.db') as connection:
-    cursor = connection.cursor()
+# Contextmanager to make the transaction function usable with "with"
+from contextlib import contextmanager
 
-    # If table doesn't exist make it. if it does, move on.
-    try:
-        cursor.execute(
-            "CREATE TABLE habits (name text, period text, started_on text, last_checked_on text, streak_longest integer, streak_current integer)")
-        connection.commit()
-    except:
-        pass
+# Datetime module to convert dates to and from the seconds they are
+# stored as, and to work out which habits are late in the summary
+from datetime import date, datetime, timedelta
+
+# Groupby to run consecutive writes of the same statement together
+from itertools import groupby
+
+# Random and time modules to back off before retrying a busy write
+import random
+import time
+
+# Profiling module to time queries when --profile is given
+import modules.profiling as profiling
 
-    # This string contains all the user habits with an index number
-    # Which is used wherever the user has to select one of their habits
-    indexed_habits = ""
+# Dates are stored as whole seconds since this date, or NULL if there is
+# no date. They are counted from the date and time on the users clock, the
+# same as the text dates of older versions were written, so the day of a
+# date is simply its seconds divided by DAY
+EPOCH = datetime(1970, 1, 1)
+DAY = 86400
 
-    # This list is neccessary to restrict the user choices to 
-    # only their tracked habits wherever applicable
-    habit_ids = []
+# The habit columns in the order the Habit class expects them, used
+# instead of "SELECT *" so the id column is never returned
+HABIT_COLUMNS = "name, period, started_on, last_checked_on, streak_longest, streak_current"
 
-    def get_habits(period: str = "") -> list:
+# The queries used by the Database class. Values are always passed as
+# bound parameters, never formatted into the SQL, so names containing
+# quotes are stored as they are and sqlite can reuse each compiled
+# statement from its cache instead of compiling a new one every call
+SELECT_HABITS = f"SELECT {HABIT_COLUMNS} FROM habits ORDER BY streak_longest DESC, id DESC"
+SELECT_HABITS_PERIOD = f"SELECT {HABIT_COLUMNS} FROM habits WHERE period = ? ORDER BY streak_longest DESC, id DESC"
+SELECT_HABITS_LIMIT = f"SELECT {HABIT_COLUMNS} FROM habits ORDER BY streak_longest DESC, id DESC LIMIT ?"
+SELECT_HABITS_PERIOD_LIMIT = f"SELECT {HABIT_COLUMNS} FROM habits WHERE period = ? ORDER BY streak_longest DESC, id DESC LIMIT ?"
+# One page of habits, and the page after the habit with a given longest
+# streak and id. Habits with the same longest streak are sorted by id, so
+# every habit has its own place in the order to carry on from. The page
+# after a habit is the rest of the habits with its longest streak, then
+# the habits with shorter ones. Each half is a seek on a longest streak
+# index, which ends in the id, so a page is read straight from where the
+# last one ended instead of stepping over every habit before it like
+# OFFSET would, even when thousands of habits share a longest streak
+PAGE_AFTER = """
+SELECT * FROM (
+    SELECT {columns}, id FROM habits WHERE {where}streak_longest = :longest AND id < :id
+    ORDER BY id DESC LIMIT :limit
+)
+UNION ALL
+SELECT * FROM (
+    SELECT {columns}, id FROM habits WHERE {where}streak_longest < :longest
+    ORDER BY streak_longest DESC, id DESC LIMIT :limit
+)
+ORDER BY streak_longest DESC, id DESC LIMIT :limit
+"""
+SELECT_HABITS_PAGE = f"SELECT {HABIT_COLUMNS}, id FROM habits ORDER BY streak_longest DESC, id DESC LIMIT :limit"
+SELECT_HABITS_PAGE_AFTER = PAGE_AFTER.format(columns=HABIT_COLUMNS, where="")
+SELECT_HABITS_PERIOD_PAGE = f"SELECT {HABIT_COLUMNS}, id FROM habits WHERE period = :period ORDER BY streak_longest DESC, id DESC LIMIT :limit"
+SELECT_HABITS_PERIOD_PAGE_AFTER = PAGE_AFTER.format(columns=HABIT_COLUMNS, where="period = :period AND ")
+SELECT_LONGEST_LIMIT = "SELECT name, streak_longest FROM habits ORDER BY streak_longest DESC, id DESC LIMIT ?"
+SELECT_TOP_LONGEST = "SELECT name, period, streak_longest FROM habits ORDER BY streak_longest DESC, id DESC LIMIT ?"
+SELECT_TOP_LONGEST_PERIOD = "SELECT name, period, streak_longest FROM habits WHERE period = ? ORDER BY streak_longest DESC, id DESC LIMIT ?"
+COUNT_LONGEST = "SELECT COUNT(*) FROM habits WHERE streak_longest = ?"
+COUNT_LONGEST_PERIOD = "SELECT COUNT(*) FROM habits WHERE period = ? AND streak_longest = ?"
+SELECT_HABIT = f"SELECT {HABIT_COLUMNS} FROM habits WHERE name = ?"
+INSERT_HABIT = f"INSERT INTO habits ({HABIT_COLUMNS}) VALUES (?, ?, ?, ?, ?, ?)"
+UPDATE_HABIT = "UPDATE habits SET last_checked_on = ?, streak_current = ?, streak_longest = ? WHERE name = ?"
+DELETE_HABIT = "DELETE FROM habits WHERE name = ?"
+INSERT_CHECKIN = "INSERT INTO checkins (habit_id, checked_on) SELECT id, ? FROM habits WHERE name = ?"
+# Marking a habit as done is done by the database, so two processes
+# marking the same habit at once can't both read the same streak and
+# write back the same increase. A habit is late if it was last checked
+# more days before today than LATE_AFTER_DAYS of its period, the same as
+# Habit.set_status works out. Exactly one of the two updates changes the
+# habit: after the first one it was checked today, so it isn't late
+IS_LATE_ON = """IFNULL(:now / 86400 - {day} > CASE period
+    WHEN 'day' THEN :day WHEN 'week' THEN :week ELSE :month END, 0)"""
+IS_LATE = IS_LATE_ON.format(day="last_checked_on / 86400")
+CHECK_HABIT = f"""
+UPDATE habits SET streak_current = streak_current + 1, streak_longest = MAX(streak_longest, streak_current + 1),
+    last_checked_on = :now
+WHERE name = :name AND NOT {IS_LATE}
+"""
+RESTART_HABIT = f"UPDATE habits SET streak_current = 1, last_checked_on = :now WHERE name = :name AND {IS_LATE}"
+RETURNING_STREAKS = " RETURNING streak_current, streak_longest"
+SELECT_CHECKINS = "SELECT checked_on FROM checkins WHERE habit_id = (SELECT id FROM habits WHERE name = ?) ORDER BY checked_on"
+
+# The queries used to load dates as the number of days since 1970-01-01
+# for the statistics engine. Check ins are read in index order, which is
+# already sorted by habit and then by date.
+SELECT_HABIT_DAYS = "SELECT id, name, period, started_on / 86400 FROM habits ORDER BY id"
+SELECT_HABIT_DAYS_PERIOD = "SELECT id, name, period, started_on / 86400 FROM habits WHERE period = ? ORDER BY id"
+SELECT_CHECKIN_DAYS = "SELECT habit_id, checked_on / 86400 FROM checkins ORDER BY habit_id, checked_on"
+SELECT_EXPORT_HABITS = """
+SELECT id, name, period, started_on / 86400, last_checked_on / 86400, streak_longest, streak_current
+FROM habits ORDER BY id
+"""
+SELECT_CHECKIN_DAYS_PERIOD = "SELECT habit_id, checked_on / 86400 FROM checkins WHERE habit_id IN (SELECT id FROM habits WHERE period = ?) ORDER BY habit_id, checked_on"
+
+# The change counter of the habits table and the token of the database,
+# the habits changed since a value of the counter and the habits deleted
+# since a value of the counter
+SELECT_CHANGES_VERSION = "SELECT version, token FROM habits_version"
+SELECT_CHANGED_HABITS = f"SELECT id, {HABIT_COLUMNS} FROM habits WHERE row_version > ?"
+SELECT_DELETED_HABITS = "SELECT id FROM habits_deleted WHERE row_version > ?"
+
+# The summary of each period: its totals, how many of its habits have
+# ever been checked and how many were last checked before the day they
+# would be late on, which is today minus LATE_AFTER_DAYS of the period
+SELECT_SUMMARY = """
+SELECT
+    summary.period,
+    summary.habits,
+    summary.streak_current_total,
+    summary.streak_longest_total,
+    IFNULL((SELECT SUM(days.habits) FROM habit_summary_days AS days
+            WHERE days.period = summary.period), 0),
+    IFNULL((SELECT SUM(days.habits) FROM habit_summary_days AS days
+            WHERE days.period = summary.period AND days.day < :today - CASE summary.period
+                WHEN 'day' THEN :day WHEN 'week' THEN :week ELSE :month END), 0)
+FROM habit_summary AS summary
+"""
+
+# The number of check ins in each bucket of time from a given day on, of
+# all habits together or of one habit
+SELECT_TREND = "SELECT start, completions FROM checkin_rollup_totals WHERE bucket = ? AND start >= ? ORDER BY start"
+SELECT_HABIT_TREND = """
+SELECT start, completions FROM checkin_rollups
+WHERE habit_id = (SELECT id FROM habits WHERE name = ?) AND bucket = ? AND start >= ?
+ORDER BY start
+"""
+
+# Add the check ins with ids in a range to the rollups
+BACKFILL_ROLLUPS = """
+INSERT INTO checkin_rollups
+SELECT habit_id, bucket, start, COUNT(*) FROM checkin_buckets WHERE id > ? AND id <= ? AND start IS NOT NULL
+GROUP BY habit_id, bucket, start
+ON CONFLICT (habit_id, bucket, start) DO UPDATE SET completions = completions + excluded.completions
+"""
+BACKFILL_ROLLUP_TOTALS = """
+INSERT INTO checkin_rollup_totals
+SELECT bucket, start, COUNT(*) FROM checkin_buckets WHERE id > ? AND id <= ? AND start IS NOT NULL
+GROUP BY bucket, start
+ON CONFLICT (bucket, start) DO UPDATE SET completions = completions + excluded.completions
+"""
+
+# Bulk inserts, used to seed large databases. Habits are given their ids
+# so their check ins can refer to them. The triggers of
+# migrations 4 to 6 are dropped while the rows are inserted, and the
+# change counter and the summary are brought up to date with one query
+# over all the new rows instead of once per row
+BULK_INSERT_HABIT = """
+INSERT INTO habits (id, name, period, started_on, last_checked_on, streak_longest, streak_current, row_version)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+"""
+BULK_INSERT_CHECKIN = "INSERT INTO checkins (habit_id, checked_on) VALUES (?, ?)"
+SELECT_TRIGGERS = "SELECT name, sql FROM sqlite_master WHERE type = 'trigger' ORDER BY rowid"
+SELECT_HABIT_INDEXES = "SELECT name, sql FROM sqlite_master WHERE type = 'index' AND tbl_name = 'habits' AND sql IS NOT NULL"
+BULK_HABIT_SUMMARY = """
+INSERT INTO habit_summary
+SELECT period, COUNT(*), SUM(streak_current), SUM(streak_longest) FROM habits WHERE id > ?
+GROUP BY period
+ON CONFLICT (period) DO UPDATE SET
+    habits = habits + excluded.habits,
+    streak_current_total = streak_current_total + excluded.streak_current_total,
+    streak_longest_total = streak_longest_total + excluded.streak_longest_total
+"""
+BULK_HABIT_SUMMARY_DAYS = """
+INSERT INTO habit_summary_days
+SELECT period, last_checked_on / 86400 AS day, COUNT(*)
+FROM habits WHERE id > ? AND last_checked_on IS NOT NULL
+GROUP BY period, day
+ON CONFLICT (period, day) DO UPDATE SET habits = habits + excluded.habits
+"""
+
+# The buckets of time check ins are rolled up into
+BUCKETS = ["day", "week", "month"]
+
+# How many check ins are added to the rollups in each transaction
+BACKFILL_CHUNK_SIZE = 10000
+
+# How many days after it was last checked a habit of each period is late,
+# the same as Habit.set_status works out
+LATE_AFTER_DAYS = {"day": 1, "week": 14, "month": 61}
+
+# How long a write waits for another process to finish writing before it
+# fails, in seconds, and how many more times it tries after that with a
+# growing delay in between. The timeout can be changed with
+# HABITS_BUSY_TIMEOUT
+BUSY_TIMEOUT = 5.0
+WRITE_RETRIES = 5
+RETRY_DELAY = 0.05
+
+# The most parameters used in one query, well under sqlite's own limit
+MAX_PARAMETERS = 500
+
+# The values sqlite accepts for PRAGMA synchronous. In WAL mode, NORMAL
+# only syncs to disk when the WAL is checkpointed, FULL syncs on every
+# commit and OFF leaves it to the operating system
+SYNCHRONOUS_LEVELS = ["OFF", "NORMAL", "FULL", "EXTRA"]
+
+# The schema migrations, in order. The database stores the number of
+# migrations that have been applied to it in PRAGMA user_version, and on
+# connecting every migration after that number is run in its own
+# transaction. Never edit a migration that has been released, only
+# append new ones to the end of this list.
+MIGRATIONS = [
+    # 1: The original habits table, with no key or indexes
+    [
+        "CREATE TABLE IF NOT EXISTS habits (name text, period text, started_on text, last_checked_on text, streak_longest integer, streak_current integer)"
+    ],
+    # 2: Rebuild the habits table with an integer primary key, a unique
+    # habit name and proper column types, then index the columns that
+    # habits are filtered and sorted by. If an old database somehow has
+    # the same habit twice, the first one is kept.
+    [
+        """
+        CREATE TABLE habits_v2 (
+            id INTEGER PRIMARY KEY,
+            name TEXT NOT NULL UNIQUE,
+            period TEXT NOT NULL,
+            started_on TIMESTAMP,
+            last_checked_on TIMESTAMP,
+            streak_longest INTEGER NOT NULL DEFAULT 0,
+            streak_current INTEGER NOT NULL DEFAULT 0
+        )
+        """,
+        """
+        INSERT OR IGNORE INTO habits_v2 (name, period, started_on, last_checked_on, streak_longest, streak_current)
+        SELECT name, period, started_on, last_checked_on,
+            CAST(streak_longest AS INTEGER), CAST(streak_current AS INTEGER)
+        FROM habits
+        ORDER BY rowid
+        """,
+        "DROP TABLE habits",
+        "ALTER TABLE habits_v2 RENAME TO habits",
+        "CREATE INDEX habits_period_longest ON habits (period, streak_longest)",
+        "CREATE INDEX habits_longest ON habits (streak_longest)"
+    ],
+    # 3: An append-only log of every time a habit was marked as done.
+    # The streak columns on habits are kept up to date alongside it, so
+    # they never have to be recalculated from the whole history. Old
+    # databases only know when each habit was last checked, so that is
+    # the one check in they start with.
+    [
+        """
+        CREATE TABLE checkins (
+            id INTEGER PRIMARY KEY,
+            habit_id INTEGER NOT NULL REFERENCES habits (id) ON DELETE CASCADE,
+            checked_on TIMESTAMP NOT NULL
+        )
+        """,
+        "CREATE INDEX checkins_habit_checked ON checkins (habit_id, checked_on)",
+        """
+        INSERT INTO checkins (habit_id, checked_on)
+        SELECT id, last_checked_on
+        FROM habits
+        WHERE last_checked_on IS NOT NULL AND last_checked_on != 'None'
+        """
+    ],
+    # 4: A counter that goes up with every change to the habits table,
+    # the value it had when each habit was last changed and the value it
+    # had when each deleted habit was deleted, all kept by triggers. Other
+    # processes compare the counter with the one they last saw to find
+    # out what changed, like the snapshot cache does. The token tells one
+    # database from another, in case the file is replaced.
+    [
+        "CREATE TABLE habits_version (version INTEGER NOT NULL, token TEXT NOT NULL)",
+        "INSERT INTO habits_version VALUES (0, lower(hex(randomblob(8))))",
+        "ALTER TABLE habits ADD COLUMN row_version INTEGER NOT NULL DEFAULT 0",
+        "CREATE INDEX habits_row_version ON habits (row_version)",
+        "CREATE TABLE habits_deleted (id INTEGER PRIMARY KEY, row_version INTEGER NOT NULL)",
+        """
+        CREATE TRIGGER habits_inserted AFTER INSERT ON habits BEGIN
+            UPDATE habits_version SET version = version + 1;
+            UPDATE habits SET row_version = (SELECT version FROM habits_version) WHERE id = NEW.id;
+        END
+        """,
+        """
+        CREATE TRIGGER habits_updated AFTER UPDATE OF name, period, started_on, last_checked_on, streak_longest, streak_current ON habits BEGIN
+            UPDATE habits_version SET version = version + 1;
+            UPDATE habits SET row_version = (SELECT version FROM habits_version) WHERE id = NEW.id;
+        END
+        """,
+        """
+        CREATE TRIGGER habits_removed AFTER DELETE ON habits BEGIN
+            UPDATE habits_version SET version = version + 1;
+            INSERT OR REPLACE INTO habits_deleted VALUES (OLD.id, (SELECT version FROM habits_version));
+        END
+        """
+    ],
+    # 5: Totals for each period, and how many habits of each period were
+    # last checked on each day, kept by triggers so a summary of every
+    # habit is read from a few rows instead of the whole habits table.
+    # Whether a habit is late depends on today's date, so it is worked
+    # out from the days when the summary is read.
+    [
+        """
+        CREATE TABLE habit_summary (
+            period TEXT PRIMARY KEY,
+            habits INTEGER NOT NULL DEFAULT 0,
+            streak_current_total INTEGER NOT NULL DEFAULT 0,
+            streak_longest_total INTEGER NOT NULL DEFAULT 0
+        ) WITHOUT ROWID
+        """,
+        """
+        CREATE TABLE habit_summary_days (
+            period TEXT NOT NULL,
+            day INTEGER NOT NULL,
+            habits INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (period, day)
+        ) WITHOUT ROWID
+        """,
+        """
+        INSERT INTO habit_summary
+        SELECT period, COUNT(*), SUM(streak_current), SUM(streak_longest)
+        FROM habits
+        GROUP BY period
+        """,
+        """
+        INSERT INTO habit_summary_days
+        SELECT period, CAST(julianday(last_checked_on) - 2440587.5 AS INTEGER) AS day, COUNT(*)
+        FROM habits
+        WHERE julianday(last_checked_on) IS NOT NULL
+        GROUP BY period, day
+        """,
+        """
+        CREATE TRIGGER habit_summary_inserted AFTER INSERT ON habits BEGIN
+            INSERT OR IGNORE INTO habit_summary (period) VALUES (NEW.period);
+            UPDATE habit_summary SET
+                habits = habits + 1,
+                streak_current_total = streak_current_total + NEW.streak_current,
+                streak_longest_total = streak_longest_total + NEW.streak_longest
+            WHERE period = NEW.period;
+            INSERT OR IGNORE INTO habit_summary_days (period, day)
+            SELECT NEW.period, CAST(julianday(NEW.last_checked_on) - 2440587.5 AS INTEGER)
+            WHERE julianday(NEW.last_checked_on) IS NOT NULL;
+            UPDATE habit_summary_days SET habits = habits + 1
+            WHERE period = NEW.period AND day = CAST(julianday(NEW.last_checked_on) - 2440587.5 AS INTEGER);
+        END
+        """,
+        """
+        CREATE TRIGGER habit_summary_updated AFTER UPDATE OF period, last_checked_on, streak_current, streak_longest ON habits BEGIN
+            UPDATE habit_summary SET
+                habits = habits - 1,
+                streak_current_total = streak_current_total - OLD.streak_current,
+                streak_longest_total = streak_longest_total - OLD.streak_longest
+            WHERE period = OLD.period;
+            UPDATE habit_summary_days SET habits = habits - 1
+            WHERE period = OLD.period AND day = CAST(julianday(OLD.last_checked_on) - 2440587.5 AS INTEGER);
+            INSERT OR IGNORE INTO habit_summary (period) VALUES (NEW.period);
+            UPDATE habit_summary SET
+                habits = habits + 1,
+                streak_current_total = streak_current_total + NEW.streak_current,
+                streak_longest_total = streak_longest_total + NEW.streak_longest
+            WHERE period = NEW.period;
+            INSERT OR IGNORE INTO habit_summary_days (period, day)
+            SELECT NEW.period, CAST(julianday(NEW.last_checked_on) - 2440587.5 AS INTEGER)
+            WHERE julianday(NEW.last_checked_on) IS NOT NULL;
+            UPDATE habit_summary_days SET habits = habits + 1
+            WHERE period = NEW.period AND day = CAST(julianday(NEW.last_checked_on) - 2440587.5 AS INTEGER);
+            DELETE FROM habit_summary WHERE period = OLD.period AND habits = 0;
+            DELETE FROM habit_summary_days
+            WHERE period = OLD.period AND day = CAST(julianday(OLD.last_checked_on) - 2440587.5 AS INTEGER) AND habits = 0;
+        END
+        """,
+        """
+        CREATE TRIGGER habit_summary_removed AFTER DELETE ON habits BEGIN
+            UPDATE habit_summary SET
+                habits = habits - 1,
+                streak_current_total = streak_current_total - OLD.streak_current,
+                streak_longest_total = streak_longest_total - OLD.streak_longest
+            WHERE period = OLD.period;
+            UPDATE habit_summary_days SET habits = habits - 1
+            WHERE period = OLD.period AND day = CAST(julianday(OLD.last_checked_on) - 2440587.5 AS INTEGER);
+            DELETE FROM habit_summary WHERE period = OLD.period AND habits = 0;
+            DELETE FROM habit_summary_days
+            WHERE period = OLD.period AND day = CAST(julianday(OLD.last_checked_on) - 2440587.5 AS INTEGER) AND habits = 0;
+        END
+        """    ],
+    # 6: How many times each habit, and all habits together, were marked
+    # as done in each day, ISO week (starting on Monday) and month, kept by
+    # triggers on the checkins table. Each bucket is stored as the day it
+    # starts on, as the number of days since 1970-01-01. The check ins
+    # that were made before this migration are added by
+    # Database.backfill_rollups in chunks, which rollup_backfill keeps
+    # track of, instead of all at once here. Check ins without a date that
+    # can be read are left out.
+    [
+        """
+        CREATE TABLE checkin_rollups (
+            habit_id INTEGER NOT NULL,
+            bucket TEXT NOT NULL,
+            start INTEGER NOT NULL,
+            completions INTEGER NOT NULL,
+            PRIMARY KEY (habit_id, bucket, start)
+        ) WITHOUT ROWID
+        """,
+        """
+        CREATE TABLE checkin_rollup_totals (
+            bucket TEXT NOT NULL,
+            start INTEGER NOT NULL,
+            completions INTEGER NOT NULL,
+            PRIMARY KEY (bucket, start)
+        ) WITHOUT ROWID
+        """,
+        """
+        CREATE VIEW checkin_buckets AS
+        SELECT id, habit_id, 'day' AS bucket,
+            CAST(julianday(checked_on) - 2440587.5 AS INTEGER) AS start
+        FROM checkins
+        UNION ALL
+        SELECT id, habit_id, 'week',
+            CAST(julianday(checked_on, '-6 days', 'weekday 1', 'start of day') - 2440587.5 AS INTEGER)
+        FROM checkins
+        UNION ALL
+        SELECT id, habit_id, 'month',
+            CAST(julianday(checked_on, 'start of month') - 2440587.5 AS INTEGER)
+        FROM checkins
+        """,
+        # Check ins up to backfill_until were made before the rollups
+        # existed, and those up to backfilled_to have been added since
+        "CREATE TABLE rollup_backfill (backfill_until INTEGER NOT NULL, backfilled_to INTEGER NOT NULL)",
+        "INSERT INTO rollup_backfill SELECT IFNULL(MAX(id), 0), 0 FROM checkins",
+        """
+        CREATE TRIGGER checkin_rollups_inserted AFTER INSERT ON checkins BEGIN
+            INSERT INTO checkin_rollups
+            SELECT habit_id, bucket, start, 1 FROM checkin_buckets WHERE id = NEW.id AND start IS NOT NULL
+            ON CONFLICT (habit_id, bucket, start) DO UPDATE SET completions = completions + 1;
+            INSERT INTO checkin_rollup_totals
+            SELECT bucket, start, 1 FROM checkin_buckets WHERE id = NEW.id AND start IS NOT NULL
+            ON CONFLICT (bucket, start) DO UPDATE SET completions = completions + 1;
+        END
+        """,
+        """
+        CREATE TRIGGER checkin_rollups_removed BEFORE DELETE ON checkins
+        WHEN OLD.id > (SELECT backfill_until FROM rollup_backfill)
+            OR OLD.id <= (SELECT backfilled_to FROM rollup_backfill)
+        BEGIN
+            UPDATE checkin_rollups SET completions = completions - 1
+            WHERE (habit_id, bucket, start) IN (SELECT habit_id, bucket, start FROM checkin_buckets WHERE id = OLD.id);
+            DELETE FROM checkin_rollups
+            WHERE (habit_id, bucket, start) IN (SELECT habit_id, bucket, start FROM checkin_buckets WHERE id = OLD.id)
+                AND completions = 0;
+            UPDATE checkin_rollup_totals SET completions = completions - 1
+            WHERE (bucket, start) IN (SELECT bucket, start FROM checkin_buckets WHERE id = OLD.id);
+            DELETE FROM checkin_rollup_totals
+            WHERE (bucket, start) IN (SELECT bucket, start FROM checkin_buckets WHERE id = OLD.id)
+                AND completions = 0;
+        END
+        """
+    ],
+    # 7: Store dates as whole seconds since 1970-01-01 instead of text,
+    # and no date as NULL instead of 'None', so habits are read without
+    # parsing any dates and sqlite compares and groups them as integers.
+    # The rows are converted in place. The triggers that work out days
+    # from the dates are made again for integers, and are dropped while the
+    # rows are converted since none of the days change, and the change
+    # counter goes up once for all of them instead of once per habit. Check ins
+    # without a date that can be read were never counted anywhere, so they
+    # are dropped.
+    [
+        "DROP TRIGGER habits_updated",
+        "DROP TRIGGER habit_summary_inserted",
+        "DROP TRIGGER habit_summary_updated",
+        "DROP TRIGGER habit_summary_removed",
+        """
+        UPDATE habits SET
+            started_on = CAST(strftime('%s', started_on) AS INTEGER),
+            last_checked_on = CAST(strftime('%s', last_checked_on) AS INTEGER)
+        """,
+        "DELETE FROM checkins WHERE strftime('%s', checked_on) IS NULL",
+        "UPDATE checkins SET checked_on = CAST(strftime('%s', checked_on) AS INTEGER)",
+        "UPDATE habits_version SET version = version + 1",
+        "UPDATE habits SET row_version = (SELECT version FROM habits_version)",
+        """
+        CREATE TRIGGER habits_updated AFTER UPDATE OF name, period, started_on, last_checked_on, streak_longest, streak_current ON habits BEGIN
+            UPDATE habits_version SET version = version + 1;
+            UPDATE habits SET row_version = (SELECT version FROM habits_version) WHERE id = NEW.id;
+        END
+        """,
+        """
+        CREATE TRIGGER habit_summary_inserted AFTER INSERT ON habits BEGIN
+            INSERT OR IGNORE INTO habit_summary (period) VALUES (NEW.period);
+            UPDATE habit_summary SET
+                habits = habits + 1,
+                streak_current_total = streak_current_total + NEW.streak_current,
+                streak_longest_total = streak_longest_total + NEW.streak_longest
+            WHERE period = NEW.period;
+            INSERT OR IGNORE INTO habit_summary_days (period, day)
+            SELECT NEW.period, NEW.last_checked_on / 86400 WHERE NEW.last_checked_on IS NOT NULL;
+            UPDATE habit_summary_days SET habits = habits + 1
+            WHERE period = NEW.period AND day = NEW.last_checked_on / 86400;
+        END
+        """,
+        """
+        CREATE TRIGGER habit_summary_updated AFTER UPDATE OF period, last_checked_on, streak_current, streak_longest ON habits BEGIN
+            UPDATE habit_summary SET
+                habits = habits - 1,
+                streak_current_total = streak_current_total - OLD.streak_current,
+                streak_longest_total = streak_longest_total - OLD.streak_longest
+            WHERE period = OLD.period;
+            UPDATE habit_summary_days SET habits = habits - 1
+            WHERE period = OLD.period AND day = OLD.last_checked_on / 86400;
+            INSERT OR IGNORE INTO habit_summary (period) VALUES (NEW.period);
+            UPDATE habit_summary SET
+                habits = habits + 1,
+                streak_current_total = streak_current_total + NEW.streak_current,
+                streak_longest_total = streak_longest_total + NEW.streak_longest
+            WHERE period = NEW.period;
+            INSERT OR IGNORE INTO habit_summary_days (period, day)
+            SELECT NEW.period, NEW.last_checked_on / 86400 WHERE NEW.last_checked_on IS NOT NULL;
+            UPDATE habit_summary_days SET habits = habits + 1
+            WHERE period = NEW.period AND day = NEW.last_checked_on / 86400;
+            DELETE FROM habit_summary WHERE period = OLD.period AND habits = 0;
+            DELETE FROM habit_summary_days
+            WHERE period = OLD.period AND day = OLD.last_checked_on / 86400 AND habits = 0;
+        END
+        """,
+        """
+        CREATE TRIGGER habit_summary_removed AFTER DELETE ON habits BEGIN
+            UPDATE habit_summary SET
+                habits = habits - 1,
+                streak_current_total = streak_current_total - OLD.streak_current,
+                streak_longest_total = streak_longest_total - OLD.streak_longest
+            WHERE period = OLD.period;
+            UPDATE habit_summary_days SET habits = habits - 1
+            WHERE period = OLD.period AND day = OLD.last_checked_on / 86400;
+            DELETE FROM habit_summary WHERE period = OLD.period AND habits = 0;
+            DELETE FROM habit_summary_days
+            WHERE period = OLD.period AND day = OLD.last_checked_on / 86400 AND habits = 0;
+        END
+        """,
+        # 1970-01-01 was a Thursday, so the Monday a week starts on is
+        # (day + 3) % 7 days before it
+        "DROP VIEW checkin_buckets",
+        """
+        CREATE VIEW checkin_buckets AS
+        SELECT id, habit_id, 'day' AS bucket, checked_on / 86400 AS start
+        FROM checkins
+        UNION ALL
+        SELECT id, habit_id, 'week', checked_on / 86400 - (checked_on / 86400 + 3) % 7
+        FROM checkins
+        UNION ALL
+        SELECT id, habit_id, 'month', CAST(strftime('%s', checked_on, 'unixepoch', 'start of month') AS INTEGER) / 86400
+        FROM checkins
+        """
+    ]
+]
+
+# The schema version of a fully migrated database
+SCHEMA_VERSION = len(MIGRATIONS)
+
+
+class Database:
+    """
+    Connection manager for the habits database. Nothing is opened or read
+    when this class is instantiated, the connection is only made (and the
+    schema created or migrated) the first time it is actually needed
+
+    ...
+
+    Methods
+    ---
+    get_habits
+        Return all habits, optionally only those with a given periodicity
+    iter_habits
+        Return a cursor over the habits, optionally only those with a given periodicity
+    get_habits_page
+        Return one page of the habits and the token of the next one
+    iter_longest
+        Return a cursor over the name and longest streak of the habits
+    top_longest
+        Return the habits with the longest streaks, optionally for a given periodicity
+    count_longest
+        Return how many habits have a given longest streak
+    get_summary
+        Return how many habits, late habits and the average streaks of each period
+    get_trend
+        Return how many check ins there were in each day, week or month
+    rollups_pending
+        Return how many check ins haven't been added to the rollups yet
+    backfill_rollups
+        Add the check ins made before the rollups existed to them, in chunks
+    reset_rollups
+        Empty the rollups so they are made again from every check in
+    get_habit
+        Return a single habit by its name
+    get_habits_named
+        Return the habits with any of the given names
+    get_names
+        Return the names of all habits sorted by longest streak
+    count
+        Return the number of habits, optionally for a given periodicity
+    index_habits
+        Return the indexed habits string and the list of valid habit ids
+    add
+        Add a habit class to the database
+    delete
+        Delete a habit class from the database
+    update
+        Update a habit class in the database
+    add_many
+        Add many habit classes to the database in one transaction
+    delete_many
+        Delete many habit classes from the database in one transaction
+    update_many
+        Update many habit classes in the database in one transaction
+    check_in
+        Record that a habit class was marked as done
+    mark_done
+        Mark a habit class as done, working out its new streak in the database
+    bulk_insert
+        Add a large number of habits and check ins in one fast transaction
+    get_checkins
+        Return every time a habit was marked as done
+    get_habit_days
+        Return every habit with the day it was started on
+    get_checkin_days
+        Return every check in with the day it was made on
+    get_export_habits
+        Return every habit with its dates as days, for exports
+    reading
+        Read everything inside it from the same version of the database
+    changes_version
+        Return the change counter of the habits table and the database token
+    get_changed_habits
+        Return the habits changed since a value of the change counter
+    get_deleted_ids
+        Return the ids of the habits deleted since a value of the change counter
+    data_version
+        Return a value that changes whenever anything writes to the database
+    transaction
+        Group all the writes made inside it into a single commit
+    close
+        Close the connection if it has been opened
+
+    Attributes
+    ---
+    path: str
+        The path to the database file
+    synchronous: str, optional
+        How often sqlite syncs to disk, one of SYNCHRONOUS_LEVELS
+    busy_timeout: float, optional
+        How many seconds to wait for other processes to finish writing
+    """
+
+    def __init__(self, path: str = "habits.db", synchronous: str = "NORMAL", busy_timeout: float = BUSY_TIMEOUT):
+        if synchronous.upper() not in SYNCHRONOUS_LEVELS:
+            raise ValueError(
+                f"synchronous must be one of {', '.join(SYNCHRONOUS_LEVELS)}, not \"{synchronous}\"")
+
+        self.path = path
+        self.synchronous = synchronous.upper()
+        self.busy_timeout = float(busy_timeout)
+        self._connection = None
+
+        # How many times the connection has been opened, so values of
+        # data_version from an earlier connection never match a later one
+        self._opened = 0
+
+        # The writes waiting to be committed by the current transaction,
+        # or None when there is no transaction
+        self._pending = None
+
+    @property
+    def connection(self) -> sqlite3.Connection:
+        """
+        The open sqlite connection. Opens it and sets up the schema on
+        first access
+        """
+        if self._connection is None:
+            with profiling.span("database.connect"):
+                self._connection = sqlite3.connect(
+                    self.path, timeout=self.busy_timeout)
+                self._opened += 1
+
+                # Write ahead logging lets readers keep reading while a
+                # write is being committed and makes commits much cheaper
+                self._connection.execute("PRAGMA journal_mode = WAL")
+                self._connection.execute(
+                    f"PRAGMA synchronous = {self.synchronous}")
+                self._create_schema()
+
+                # Needed for a habits check ins to be deleted along with it
+                self._connection.execute("PRAGMA foreign_keys = ON")
+        return self._connection
+
+    @property
+    def cursor(self) -> sqlite3.Cursor:
+        """
+        A new cursor on the open connection
+        """
+        return self.connection.cursor()
+
+    def _create_schema(self):
+        """
+        Bring the database up to the latest schema by running every
+        migration it hasn't had yet. Only runs once per connection
+        """
+        connection = self._connection
+        version = connection.execute("PRAGMA user_version").fetchone()[0]
+
+        for number, migration in enumerate(MIGRATIONS[version:], version + 1):
+            # Each migration is applied in a single transaction along
+            # with the version bump, so a failed migration leaves the
+            # database exactly as it was. Another process may have applied
+            # it while this one waited for the lock, so it is checked again
+            self._begin_write()
+            if connection.execute("PRAGMA user_version").fetchone()[0] >= number:
+                connection.rollback()
+                continue
+            try:
+                for statement in migration:
+                    connection.execute(statement)
+                connection.execute(f"PRAGMA user_version = {number}")
+                connection.commit()
+            except Exception:
+                connection.rollback()
+                raise
+
+    @property
+    def version(self) -> int:
+        """
+        The schema version of the database
+        """
+        return self.connection.execute("PRAGMA user_version").fetchone()[0]
+
+    @contextmanager
+    def transaction(self):
+        """
+        Hold back every write made inside this block and commit them all at
+        once at the end of it, in the order they were made. If the block
+        raises an exception nothing is written. Transactions inside a
+        transaction join the outer one.
+
+        While a transaction is open, write methods return their success
+        value straight away and reads don't see the held back writes. If
+        the commit at the end fails, its exception is raised from the
+        "with" statement and none of the writes are kept.
+
+        Usage
+        ---
+        with database.transaction():
+            for habit in habits:
+                habit.mark_as_done()
+        """
+        if self._pending is not None:
+            yield self
+            return
+
+        self._pending = []
+        try:
+            yield self
+            pending = self._pending
+            self._pending = None
+            self._execute(pending)
+        finally:
+            self._pending = None
+
+    def _write(self, statements):
+        """
+        Run these writes in their own transaction, or hold them back if a
+        transaction is open
+
+        ...
+
+        Parameter
+        ---
+        statements: iterable
+            (sql, parameters) tuples to run in order
+        """
+        if self._pending is not None:
+            self._pending.extend(statements)
+        else:
+            self._execute(statements)
+
+    def _begin_write(self):
+        """
+        Begin a transaction that holds the write lock from the start, so
+        nothing can change what it reads before it writes. sqlite waits up
+        to the busy timeout for another process to finish writing, and if
+        it still can't get the lock it is tried again a few more times
+        with a growing delay before giving up
+        """
+        connection = self._connection
+        for attempt in range(WRITE_RETRIES + 1):
+            try:
+                connection.execute("BEGIN IMMEDIATE")
+                return
+            except sqlite3.OperationalError as e:
+                if attempt == WRITE_RETRIES or not ("locked" in str(e) or "busy" in str(e)):
+                    raise
+                time.sleep(RETRY_DELAY * 2 ** attempt * (1 + random.random()))
+
+    @contextmanager
+    def _write_transaction(self):
+        """
+        Commit everything written inside this block at the end of it, or
+        nothing if it raises an exception
+        """
+        connection = self.connection
+        self._begin_write()
+        try:
+            yield connection
+            connection.commit()
+        except BaseException:
+            connection.rollback()
+            raise
+
+    @profiling.timed("database.write")
+    def _execute(self, statements):
+        """
+        Run writes in order in a single transaction, using one executemany
+        for each run of writes that use the same statement
+        """
+        with self._write_transaction() as connection:
+            for sql, group in groupby(statements, key=lambda statement: statement[0]):
+                connection.executemany(
+                    sql, (parameters for _, parameters in group))
+
+    def close(self):
+        """
+        Close the connection if it has been opened
+        """
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+
+    @profiling.timed("database.get_habits")
+    def get_habits(self, period: str = "") -> list:
         """
         Returns a list of user habits matching the arguments passed that are
         currently in the database sorted by descending order of longest streak.
@@ -45,25 +856,339 @@ with sqlite3.connect('habits.db') as connection:
             Return only a list of habits that have this periodicity
         """
         if period:
-            cursor.execute(f"""
-            SELECT * 
-            FROM habits
-            WHERE period="{period}"
-            ORDER BY streak_longest DESC
-            """)
+            cursor = self.connection.execute(SELECT_HABITS_PERIOD, (period,))
         else:
-            cursor.execute("SELECT * FROM habits ORDER BY streak_longest DESC")
+            cursor = self.connection.execute(SELECT_HABITS)
 
         return cursor.fetchall()
 
-    for index, habit in enumerate(get_habits()):
-        # Populate the list and string with the current user habits
-        # easily
-        # using a loop and the enumerate function
-        indexed_habits += f"[{index}] {habit[0]}\n"
-        habit_ids.append(str(index))
+    @profiling.timed("database.iter_habits")
+    def iter_habits(self, period: str = "", limit: int = 0) -> sqlite3.Cursor:
+        """
+        Returns a cursor over the same habits as get_habits(), which reads
+        them from the database one at a time as it is iterated over
+        instead of loading them all at once
+
+        ...
+
+        Parameters
+        ---
+        period: str, optional
+            Return only the habits that have this periodicity
+        limit: int, optional
+            Return at most this many habits, all of them if it is 0
+        """
+        limit = int(limit) or -1
+        if period:
+            return self.connection.execute(SELECT_HABITS_PERIOD_LIMIT, (period, limit))
+        return self.connection.execute(SELECT_HABITS_LIMIT, (limit,))
+
+    @profiling.timed("database.get_habits_page")
+    def get_habits_page(self, period: str = "", limit: int = 100, after: str = "") -> tuple:
+        """
+        Returns one page of the same habits as get_habits(), along with the
+        token of the next page, or "" if this is the last page. Each page
+        carries on from where the token says the last one ended, so every
+        page is as quick to read as the first, and habits added or removed
+        in the meantime never shift a page
+
+        ...
+
+        Parameters
+        ---
+        period: str, optional
+            Return only the habits that have this periodicity
+        limit: int, optional
+            How many habits to return
+        after: str, optional
+            The token of the page to return, or "" for the first page
+
+        Raises
+        ---
+        ValueError if the token is not one this method returned
+        """
+        limit = max(int(limit), 1)
+
+        # One more habit than asked for is read to find out if there is
+        # another page, so the last page never ends with an empty one
+        parameters = {"period": period, "limit": limit + 1}
+        if after:
+            parameters["longest"], parameters["id"] = decode_page_token(after)
+            sql = SELECT_HABITS_PERIOD_PAGE_AFTER if period else SELECT_HABITS_PAGE_AFTER
+        else:
+            sql = SELECT_HABITS_PERIOD_PAGE if period else SELECT_HABITS_PAGE
+
+        rows = self.connection.execute(sql, parameters).fetchall()
+        token = ""
+        if len(rows) > limit:
+            rows = rows[:limit]
+            token = encode_page_token(rows[-1][4], rows[-1][6])
+        return [row[:6] for row in rows], token
+
+    @profiling.timed("database.iter_longest")
+    def iter_longest(self, limit: int = 0) -> sqlite3.Cursor:
+        """
+        Returns a cursor over the name and longest streak of every habit,
+        sorted by descending order of longest streak
+
+        ...
+
+        Parameter
+        ---
+        limit: int, optional
+            Return at most this many habits, all of them if it is 0
+        """
+        return self.connection.execute(SELECT_LONGEST_LIMIT, (int(limit) or -1,))
+
+    @profiling.timed("database.top_longest")
+    def top_longest(self, top: int, period: str = "") -> list:
+        """
+        Returns the name, period and longest streak of the top habits by
+        longest streak. Only those habits are read, in order, from the index
+        on the longest streak, so nothing is sorted
 
-    def add(habit_cls: object):
+        ...
+
+        Parameters
+        ---
+        top: int
+            How many habits to return
+        period: str, optional
+            Return only habits that have this periodicity
+        """
+        if period:
+            return self.connection.execute(SELECT_TOP_LONGEST_PERIOD, (period, int(top))).fetchall()
+        return self.connection.execute(SELECT_TOP_LONGEST, (int(top),)).fetchall()
+
+    @profiling.timed("database.count_longest")
+    def count_longest(self, streak_longest: int, period: str = "") -> int:
+        """
+        Returns how many habits have this longest streak, counted from the
+        index on the longest streak
+
+        ...
+
+        Parameters
+        ---
+        streak_longest: int
+            The longest streak to count the habits with
+        period: str, optional
+            Count only habits that have this periodicity
+        """
+        if period:
+            return self.connection.execute(COUNT_LONGEST_PERIOD, (period, streak_longest)).fetchone()[0]
+        return self.connection.execute(COUNT_LONGEST, (streak_longest,)).fetchone()[0]
+
+    @profiling.timed("database.get_summary")
+    def get_summary(self, today: date = None) -> list:
+        """
+        Returns a summary of the habits of each period, read from the
+        summary tables so it takes the same time however many habits there
+        are. Each summary is a dictionary of:
+
+            period: the periodicity
+            habits: how many habits have it
+            late: how many of them are late, like Habit.set_status decides
+            in_time: how many of them are not late
+            never_checked: how many of them were never marked as done
+            streak_current_average: their average current streak
+            streak_longest_average: their average longest streak
+
+        ...
+
+        Parameter
+        ---
+        today: date, optional
+            The day to work out which habits are late on, today by default
+        """
+        today = today or date.today()
+        parameters = {"today": (today - date(1970, 1, 1)).days, **LATE_AFTER_DAYS}
+
+        summaries = []
+        for period, habits, streak_current_total, streak_longest_total, checked, late in \
+                self.connection.execute(SELECT_SUMMARY, parameters):
+            summaries.append({
+                "period": period,
+                "habits": habits,
+                "late": late,
+                "in_time": habits - late,
+                "never_checked": habits - checked,
+                "streak_current_average": streak_current_total / habits,
+                "streak_longest_average": streak_longest_total / habits
+            })
+
+        # Days first, then weeks, then months, then anything else
+        order = list(LATE_AFTER_DAYS)
+        summaries.sort(key=lambda summary: order.index(
+            summary["period"]) if summary["period"] in order else len(order))
+        return summaries
+
+    @profiling.timed("database.get_trend")
+    def get_trend(self, bucket: str, since: int, name: str = "") -> list:
+        """
+        Returns the start day and number of check ins of every day, week or
+        month that has any check ins, from a given day on, read from the
+        rollups so it reads at most one row per bucket
+
+        ...
+
+        Parameters
+        ---
+        bucket: str
+            One of BUCKETS
+        since: int
+            The first day to count check ins from, as the number of days
+            since 1970-01-01
+        name: str, optional
+            Count only the check ins of the habit with this name
+        """
+        if name:
+            return self.connection.execute(SELECT_HABIT_TREND, (name, bucket, since)).fetchall()
+        return self.connection.execute(SELECT_TREND, (bucket, since)).fetchall()
+
+    def rollups_pending(self) -> int:
+        """
+        Returns how many check ins made before the rollups existed haven't
+        been added to them yet
+        """
+        return self.connection.execute("""
+            SELECT COUNT(*) FROM checkins, rollup_backfill
+            WHERE id > backfilled_to AND id <= backfill_until
+        """).fetchone()[0]
+
+    @profiling.timed("database.backfill_rollups")
+    def backfill_rollups(self, chunk_size: int = BACKFILL_CHUNK_SIZE) -> int:
+        """
+        Add every check in made before the rollups existed to them, a chunk
+        at a time with each chunk in its own transaction, so other commands
+        can keep writing in between and an interrupted backfill carries on
+        where it stopped. Returns how many check ins were added
+
+        ...
+
+        Parameter
+        ---
+        chunk_size: int, optional
+            How many check in ids to add in each transaction
+        """
+        added = 0
+        chunk_size = max(int(chunk_size), 1)
+        while True:
+            backfilled_to, backfill_until = self.connection.execute(
+                "SELECT backfilled_to, backfill_until FROM rollup_backfill").fetchone()
+            if backfilled_to >= backfill_until:
+                return added
+
+            end = min(backfilled_to + chunk_size, backfill_until)
+            with self.connection:
+                # Claim the chunk first, so if another process backfilled
+                # it in the meantime it isn't added twice
+                claimed = self.connection.execute(
+                    "UPDATE rollup_backfill SET backfilled_to = ? WHERE backfilled_to = ?",
+                    (end, backfilled_to)).rowcount
+                if claimed:
+                    self.connection.execute(
+                        BACKFILL_ROLLUPS, (backfilled_to, end))
+                    self.connection.execute(
+                        BACKFILL_ROLLUP_TOTALS, (backfilled_to, end))
+                    added += self.connection.execute(
+                        "SELECT COUNT(*) FROM checkins WHERE id > ? AND id <= ?", (backfilled_to, end)).fetchone()[0]
+
+    def reset_rollups(self):
+        """
+        Empty the rollups and mark every check in as not added to them yet,
+        so backfill_rollups makes them again from the whole history. Check
+        ins made after this are still added straight away
+        """
+        with self.connection:
+            self.connection.execute("DELETE FROM checkin_rollups")
+            self.connection.execute("DELETE FROM checkin_rollup_totals")
+            self.connection.execute(
+                "UPDATE rollup_backfill SET backfill_until = (SELECT IFNULL(MAX(id), 0) FROM checkins), backfilled_to = 0")
+
+    @profiling.timed("database.get_habit")
+    def get_habit(self, name: str):
+        """
+        Returns the habit with this name as a tuple or None if the user
+        has no habit with this name
+
+        ...
+
+        Parameter
+        ---
+        name: str
+            The name of the habit to be returned
+        """
+        return self.connection.execute(SELECT_HABIT, (name,)).fetchone()
+
+    @profiling.timed("database.get_habits_named")
+    def get_habits_named(self, names) -> list:
+        """
+        Returns the habits with any of these names as tuples, looking each
+        one up by its name. Names the user has no habit for are left out
+
+        ...
+
+        Parameter
+        ---
+        names: iterable of str
+            The names of the habits to be returned
+        """
+        names = list(names)
+        rows = []
+
+        # sqlite limits how many parameters one query can have, so the
+        # names are looked up in chunks
+        for start in range(0, len(names), MAX_PARAMETERS):
+            chunk = names[start:start + MAX_PARAMETERS]
+            rows.extend(self.connection.execute(
+                f"SELECT {HABIT_COLUMNS} FROM habits WHERE name IN ({', '.join('?' * len(chunk))})", chunk))
+        return rows
+
+    @profiling.timed("database.get_names")
+    def get_names(self) -> list:
+        """
+        Returns the names of all user habits in the same order as
+        get_habits() without reading the rest of each row
+        """
+        return [row[0] for row in self.connection.execute(
+            "SELECT name FROM habits ORDER BY streak_longest DESC, id DESC")]
+
+    @profiling.timed("database.count")
+    def count(self, period: str = "") -> int:
+        """
+        Returns the number of user habits, read from the summary table so
+        it takes the same time however many habits there are
+
+        ...
+
+        Parameter
+        ---
+        period: str, optional
+            Count only the habits that have this periodicity
+        """
+        if period:
+            return self.connection.execute(
+                "SELECT IFNULL(SUM(habits), 0) FROM habit_summary WHERE period = ?", (period,)).fetchone()[0]
+        return self.connection.execute("SELECT IFNULL(SUM(habits), 0) FROM habit_summary").fetchone()[0]
+
+    @profiling.timed("database.index_habits")
+    def index_habits(self) -> tuple:
+        """
+        Returns a string containing all the user habits with an index number
+        which is used wherever the user has to select one of their habits,
+        along with the list of those index numbers which is neccessary to
+        restrict the user choices to only their tracked habits
+        """
+        indexed_habits = ""
+        habit_ids = []
+        for index, name in enumerate(self.get_names()):
+            indexed_habits += f"[{index}] {name}\n"
+            habit_ids.append(str(index))
+
+        return indexed_habits, habit_ids
+
+    def add(self, habit_cls: object):
         """
         Add a habit class instance to the database habits table
 
@@ -74,67 +1199,610 @@ with sqlite3.connect('habits.db') as connection:
         habit_cls: Habit
             The habit class to be added to the database
         """
-        try:
-            cursor.execute(f"""
-            INSERT INTO habits
-            VALUES (
-            "{habit_cls.name}",
-            "{habit_cls.period}",
-            "{habit_cls.started_on}",
-            "{habit_cls.last_checked_on}",
-            "{habit_cls.streak_longest}",
-            "{habit_cls.streak_current}"
-            )
-            """)
-            connection.commit()
+        return self.add_many([habit_cls])
+
+    def delete(self, habit_cls: object):
+        """
+        Delete a habit class from the database habits table
+
+        ...
+
+        Parameter
+        ---
+        habit_cls: Habit
+            The habit class to be removed from the database
+        """
+        return self.delete_many([habit_cls])
+
+    def update(self, habit_cls: object):
+        """
+        Update the values of a habit class in the database habits table
+
+        ...
 
+        Parameter
+        ---
+        habit_cls: Habit
+            The habit class to be updated in the database
+        """
+        return self.update_many([habit_cls])
+
+    def add_many(self, habits):
+        """
+        Add any number of habit classes to the database habits table in a
+        single transaction. If any of them can't be added, none of them are
+
+        ...
+
+        Parameter
+        ---
+        habits: iterable of Habit
+            The habit classes to be added to the database
+        """
+        try:
+            self._write((INSERT_HABIT, _insert_values(habit_cls))
+                        for habit_cls in habits)
             return 'added'
         except Exception as e:
             return e
 
-    def delete(habit_cls: object):
+    def delete_many(self, habits):
         """
-        Delete a habit class from the database habits table
+        Delete any number of habit classes from the database habits table
+        in a single transaction
 
         ...
 
         Parameter
         ---
-        habit_cls: Habit
-            The habit class to be removed from the database
+        habits: iterable of Habit
+            The habit classes to be removed from the database
         """
         try:
-            cursor.execute(f"""
-            DELETE FROM habits
-            WHERE name="{habit_cls.name}"
-            """)
-            connection.commit()
+            self._write((DELETE_HABIT, (habit_cls.name,))
+                        for habit_cls in habits)
             return 'deleted'
         except Exception as e:
             return e
 
-    def update(habit_cls: object):
+    def update_many(self, habits):
         """
-        Update the values of a habit class in the database habits table
+        Update the values of any number of habit classes in the database
+        habits table in a single transaction
 
         ...
 
         Parameter
         ---
-        habit_cls: Habit
-            The habit class to be updated in the database
+        habits: iterable of Habit
+            The habit classes to be updated in the database
         """
         try:
-            cursor.execute(f"""
-            UPDATE habits
-            SET 
-                last_checked_on = "{habit_cls.last_checked_on}",
-                streak_current = "{habit_cls.streak_current}",
-                streak_longest = "{habit_cls.streak_longest}"
-            WHERE name = "{habit_cls.name}"
-            """)
-            connection.commit()
+            self._write((UPDATE_HABIT, _update_values(habit_cls))
+                        for habit_cls in habits)
             return 'updated'
         except Exception as e:
             return e
 
+    def check_in(self, habit_cls: object):
+        """
+        Append a check in for a habit class to the checkins table and
+        save its new last checked on date and streaks, both in the same
+        transaction so the streaks always match the check in history
+
+        ...
+
+        Parameter
+        ---
+        habit_cls: Habit
+            The habit class that was marked as done
+        """
+        # A habit that was never marked as done is checked in now
+        if habit_cls.last_checked_on is None:
+            habit_cls.last_checked_on = now_seconds()
+        try:
+            self._write([
+                (UPDATE_HABIT, _update_values(habit_cls)),
+                (INSERT_CHECKIN, (to_seconds(habit_cls.last_checked_on), habit_cls.name))
+            ])
+            return 'checked in'
+        except Exception as e:
+            return e
+
+    @profiling.timed("database.mark_done")
+    def mark_done(self, habit_cls: object):
+        """
+        Mark a habit as done in the database. Its streak is increased, or
+        restarted at 1 if it is late, by the database itself in the same
+        transaction as its check in is added, so marking the same habit
+        from many processes at once never loses a mark. The habit class
+        is given the streaks and last checked on date that were saved.
+
+        Returns "checked" or "restarted", "not found" if there is no habit
+        with its name, or the exception if it could not be saved. While a
+        transaction is open the write is held back like any other, the
+        habit class is left as it is and whether it was late is taken from
+        its status instead
+
+        ...
+
+        Parameter
+        ---
+        habit_cls: Habit
+            The habit class to mark as done
+        """
+        now = now_seconds()
+        parameters = {"name": habit_cls.name, "now": now, **LATE_AFTER_DAYS}
+        statements = [(CHECK_HABIT, parameters), (RESTART_HABIT, parameters),
+                      (INSERT_CHECKIN, (now, habit_cls.name))]
+
+        if self._pending is not None:
+            self._pending.extend(statements)
+            return "restarted" if habit_cls.status == "late" else "checked"
+
+        try:
+            with self._write_transaction() as connection:
+                response = "checked"
+                row = connection.execute(CHECK_HABIT + RETURNING_STREAKS, parameters).fetchone()
+                if row is None:
+                    response = "restarted"
+                    row = connection.execute(RESTART_HABIT + RETURNING_STREAKS, parameters).fetchone()
+                if row is None:
+                    return "not found"
+                connection.execute(*statements[2])
+        except Exception as e:
+            return e
+
+        habit_cls.streak_current, habit_cls.streak_longest = row
+        habit_cls.last_checked_on = now
+        return response
+
+    @profiling.timed("database.bulk_insert")
+    def bulk_insert(self, chunks) -> tuple:
+        """
+        Add a large number of habits and their check ins in a single
+        transaction, much faster than add_many and check_in can. The
+        triggers are dropped while the rows go in and made again before
+        the commit, so other processes never see the database without
+        them, and the change counter and summary are brought up to date
+        from the new rows at the end. Returns how many habits and check
+        ins were added.
+
+        The check ins are left for backfill_rollups to add to the rollups,
+        like those made before the rollups existed, since grouping them
+        takes longer than inserting them. That needs the check ins still
+        waiting to be backfilled to come right before them, and if they
+        don't the check ins are added to the rollups here instead
+
+        ...
+
+        Parameter
+        ---
+        chunks: iterable
+            (habits, checkins) tuples. Habits are (name, period,
+            started_on, last_checked_on, streak_longest, streak_current)
+            tuples and check ins are (habit, checked_on) tuples, where
+            habit is the position of the habit among all the habits added
+            and the dates are whole seconds since 1970-01-01, or None
+        """
+        with self._write_transaction() as connection:
+            first_habit, first_checkin, version = connection.execute(
+                "SELECT (SELECT IFNULL(MAX(id), 0) FROM habits), (SELECT IFNULL(MAX(id), 0) FROM checkins), "
+                "(SELECT version + 1 FROM habits_version)").fetchone()
+
+            triggers = connection.execute(SELECT_TRIGGERS).fetchall()
+            for name, _ in triggers:
+                connection.execute(f"DROP TRIGGER {name}")
+
+            # Into an empty habits table, making its indexes again once
+            # every habit is in is quicker than keeping them up to date
+            indexes = [] if first_habit else connection.execute(SELECT_HABIT_INDEXES).fetchall()
+            for name, _ in indexes:
+                connection.execute(f"DROP INDEX {name}")
+
+            habits = checkins = 0
+            for habit_rows, checkin_rows in chunks:
+                connection.executemany(BULK_INSERT_HABIT, (
+                    (first_habit + habits + position + 1, *row, version)
+                    for position, row in enumerate(habit_rows)))
+                connection.executemany(BULK_INSERT_CHECKIN, (
+                    (first_habit + habit + 1, checked_on) for habit, checked_on in checkin_rows))
+                habits += len(habit_rows)
+                checkins += len(checkin_rows)
+
+            if habits:
+                connection.execute("UPDATE habits_version SET version = ?", (version,))
+                connection.execute(BULK_HABIT_SUMMARY, (first_habit,))
+                connection.execute(BULK_HABIT_SUMMARY_DAYS, (first_habit,))
+            if checkins:
+                last_checkin = first_checkin + checkins
+                backfilled_to, backfill_until = connection.execute(
+                    "SELECT backfilled_to, backfill_until FROM rollup_backfill").fetchone()
+                if backfilled_to == backfill_until:
+                    connection.execute("UPDATE rollup_backfill SET backfilled_to = ?, backfill_until = ?",
+                                       (first_checkin, last_checkin))
+                elif backfill_until == first_checkin:
+                    connection.execute("UPDATE rollup_backfill SET backfill_until = ?", (last_checkin,))
+                else:
+                    connection.execute(BACKFILL_ROLLUPS, (first_checkin, last_checkin))
+                    connection.execute(BACKFILL_ROLLUP_TOTALS, (first_checkin, last_checkin))
+
+            for _, sql in indexes + triggers:
+                connection.execute(sql)
+        return habits, checkins
+
+    @profiling.timed("database.get_checkins")
+    def get_checkins(self, name: str) -> list:
+        """
+        Returns every date and time the habit with this name was marked
+        as done, oldest first
+
+        ...
+
+        Parameter
+        ---
+        name: str
+            The name of the habit
+        """
+        return [row[0] for row in self.connection.execute(SELECT_CHECKINS, (name,))]
+
+    @profiling.timed("database.get_habit_days")
+    def get_habit_days(self, period: str = "") -> list:
+        """
+        Returns the id, name, period and the day it was started on (as the
+        number of days since 1970-01-01) of every habit, sorted by id
+
+        ...
+
+        Parameter
+        ---
+        period: str, optional
+            Return only the habits that have this periodicity
+        """
+        if period:
+            return self.connection.execute(SELECT_HABIT_DAYS_PERIOD, (period,)).fetchall()
+        return self.connection.execute(SELECT_HABIT_DAYS).fetchall()
+
+    @profiling.timed("database.get_checkin_days")
+    def get_checkin_days(self, period: str = "") -> sqlite3.Cursor:
+        """
+        Returns a cursor over the habit id and the day (as the number of
+        days since 1970-01-01) of every check in, sorted by habit id and
+        then by date
+
+        ...
+
+        Parameter
+        ---
+        period: str, optional
+            Return only the check ins of habits that have this periodicity
+        """
+        if period:
+            return self.connection.execute(SELECT_CHECKIN_DAYS_PERIOD, (period,))
+        return self.connection.execute(SELECT_CHECKIN_DAYS)
+
+    @profiling.timed("database.get_export_habits")
+    def get_export_habits(self) -> sqlite3.Cursor:
+        """
+        Returns a cursor over the id, name, period, started on and last
+        checked on days (as the number of days since 1970-01-01, or None
+        if there is no date), longest streak and current streak of every
+        habit, sorted by id
+
+        Together with get_checkin_days this is everything a habit export
+        needs, with sqlite doing all of the date parsing
+        """
+        return self.connection.execute(SELECT_EXPORT_HABITS)
+
+    @contextmanager
+    def reading(self):
+        """
+        Read everything inside this block from the same version of the
+        database, even if other processes write to it in the meantime.
+        Nothing can be written from this connection inside the block
+
+        Usage
+        ---
+        with db.reading():
+            habits = db.get_habit_days()
+            checkins = db.get_checkin_days().fetchall()
+        """
+        connection = self.connection
+        if connection.in_transaction:
+            yield self
+            return
+
+        connection.execute("BEGIN")
+        try:
+            yield self
+        finally:
+            connection.rollback()
+
+    @profiling.timed("database.changes_version")
+    def changes_version(self) -> tuple:
+        """
+        Returns the change counter of the habits table, which goes up with
+        every habit that is added, changed or deleted, along with the
+        token of this database
+        """
+        return self.connection.execute(SELECT_CHANGES_VERSION).fetchone()
+
+    @profiling.timed("database.get_changed_habits")
+    def get_changed_habits(self, since: int) -> sqlite3.Cursor:
+        """
+        Returns a cursor over the id and columns of every habit added or
+        changed after the change counter had this value
+
+        ...
+
+        Parameter
+        ---
+        since: int
+            A value of the change counter, or -1 for every habit
+        """
+        return self.connection.execute(SELECT_CHANGED_HABITS, (since,))
+
+    @profiling.timed("database.get_deleted_ids")
+    def get_deleted_ids(self, since: int) -> list:
+        """
+        Returns the ids of every habit deleted after the change counter had
+        this value
+
+        ...
+
+        Parameter
+        ---
+        since: int
+            A value of the change counter
+        """
+        return [row[0] for row in self.connection.execute(SELECT_DELETED_HABITS, (since,))]
+
+    def data_version(self) -> tuple:
+        """
+        Returns a value that changes whenever the database is written to,
+        whether by this connection or any other. It only means something
+        to this connection, so it can't be compared between processes
+        """
+        connection = self.connection
+        return self._opened, connection.execute("PRAGMA data_version").fetchone()[0], connection.total_changes
+
+
+def encode_page_token(streak_longest: int, habit_id: int) -> str:
+    """
+    The token of the page that starts after the habit with this longest
+    streak and id. It is only meant to be given back to get_habits_page
+    """
+    return base64.urlsafe_b64encode(f"{int(streak_longest)}:{int(habit_id)}".encode()).decode().rstrip("=")
+
+
+def decode_page_token(token: str) -> tuple:
+    """
+    The longest streak and id of the habit a page token starts after
+
+    ...
+
+    Raises
+    ---
+    ValueError if the token is not one encode_page_token made
+    """
+    try:
+        text = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4)).decode()
+        streak_longest, habit_id = text.split(":")
+        return int(streak_longest), int(habit_id)
+    except (ValueError, UnicodeDecodeError):
+        raise ValueError(f"\"{token}\" is not a valid page token") from None
+
+
+def to_seconds(value):
+    """
+    Convert a date to the whole seconds since EPOCH it is stored as, or
+    None if there is no date. Takes seconds, a datetime or the text dates
+    older versions stored, like "2022-07-01 08:00:00" or "None"
+    """
+    if value is None or isinstance(value, int):
+        return value
+    if isinstance(value, str):
+        if value in ("", "None"):
+            return None
+        value = datetime.fromisoformat(value)
+    return (value - EPOCH) // timedelta(seconds=1)
+
+
+def to_datetime(seconds):
+    """
+    Convert whole seconds since EPOCH to a datetime to show, or None if
+    there is no date
+    """
+    return None if seconds is None else EPOCH + timedelta(seconds=seconds)
+
+
+def format_date(seconds):
+    """
+    Write whole seconds since EPOCH out as the text dates older versions
+    stored, like "2022-07-01 08:00:00", for the machine readable outputs,
+    or None if there is no date
+    """
+    return None if seconds is None else str(to_datetime(seconds))
+
+
+def now_seconds() -> int:
+    """
+    Returns the date and time now as whole seconds since EPOCH
+    """
+    return to_seconds(datetime.today())
+
+
+def _insert_values(habit_cls: object) -> tuple:
+    """
+    The parameters for INSERT_HABIT from a habit class
+    """
+    return (
+        habit_cls.name,
+        habit_cls.period,
+        to_seconds(habit_cls.started_on),
+        to_seconds(habit_cls.last_checked_on),
+        habit_cls.streak_longest,
+        habit_cls.streak_current
+    )
+
+
+def _update_values(habit_cls: object) -> tuple:
+    """
+    The parameters for UPDATE_HABIT from a habit class
+    """
+    return (
+        to_seconds(habit_cls.last_checked_on),
+        habit_cls.streak_current,
+        habit_cls.streak_longest,
+        habit_cls.name
+    )
+
+
+# The default database used by the application. It is created in the
+# folder the command was called from, but isn't opened until needed.
+# How often it syncs to disk can be changed with HABITS_SYNCHRONOUS and
+# how long it waits for other processes to write with HABITS_BUSY_TIMEOUT
+db = Database(synchronous=os.environ.get("HABITS_SYNCHRONOUS", "NORMAL"),
+              busy_timeout=float(os.environ.get("HABITS_BUSY_TIMEOUT", BUSY_TIMEOUT)))
+
+
+# Module level shortcuts to the default database so the rest of the
+# code can keep calling database.add(habit), database.get_habits(), etc.
+def get_habits(period: str = "") -> list:
+    return db.get_habits(period)
+
+
+def iter_habits(period: str = "", limit: int = 0) -> sqlite3.Cursor:
+    return db.iter_habits(period, limit)
+
+
+def get_habits_page(period: str = "", limit: int = 100, after: str = "") -> tuple:
+    return db.get_habits_page(period, limit, after)
+
+
+def iter_longest(limit: int = 0) -> sqlite3.Cursor:
+    return db.iter_longest(limit)
+
+
+def top_longest(top: int, period: str = "") -> list:
+    return db.top_longest(top, period)
+
+
+def count_longest(streak_longest: int, period: str = "") -> int:
+    return db.count_longest(streak_longest, period)
+
+
+def get_summary(today: date = None) -> list:
+    return db.get_summary(today)
+
+
+def get_trend(bucket: str, since: int, name: str = "") -> list:
+    return db.get_trend(bucket, since, name)
+
+
+def rollups_pending() -> int:
+    return db.rollups_pending()
+
+
+def backfill_rollups(chunk_size: int = BACKFILL_CHUNK_SIZE) -> int:
+    return db.backfill_rollups(chunk_size)
+
+
+def reset_rollups():
+    db.reset_rollups()
+
+
+def get_habit(name: str):
+    return db.get_habit(name)
+
+
+def get_habits_named(names) -> list:
+    return db.get_habits_named(names)
+
+
+def get_names() -> list:
+    return db.get_names()
+
+
+def count(period: str = "") -> int:
+    return db.count(period)
+
+
+def index_habits() -> tuple:
+    return db.index_habits()
+
+
+def add(habit_cls: object):
+    return db.add(habit_cls)
+
+
+def delete(habit_cls: object):
+    return db.delete(habit_cls)
+
+
+def update(habit_cls: object):
+    return db.update(habit_cls)
+
+
+def add_many(habits):
+    return db.add_many(habits)
+
+
+def delete_many(habits):
+    return db.delete_many(habits)
+
+
+def update_many(habits):
+    return db.update_many(habits)
+
+
+def transaction():
+    return db.transaction()
+
+
+def check_in(habit_cls: object):
+    return db.check_in(habit_cls)
+
+
+def mark_done(habit_cls: object):
+    return db.mark_done(habit_cls)
+
+
+def bulk_insert(chunks) -> tuple:
+    return db.bulk_insert(chunks)
+
+
+def get_checkins(name: str) -> list:
+    return db.get_checkins(name)
+
+
+def get_habit_days(period: str = "") -> list:
+    return db.get_habit_days(period)
+
+
+def get_checkin_days(period: str = "") -> sqlite3.Cursor:
+    return db.get_checkin_days(period)
+
+
+def get_export_habits() -> sqlite3.Cursor:
+    return db.get_export_habits()
+
+
+def reading():
+    return db.reading()
+
+
+def changes_version() -> tuple:
+    return db.changes_version()
+
+
+def get_changed_habits(since: int) -> sqlite3.Cursor:
+    return db.get_changed_habits(since)
+
+
+def get_deleted_ids(since: int) -> list:
+    return db.get_deleted_ids(since)
+
+
+def data_version() -> tuple:
+    return db.data_version()
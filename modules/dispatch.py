@@ -0,0 +1,135 @@
+"""
+The module containing the command dispatcher, which runs a CLI command
+while importing only the module that command lives in.
+
+Commands are given as "module:function" strings and only imported when
+they are run. The arguments are parsed the same way fire parses them for
+the simple cases (--name=VALUE, --name VALUE, --flag and positional
+values). A keyword given more than once gets a list of every value it
+was given, so "--name a --name b" is the same as "--name=[a,b]".
+Anything else, like --help or arguments that don't match the function,
+is handed to fire, which is only imported then.
+"""
+
+# Ast module to read argument values like numbers and lists
+import ast
+
+# Importlib to import the module of a command when it is run
+import importlib
+
+# Inspect to check the arguments match the function before calling it
+import inspect
+
+
+def resolve(target):
+    """
+    Return the function for a command
+
+    ...
+
+    Parameter
+    ---
+    target: str or function
+        Either the function itself or a "module:function" string
+    """
+    if callable(target):
+        return target
+    module, function = target.split(":")
+    return getattr(importlib.import_module(module), function)
+
+
+def parse_value(text: str):
+    """
+    Convert an argument to a python value the way fire does, so "3" is a
+    number, "[a,b]" is a list and anything else is a string
+    """
+    try:
+        return ast.literal_eval(text)
+    except (ValueError, SyntaxError):
+        pass
+
+    # Lists of bare words, like --name=[walk,run]
+    if text.startswith("[") and text.endswith("]"):
+        return [parse_value(value.strip()) for value in text[1:-1].split(",") if value.strip()]
+    return text
+
+
+def parse_args(args: list):
+    """
+    Split the arguments into positional values and keyword values, or
+    return None if they use something only fire understands
+
+    ...
+
+    Parameter
+    ---
+    args: list
+        The arguments after the command
+    """
+    positional, keywords = [], {}
+    index = 0
+    while index < len(args):
+        arg = args[index]
+        if arg.startswith("--"):
+            key, equals, value = arg[2:].partition("=")
+            key = key.replace("-", "_")
+            if not key.isidentifier() or key == "help":
+                return None
+            if equals:
+                value = parse_value(value)
+            elif index + 1 < len(args) and (not args[index + 1].startswith("-") or args[index + 1] == "-"):
+                # A lone "-" is a value, e.g. "--from-file -" for stdin
+                index += 1
+                value = parse_value(args[index])
+            else:
+                value = True
+
+            # Every value of a keyword given more than once is kept
+            if key in keywords:
+                earlier = keywords[key]
+                value = (earlier if isinstance(earlier, list) else [earlier]) + \
+                    (value if isinstance(value, list) else [value])
+            keywords[key] = value
+        elif arg.startswith("-") and arg != "-":
+            return None
+        else:
+            positional.append(parse_value(arg))
+        index += 1
+
+    return positional, keywords
+
+
+def dispatch(commands: dict, argv: list):
+    """
+    Run the command named by the first argument with the rest of the
+    arguments
+
+    ...
+
+    Parameters
+    ---
+    commands: dict
+        The command names and their "module:function" strings
+    argv: list
+        The command followed by its arguments
+    """
+    if not argv or argv[0] not in commands:
+        # Let fire list the commands, which needs all of them imported
+        import fire
+
+        return fire.Fire({name: resolve(target) for name, target in commands.items()}, command=argv)
+
+    function = resolve(commands[argv[0]])
+    parsed = parse_args(argv[1:])
+    if parsed is not None:
+        try:
+            inspect.signature(function).bind(*parsed[0], **parsed[1])
+        except TypeError:
+            parsed = None
+
+    if parsed is None:
+        import fire
+
+        return fire.Fire(function, command=argv[1:], name=argv[0])
+
+    return function(*parsed[0], **parsed[1])
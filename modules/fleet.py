@@ -0,0 +1,254 @@
+"""
+The module containing the fleet report, which sums up many habit
+databases at once, e.g. when every user has their own habits.db.
+
+Each database is read by a worker process of a process pool, which opens
+it read only and works out a few totals and its longest streaks. Only
+those small results are sent back to be merged, so the report scales with
+the number of cores instead of running the app once per file.
+
+Databases are read as they are, without migrating them, so they only need
+the habits table every version of the app has had, with its dates stored
+either as text or as seconds.
+"""
+
+# Heapq module to keep only the longest streaks when merging
+import heapq
+
+# Os module to count the cores and find the full path of the databases
+import os
+
+# SQLite 3 module to read the databases
+import sqlite3
+
+# Concurrent futures to read the databases in a process pool
+from concurrent.futures import ProcessPoolExecutor
+
+# Date to work out which habits are late
+from datetime import date
+
+# Glob module to find the databases
+from glob import glob
+
+# Time module to time the report
+from time import perf_counter
+
+# Quote to put the path of a database in a URI
+from urllib.parse import quote
+
+# Console to print the report with styling
+from modules.console import console
+
+# Database module for the rules of which habits are late
+import modules.database as database
+
+# Profiling module to time the report when --profile is given
+import modules.profiling as profiling
+
+# How many habits with the longest streaks are shown by default
+TOP = 10
+
+# The day a habit was last checked on, as the number of days since
+# 1970-01-01, whether the database stores its dates as seconds or still
+# as text from before migration 7
+LAST_CHECKED_DAY = """CASE typeof(last_checked_on)
+    WHEN 'integer' THEN last_checked_on / 86400
+    ELSE CAST(julianday(last_checked_on) - 2440587.5 AS INTEGER) END"""
+
+# The number of habits, late habits, never checked habits and the total
+# current and longest streaks of each period of a database, with habits
+# being late by the same rules as Habit.set_status
+SELECT_FLEET_SUMMARY = f"""
+SELECT period, COUNT(*), SUM({database.IS_LATE_ON.format(day=LAST_CHECKED_DAY)}),
+    SUM(({LAST_CHECKED_DAY}) IS NULL), SUM(streak_current), SUM(streak_longest)
+FROM habits GROUP BY period
+"""
+SELECT_FLEET_TOP = "SELECT streak_longest, name, period FROM habits ORDER BY streak_longest DESC LIMIT ?"
+
+# The totals kept for each period, in the order they are selected
+TOTALS = ["habits", "late", "never_checked", "streak_current_total", "streak_longest_total"]
+
+
+def summarize_database(path: str, top: int = TOP, today: date = None) -> dict:
+    """
+    Work out the totals of each period and the longest streaks of a single
+    database, opened read only. Run by the worker processes, so it only
+    returns plain values that are cheap to send back
+
+    ...
+
+    Parameters
+    ---
+    path: str
+        The path to the database
+    top: int, optional
+        How many of the longest streaks to return
+    today: date, optional
+        The day to work out which habits are late on, today by default
+    """
+    parameters = {"now": ((today or date.today()) - database.EPOCH.date()).days * database.DAY,
+                  **database.LATE_AFTER_DAYS}
+    try:
+        connection = sqlite3.connect(
+            f"file:{quote(os.path.abspath(path))}?mode=ro", uri=True)
+        try:
+            periods = {row[0]: list(row[1:])
+                       for row in connection.execute(SELECT_FLEET_SUMMARY, parameters)}
+            longest = [(streak_longest, path, name, period) for streak_longest, name, period
+                       in connection.execute(SELECT_FLEET_TOP, (top,))]
+        finally:
+            connection.close()
+    except sqlite3.Error as e:
+        return {"path": path, "error": str(e)}
+
+    return {"path": path, "error": None, "periods": periods, "longest": longest}
+
+
+def _summarize_chunk(paths: list, top: int, today: date) -> list:
+    """
+    Summarize a chunk of databases in a worker process
+    """
+    return [summarize_database(path, top, today) for path in paths]
+
+
+def find_databases(patterns) -> list:
+    """
+    Return every file matching any of these glob patterns once, sorted.
+    "**" matches any number of folders
+    """
+    return sorted({path for pattern in patterns for path in glob(str(pattern), recursive=True)
+                   if os.path.isfile(path)})
+
+
+@profiling.timed("fleet.report")
+def fleet_summary(paths: list, top: int = TOP, workers: int = 0, today: date = None) -> dict:
+    """
+    Summarize many databases in a process pool and merge their results
+    into the totals of each period across all of them, the longest streaks
+    across all of them and the databases that couldn't be read
+
+    ...
+
+    Parameters
+    ---
+    paths: list
+        The paths to the databases
+    top: int, optional
+        How many of the longest streaks to keep
+    workers: int, optional
+        How many processes to read with, one per core by default
+    today: date, optional
+        The day to work out which habits are late on, today by default
+    """
+    today = today or date.today()
+    workers = min(int(workers) or os.cpu_count() or 1, max(len(paths), 1))
+
+    # Databases are sent to the workers in chunks, a few per worker, so a
+    # fleet of small databases isn't slowed down by sending each one
+    # separately, but the work is still spread evenly
+    chunk_size = max(1, min(256, len(paths) // (workers * 4)))
+    chunks = [paths[start:start + chunk_size] for start in range(0, len(paths), chunk_size)]
+
+    periods, longest, failed = {}, [], []
+    began = perf_counter()
+
+    def merge(results: list):
+        nonlocal longest
+        for result in results:
+            if result["error"] is not None:
+                failed.append((result["path"], result["error"]))
+                continue
+            for period, values in result["periods"].items():
+                totals = periods.setdefault(period, [0] * len(TOTALS))
+                for index, value in enumerate(values):
+                    totals[index] += value or 0
+            longest = heapq.nlargest(top, longest + result["longest"],
+                                     key=lambda habit: habit[0])
+
+    if workers == 1:
+        # A pool would only add the cost of starting it
+        for chunk in chunks:
+            merge(_summarize_chunk(chunk, top, today))
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            for results in executor.map(_summarize_chunk, chunks, [top] * len(chunks), [today] * len(chunks)):
+                merge(results)
+
+    return {
+        "databases": len(paths) - len(failed),
+        "periods": {period: dict(zip(TOTALS, totals)) for period, totals in periods.items()},
+        "longest": longest,
+        "failed": failed,
+        "workers": workers,
+        "seconds": perf_counter() - began
+    }
+
+
+def fleet_report(*patterns, top: int = TOP, workers: int = 0):
+    """
+    View how many habits of each periodicity there are across many
+    databases, how many of them are late, their average streaks and the
+    longest streaks of all of them
+
+    ...
+
+    Parameters
+    ---
+    patterns: str
+        Glob patterns of the databases to read, e.g. "users/*/habits.db"
+    top: int, optional
+        How many of the longest streaks to show
+    workers: int, optional
+        How many processes to read with, one per core by default
+    """
+    paths = find_databases(patterns)
+    if not paths:
+        console.print(
+            f"\nNo databases match {' '.join(str(pattern) for pattern in patterns) or 'nothing'}\n")
+        return
+
+    summary = fleet_summary(paths, int(top), int(workers))
+
+    from rich.table import Table
+
+    table = Table(show_lines=True)
+    for column in ["Repeat once every", "Habits", "In time", "Late", "Never checked",
+                   "Avg current streak", "Avg longest streak"]:
+        table.add_column(column, justify="center", vertical="middle")
+
+    order = ["day", "week", "month"]
+    periods = sorted(summary["periods"].items(), key=lambda item: (
+        order.index(item[0]) if item[0] in order else len(order), str(item[0])))
+    for period, totals in periods + [("all", {total: sum(totals[total] for _, totals in periods)
+                                              for total in TOTALS})]:
+        habits = totals["habits"] or 1
+        table.add_row(
+            str(period),
+            str(totals["habits"]),
+            str(totals["habits"] - totals["late"]),
+            str(totals["late"]),
+            str(totals["never_checked"]),
+            f"{totals['streak_current_total'] / habits:.1f}",
+            f"{totals['streak_longest_total'] / habits:.1f}"
+        )
+
+    longest = Table(show_lines=True)
+    for column in ["Rank", "Database", "Name", "Repeat once every", "Longest Streak"]:
+        longest.add_column(column, justify="center", vertical="middle")
+    for rank, (streak_longest, path, name, period) in enumerate(summary["longest"], 1):
+        longest.add_row(str(rank), str(path), str(name), str(period), str(streak_longest))
+
+    with profiling.span("render.table"):
+        console.print(table)
+        if summary["longest"]:
+            console.print(longest)
+
+    for path, error in summary["failed"]:
+        console.print(f"Could not read {path} ({error})", style="red")
+
+    seconds = max(summary["seconds"], 1e-9)
+    habits = sum(totals["habits"] for totals in summary["periods"].values())
+    console.print(
+        f"\nRead {summary['databases']} databases with {habits} habits in {seconds:.2f}s using {summary['workers']} "
+        f"{'process' if summary['workers'] == 1 else 'processes'} "
+        f"({summary['databases'] / seconds:.0f} databases/s, {habits / seconds:.0f} habits/s)\n", style="green")
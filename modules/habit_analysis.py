@@ -6,17 +6,38 @@ The module containing analysis and habit viewing functions
 import modules.database as database
 
 from modules.habit_class import Habit
+import modules.habit_repository as repository
 
-# Rich table module to easily render tables
-from rich.table import Table
+# Datetime module to work out the days, weeks and months of trends
+from datetime import date, timedelta
 
-# Rich console module to display tables and other things with styling
-from rich.console import Console
+# Console to display tables and other things with styling
+from modules.console import console
 
-# Instantiate a default rich console
-console = Console()
+# Profiling module to time making habit classes and rendering tables
+import modules.profiling as profiling
 
+# How many habits are shown in each table by default
+PAGE_SIZE = 100
 
+# How many habits the longest streak leaderboard shows by default
+TOP = 10
+
+# How many days, weeks or months a trend shows by default
+TREND_LENGTHS = {"day": 30, "week": 26, "month": 12}
+
+# The bars of a sparkline, from lowest to highest
+SPARKS = "▁▂▃▄▅▆▇█"
+
+# The formats the listing commands can print in. Every format but table
+# is written straight to stdout one line per habit as it is read
+FORMATS = ["table", "jsonl", "csv", "tsv"]
+
+# The fields of each habit, in the order the database returns them
+HABIT_FIELDS = database.HABIT_COLUMNS.split(", ")
+
+
+@profiling.timed("make_class")
 def make_class(arr: list):
     """
     Convert the provided list to a habit class
@@ -47,67 +68,271 @@ def make_class(arr: list):
                  arr[4], arr[5])
 
 
-all_habits = []
+def iter_habits(period: str = "", limit: int = 0):
+    """
+    Return an iterator of the user habits in the database as habit classes,
+    sorted by descending order of longest streak. Each habit is read from
+    the database and converted to a class only when the iterator gets to
+    it, so this never holds every habit in memory at once
 
-# Convert each habit returned by the database.get_habits() function to a habit class using the map function
-all_habits.extend(map(make_class, database.get_habits()))
+    ...
 
-# Setup the table with all the fields
-# Data is added to this table when the user calls
-habits_table = Table(show_lines=True)
-habits_table.add_column("Name", justify="center", vertical="middle")
-habits_table.add_column("Repeat once every",
-                        justify="center", vertical="middle")
-habits_table.add_column("Started on", justify="center", vertical="middle")
-habits_table.add_column("Last checked on", justify="center", vertical="middle")
-habits_table.add_column("Longest streak", justify="center", vertical="middle")
-habits_table.add_column("Current streak", justify="center", vertical="middle")
+    Parameters
+    ---
+    period: str, optional
+        Return only the habits that have this periodicity
+    limit: int, optional
+        Return at most this many habits
+    """
+    # Convert each habit returned by the database cursor to a habit class using the map function
+    return map(make_class, database.iter_habits(period, limit))
 
 
-def show(arr: list, iter: int = 0):
+def make_habits_table():
+    """
+    Return a new empty rich table with all the habit fields
     """
-    Recursively loop through a list of all the user habit classes and add each habit to the table.
-    Print the table to the console after looping through all the habits.
+    # Rich table module to easily render tables, only imported once
+    # there is something to render
+    from rich.table import Table
+
+    table = Table(show_lines=True)
+    table.add_column("Name", justify="center", vertical="middle")
+    table.add_column("Repeat once every", justify="center", vertical="middle")
+    table.add_column("Started on", justify="center", vertical="middle")
+    table.add_column("Last checked on", justify="center", vertical="middle")
+    table.add_column("Longest streak", justify="center", vertical="middle")
+    table.add_column("Current streak", justify="center", vertical="middle")
+    return table
+
+
+def make_longest_table():
+    """
+    Return a new empty rich table for the longest streaks of habits
+    """
+    from rich.table import Table
+
+    table = Table(show_lines=True)
+    table.add_column("Name", justify="center", vertical="middle")
+    table.add_column("Longest Streak", justify="center", vertical="middle")
+    return table
+
+
+def print_pages(rows, make_table, page_size: int = PAGE_SIZE):
+    """
+    Add rows to a table and print it every page_size rows, then carry on
+    with a new table. Only one page of rows is kept in memory at a time,
+    however many rows there are
 
     ...
 
-    Parameter
+    Parameters
     ---
-    arr: list
-        The list containing habit classes to loop through
+    rows: iterable
+        The rows to print, each one a tuple of strings
+    make_table: function
+        Returns the new empty table to add each page of rows to
+    page_size: int, optional
+        How many rows to print in each table
     """
+    page_size = max(int(page_size), 1)
+    table = None
+    for index, row in enumerate(rows):
+        if index % page_size == 0:
+            if table is not None:
+                with profiling.span("render.table"):
+                    console.print(table)
+            table = make_table()
+        table.add_row(*row)
+
+    if table is not None:
+        with profiling.span("render.table"):
+            console.print(table)
+
+
+def write_rows(fields: list, rows, format: str):
+    """
+    Write rows to stdout in a machine readable format as they are read,
+    without keeping any of them, so output starts straight away and
+    memory stays the same however many rows there are. csv and tsv start
+    with a header line of the field names, and jsonl writes each row as an
+    object of them. None is written as null or an empty value
+
+    ...
+
+    Parameters
+    ---
+    fields: list
+        The name of each value of a row
+    rows: iterable
+        The rows to write, each one a tuple of values
+    format: str
+        One of "jsonl", "csv" or "tsv"
+    """
+    import sys
+
+    out = sys.stdout
+    try:
+        if format == "jsonl":
+            import json
+
+            dumps = json.dumps
+            for row in rows:
+                out.write(dumps(dict(zip(fields, row)), ensure_ascii=False) + "\n")
+        else:
+            import csv
+
+            writer = csv.writer(out, delimiter="\t" if format == "tsv" else ",",
+                                lineterminator="\n")
+            writer.writerow(fields)
+            writer.writerows(rows)
+        out.flush()
+    except BrokenPipeError:
+        # Whatever was reading the output (e.g. head) stopped, so the rest
+        # is thrown away instead of failing when python flushes stdout
+        import os
+
+        os.dup2(os.open(os.devnull, os.O_WRONLY), out.fileno())
+
+
+def habit_values(rows):
+    """
+    Return an iterator of habit rows from the database with their dates
+    written out as text, or None if there is no date, for writing in a
+    machine readable format
+    """
+    format_date = database.format_date
+    for name, period, started_on, last_checked_on, streak_longest, streak_current in rows:
+        yield (name, period, format_date(started_on), format_date(last_checked_on),
+               streak_longest, streak_current)
+
+
+def check_format(format: str) -> bool:
+    """
+    Return True if the listing commands can print in this format, and tell
+    the user if they can't
+    """
+    if format in FORMATS:
+        return True
+    console.print(
+        f"\n\"{format}\" is not a valid format, use {', '.join(FORMATS[:-1])} or {FORMATS[-1]}.\n")
+    return False
+
+
+def show(habits, page_size: int = PAGE_SIZE):
+    """
+    Print the habit classes in tables of page_size habits each
+
+    ...
 
-    if iter == len(arr):
-        # Print the table after going through all habits
-        console.print(habits_table)
+    Parameters
+    ---
+    habits: iterable
+        The habit classes to print
+    page_size: int, optional
+        How many habits to print in each table
+    """
+    print_pages((
+        (
+            str(habit.name),
+            str(habit.period),
+            str(habit.started),
+            str(habit.last_checked),
+            str(habit.streak_longest),
+            str(habit.streak_current)
+        ) for habit in habits), make_habits_table, page_size)
+
+
+def next_page_command(period: str, limit: int, token: str, format: str = "table") -> str:
+    """
+    The command that shows the page after this one, with the command name
+    quoted so it can be pasted straight into a shell. Periods, formats and
+    page tokens never need quoting
+    """
+    return (f'"show habits"{f" --period={period}" if period else ""}'
+            f'{f" --format={format}" if format != "table" else ""} --after={token} --limit={limit}')
+
+
+def show_page(period: str, limit: int, after: str, page_size: int = PAGE_SIZE):
+    """
+    Print the habits, or only one page of them if there is a limit,
+    followed by the command to show the next page
+
+    ...
+
+    Parameters
+    ---
+    period: str
+        Show only the habits that have this periodicity
+    limit: int
+        How many habits are on a page, or 0 to show every habit
+    after: str
+        The token of the page to show, or "" for the first one
+    page_size: int, optional
+        How many habits to print in each table
+    """
+    if not limit:
+        show(iter_habits(period), page_size)
         return
-    else:
-        habits_table.add_row(
-            str(arr[iter].name),
-            str(arr[iter].period),
-            str(arr[iter].started_on),
-            str(arr[iter].last_checked_on),
-            str(arr[iter].streak_longest),
-            str(arr[iter].streak_current)
-        )
-        iter += 1
-        show(arr, iter)
+
+    rows, token = database.get_habits_page(period, limit, after)
+    show(map(make_class, rows), page_size)
+    if token:
+        console.print(
+            f"\nTo see the next {limit} habits, type: {next_page_command(period, limit, token)}\n")
 
 
-def show_habits(period: str = ""):
+def show_habits(period: str = "", page_size: int = PAGE_SIZE, limit: int = 0, format: str = "table", after: str = ""):
     """
     View all currently tracked habits
 
     ...
 
-    Parameter
+    Parameters
     ---
     period: str, optional
-      View only habits that have this periodicity
+        View only habits that have this periodicity
+    page_size: int, optional
+        How many habits to show in each table
+    limit: int, optional
+        Show at most this many habits. The command to show the habits
+        after them is printed at the end
+    format: str, optional
+        One of FORMATS. Every format but table writes only the habits,
+        straight from the database cursor
+    after: str, optional
+        The page token printed by the last page, to show the habits after it
     """
+    if not check_format(format):
+        return
+    after = str(after)
+    limit = int(limit) or (int(page_size) if after else 0)
+    if after:
+        try:
+            database.decode_page_token(after)
+        except ValueError as e:
+            console.print(f"\n{e}\n")
+            return
+    if format != "table":
+        if period and period not in ['day', 'week', 'month']:
+            console.print(f"\n\"{period}\" is not a valid period.\n")
+            return
+        if not limit:
+            write_rows(HABIT_FIELDS, habit_values(
+                database.iter_habits(period)), format)
+            return
+
+        # The next page token goes to stderr so the output stays clean
+        rows, token = database.get_habits_page(period, limit, after)
+        write_rows(HABIT_FIELDS, habit_values(rows), format)
+        if token:
+            import sys
+
+            sys.stderr.write(f"next page: {next_page_command(period, limit, token, format)}\n")
+        return
 
     # Check if the user has any habits at all
-    if len(all_habits) == 0:
+    if database.count() == 0:
         console.print(
             "\nYou have no habits to view, get started by typing \"create habit\" to create and start tracking a new habit\n")
     else:
@@ -119,7 +344,8 @@ def show_habits(period: str = ""):
             if period in ['day', 'week', 'month']:
 
                 # If it is, check if user has any habits with this periodicity
-                if len(database.get_habits(period)) == 0:
+                count = database.count(period)
+                if count == 0:
 
                     # Display this information stating that they don't
                     # have any habits with this periodicity
@@ -128,18 +354,11 @@ def show_habits(period: str = ""):
                     return
                 else:
 
-                    # If they do, retrieve all the habits with this
-                    # periodicity from the database and add them to the
-                    # specific_habits list after converting each one to
-                    # a class
-                    specific_habits = []
-                    specific_habits.extend(
-                        map(make_class, database.get_habits(period)))
+                    # If they do, show the habits with this periodicity
+                    # as they are read from the database
                     console.print(
-                        f"\nYou have {len(specific_habits)} habits that repeat once every {period}\n")
-
-                    # Display this specific_habits list
-                    show(specific_habits)
+                        f"\nYou have {count} habits that repeat once every {period}\n")
+                    show_page(period, limit, after, page_size)
             else:
                 # If the period provided is not day/week/month
                 console.print(f"\n\"{period}\" is not a valid period.\n")
@@ -148,14 +367,14 @@ def show_habits(period: str = ""):
             # If the user did not provide a specific periodicity, print
             # all the currently tracked habits
             console.print(
-                f"\nYou currently have {len(all_habits)} tracked habits\n")
+                f"\nYou currently have {database.count()} tracked habits\n")
 
-            show(all_habits)
+            show_page(period, limit, after, page_size)
 
 
-def find_habit_longest(name: str, iter: int = 0):
+def find_habit_longest(name: str):
     """
-    Recursively loop through all habits and find the longest streak for the given habit
+    Find the longest streak for the given habit
 
     ...
 
@@ -164,56 +383,153 @@ def find_habit_longest(name: str, iter: int = 0):
         The name of the habit to be found
     """
 
-    # Found variable indicating whether a habit with this name
-    # even exists in the database or not
-    found = False
-    if iter == len(all_habits):
+    # Look up only this habit by its name instead of going through
+    # all of them
+    habit = repository.habits.get(name)
 
-        # If no habit with this name was found in all the habits at the
-        # end of the loop, display this information
-        if not found:
-            console.print(f"\nYou do not have a habit called \"{name}\"\n")
+    # If no habit with this name exists in the database, display
+    # this information
+    if habit is None:
+        console.print(f"\nYou do not have a habit called \"{name}\"\n")
         return
-    else:
 
-        # If a habit with this name is found in all the habits
-        if name == all_habits[iter].name:
+    console.print(
+        f"\nThe longest streak for your \"{name}\" habit is {habit.streak_longest}\n")
 
-            # Set the found variable to True and display this
-            # information
-            found = True
-            console.print(
-                f"\nThe longest streak for your \"{name}\" habit is {all_habits[iter].streak_longest}\n")
-            return
-        iter += 1
-        find_habit_longest(name, iter)
+
+def show_all_habits_longest(page_size: int = PAGE_SIZE, limit: int = 0):
+    """
+    Print the longest streak of every habit in tables of page_size habits
+    each, reading only the name and longest streak of each habit
+
+    ...
+
+    Parameters
+    ---
+    page_size: int, optional
+        How many habits to show in each table
+    limit: int, optional
+        Show at most this many habits
+    """
+    print_pages(((str(name), str(streak_longest)) for name, streak_longest in database.iter_longest(limit)),
+                make_longest_table, page_size)
 
 
-# Set up the table to display all the habits longest streaks
-longest_table = Table(show_lines=True)
-longest_table.add_column("Name", justify="center", vertical="middle")
-longest_table.add_column("Longest Streak", justify="center", vertical="middle")
+def rank_longest(top: int, period: str = "") -> tuple:
+    """
+    Return the top habits by longest streak along with their rank. If the
+    repository already has every habit in memory (e.g. in the habit
+    server) they are ranked from there, otherwise only the top habits are
+    read from the database
+
+    ...
 
+    Parameters
+    ---
+    top: int
+        How many habits to rank
+    period: str, optional
+        Rank only the habits that have this periodicity
 
-def show_all_habits_longest(iter: int = 0):
+    Returns
+    ---
+    A list of (rank, tied, name, period, longest streak) tuples, where
+    habits with the same longest streak share a rank and are tied, and
+    how many habits that tie with the last one were left out
     """
-    Recursively loop through all the habits and find each habits longest streak and add it to the table.
-    Print the table to the console when finished looping.
+    top = max(int(top), 1)
+    if repository.habits.loaded:
+        rows = [(habit.name, habit.period, habit.streak_longest)
+                for habit in repository.habits.top_longest(top, period)]
+        count_longest = repository.habits.count_longest
+    else:
+        rows = database.top_longest(top, period)
+        count_longest = database.count_longest
+
+    # Only the habits that tie with the last one can have been left out
+    left_out = 0
+    counts = {}
+    for _, _, streak_longest in rows:
+        counts[streak_longest] = counts.get(streak_longest, 0) + 1
+    if len(rows) == top:
+        last = rows[-1][2]
+        left_out = count_longest(last, period) - counts[last]
+
+    ranked = []
+    for index, (name, habit_period, streak_longest) in enumerate(rows):
+        if index and streak_longest == rows[index - 1][2]:
+            rank = ranked[-1][0]
+        else:
+            rank = index + 1
+        tied = counts[streak_longest] > 1 or (left_out > 0 and streak_longest == rows[-1][2])
+        ranked.append((rank, tied, name, habit_period, streak_longest))
+    return ranked, left_out
+
+
+def show_top_longest(top: int = TOP, period: str = ""):
     """
+    Print a leaderboard of the habits with the longest streaks. Habits with
+    the same longest streak share a rank, which is marked with "="
 
-    if iter == len(all_habits):
+    ...
 
-        # Print the table when finished
-        console.print(longest_table)
+    Parameters
+    ---
+    top: int, optional
+        How many habits to show
+    period: str, optional
+        Show only the habits that have this periodicity
+    """
+    if period and period not in ["day", "week", "month"]:
+        console.print(f"\n\"{period}\" is not a valid period.\n")
         return
+
+    ranked, left_out = rank_longest(top, period)
+    if not ranked:
+        console.print(
+            f"\nYou have no habits{f' that repeat once every {period}' if period else ''}\n")
+        return
+
+    from rich.table import Table
+
+    table = Table(show_lines=True)
+    table.add_column("Rank", justify="center", vertical="middle")
+    table.add_column("Name", justify="center", vertical="middle")
+    table.add_column("Repeat once every", justify="center", vertical="middle")
+    table.add_column("Longest Streak", justify="center", vertical="middle")
+    for rank, tied, name, habit_period, streak_longest in ranked:
+        table.add_row(f"{rank}=" if tied else str(rank), str(name),
+                      str(habit_period), str(streak_longest))
+
+    with profiling.span("render.table"):
+        console.print(table)
+    if left_out:
+        console.print(
+            f"\n{left_out} more habits are tied with a longest streak of {ranked[-1][4]}\n")
+
+
+def write_longest(name: str, limit: int, top: int, period: str, format: str):
+    """
+    Write the same rows show_longest shows to stdout in a machine readable
+    format instead of tables
+    """
+    if name:
+        row = database.get_habit(name)
+        if row is None:
+            console.print(f"\nYou do not have a habit called \"{name}\"\n")
+            return
+        write_rows(["name", "streak_longest"], [(row[0], row[4])], format)
+    elif top or period:
+        if period and period not in ["day", "week", "month"]:
+            console.print(f"\n\"{period}\" is not a valid period.\n")
+            return
+        ranked, _ = rank_longest(top or TOP, period)
+        write_rows(["rank", "tied", "name", "period", "streak_longest"], ranked, format)
     else:
-        longest_table.add_row(str(all_habits[iter].name), str(
-            all_habits[iter].streak_longest))
-        iter += 1
-        show_all_habits_longest(iter)
+        write_rows(["name", "streak_longest"], database.iter_longest(limit), format)
 
 
-def show_longest(name: str = ""):
+def show_longest(name: str = "", page_size: int = PAGE_SIZE, limit: int = 0, top: int = 0, period: str = "", format: str = "table"):
     """
     View the longest streak of all habits
 
@@ -223,9 +539,266 @@ def show_longest(name: str = ""):
     ---
     name: str
         The name of the habit you want to see the longest streak of
+    page_size: int, optional
+        How many habits to show in each table
+    limit: int, optional
+        Show at most this many habits
+    top: int, optional
+        Show a leaderboard of this many habits with the longest streaks
+    period: str, optional
+        Show a leaderboard of only the habits that have this periodicity
+    format: str, optional
+        One of FORMATS. Every format but table writes only the rows,
+        straight from the database cursor
     """
-    if name:
+    if not check_format(format):
+        return
+    if format != "table":
+        write_longest(name, limit, top, period, format)
+    elif name:
         find_habit_longest(name)
+    elif top or period:
+        show_top_longest(top or TOP, period)
     else:
-        show_all_habits_longest()
+        show_all_habits_longest(page_size, limit)
+
+
+def show_summary():
+    """
+    View how many habits of each period there are, how many of them are
+    late and their average streaks, without reading every habit
+    """
+    summaries = database.get_summary()
+    if not summaries:
+        console.print(
+            "\nYou have no habits yet. Get started by typing \"create habit\" to create and start tracking a new habit.\n")
+        return
+
+    from rich.table import Table
+
+    table = Table(show_lines=True)
+    for column in ["Repeat once every", "Habits", "In time", "Late", "Never checked",
+                   "Avg current streak", "Avg longest streak"]:
+        table.add_column(column, justify="center", vertical="middle")
+
+    for summary in summaries:
+        table.add_row(
+            str(summary["period"]),
+            str(summary["habits"]),
+            str(summary["in_time"]),
+            str(summary["late"]),
+            str(summary["never_checked"]),
+            f"{summary['streak_current_average']:.1f}",
+            f"{summary['streak_longest_average']:.1f}"
+        )
+
+    habits = sum(summary["habits"] for summary in summaries)
+    late = sum(summary["late"] for summary in summaries)
+    table.add_row(
+        "all",
+        str(habits),
+        str(habits - late),
+        str(late),
+        str(sum(summary["never_checked"] for summary in summaries)),
+        f"{sum(summary['streak_current_average'] * summary['habits'] for summary in summaries) / habits:.1f}",
+        f"{sum(summary['streak_longest_average'] * summary['habits'] for summary in summaries) / habits:.1f}"
+    )
+
+    with profiling.span("render.table"):
+        console.print(table)
+
+
+def trend_buckets(bucket: str, last: int, today: date = None) -> list:
+    """
+    Return the first day of each of the last few days, weeks or months up
+    to and including the current one, oldest first
+
+    ...
+
+    Parameters
+    ---
+    bucket: str
+        One of database.BUCKETS
+    last: int
+        How many days, weeks or months to return
+    today: date, optional
+        The day to count back from, today by default
+    """
+    today = today or date.today()
+    if bucket == "day":
+        return [today - timedelta(days=i) for i in range(last - 1, -1, -1)]
+    if bucket == "week":
+        monday = today - timedelta(days=today.weekday())
+        return [monday - timedelta(weeks=i) for i in range(last - 1, -1, -1)]
+
+    months = today.year * 12 + today.month - 1
+    return [date((months - i) // 12, (months - i) % 12 + 1, 1) for i in range(last - 1, -1, -1)]
+
+
+def sparkline(values: list) -> str:
+    """
+    Return a line of bars, one for each value, as high as the value is
+    compared to the highest one
+    """
+    highest = max(values, default=0)
+    if not highest:
+        return SPARKS[0] * len(values)
+    return "".join(SPARKS[round(value / highest * (len(SPARKS) - 1))] for value in values)
+
+
+def backfill_trends(chunk_size: int = database.BACKFILL_CHUNK_SIZE, rebuild: bool = False):
+    """
+    Add the check ins made before trends were kept to them, in chunks
+
+    ...
+
+    Parameters
+    ---
+    chunk_size: int, optional
+        How many check ins to add in each transaction
+    rebuild: bool, optional
+        Make the trends again from every check in
+    """
+    if rebuild:
+        database.reset_rollups()
+
+    pending = database.rollups_pending()
+    if not pending:
+        console.print("\nYour trends are up to date\n", style="green")
+        return
+
+    console.print(f"\nAdding {pending} check ins to your trends...")
+    added = database.backfill_rollups(chunk_size)
+    console.print(f"Added {added} check ins to your trends\n", style="green")
+
+
+def show_trend(name: str = "", bucket: str = "week", last: int = 0, table: bool = False):
+    """
+    View how many times habits were marked as done in each of the last few
+    days, weeks or months as a sparkline, read from the rollups instead of
+    every check in
+
+    ...
+
+    Parameters
+    ---
+    name: str, optional
+        Show only the check ins of the habit with this name
+    bucket: str, optional
+        Count check ins by "day", "week" or "month"
+    last: int, optional
+        How many days, weeks or months to show
+    table: bool, optional
+        Also show the number of check ins of each one in a table
+    """
+    if bucket not in database.BUCKETS:
+        console.print(
+            f"\n\"{bucket}\" is not a valid bucket, use day, week or month.\n")
+        return
+    if name and database.get_habit(name) is None:
+        console.print(f"\nYou do not have a habit called \"{name}\"\n")
+        return
+
+    # Viewing a trend never writes, so check ins from before trends were
+    # kept are left for backfill trends to add
+    pending = database.rollups_pending()
+    if pending:
+        console.print(
+            f"\n{pending} check ins are not in your trends yet, type \"backfill trends\" to add them", style="yellow")
+
+    starts = trend_buckets(bucket, int(last) or TREND_LENGTHS[bucket])
+    epoch = date(1970, 1, 1)
+    completions = dict(database.get_trend(
+        bucket, (starts[0] - epoch).days, name))
+    values = [completions.get((start - epoch).days, 0) for start in starts]
+
+    if bucket == "day":
+        labels = [start.isoformat() for start in starts]
+    elif bucket == "week":
+        labels = [f"{start.isocalendar()[0]}-W{start.isocalendar()[1]:02d}" for start in starts]
+    else:
+        labels = [start.strftime("%Y-%m") for start in starts]
+
+    of_habit = f" of your \"{name}\" habit" if name else ""
+    console.print(
+        f"\nCheck ins{of_habit} in each of the last {len(starts)} {bucket}s\n")
+    console.print(f"{labels[0]} {sparkline(values)} {labels[-1]}")
+    console.print(
+        f"\nTotal {sum(values)}, average {sum(values) / len(values):.1f} and best {max(values)} per {bucket}\n")
+
+    if table:
+        from rich.table import Table
+
+        trend_table = Table()
+        trend_table.add_column(bucket.capitalize(), justify="center")
+        trend_table.add_column("Check ins", justify="center")
+        trend_table.add_column("", justify="left")
+        highest = max(values) or 1
+        for label, value in zip(labels, values):
+            trend_table.add_row(label, str(value), "█" * round(value / highest * 20))
+
+        with profiling.span("render.table"):
+            console.print(trend_table)
+
+
+def show_stats(period: str = "", window: int = 4):
+    """
+    View the streaks, gaps and completion rates of all habits worked out
+    from their whole check in history
+
+    ...
+
+    Parameters
+    ---
+    period: str, optional
+        View only habits that have this periodicity
+    window: int, optional
+        How many of the most recent periods to work out adherence for
+    """
+
+    # NumPy is only needed for this command, so it's only imported here
+    # instead of slowing down every other command
+    from modules.habit_stats import load_stats
+    from rich.table import Table
+
+    if period and period not in ['day', 'week', 'month']:
+        console.print(f"\n\"{period}\" is not a valid period.\n")
+        return
+
+    with profiling.span("stats.load"):
+        stats = load_stats(period, int(window))
+    if len(stats["name"]) == 0:
+        console.print(
+            "\nYou have no habits to view, get started by typing \"create habit\" to create and start tracking a new habit\n")
+        return
+
+    # Streaks here count periods with at least one check in, unlike the
+    # counters in show habits which go up every time a habit is marked
+    table = Table(show_lines=True, caption="Streaks count the days, weeks or months in a row a habit was checked in")
+    table.add_column("Name", justify="center", vertical="middle")
+    table.add_column("Period", justify="center", vertical="middle")
+    table.add_column("Check ins", justify="center", vertical="middle")
+    table.add_column("Longest (periods)", justify="center", vertical="middle")
+    table.add_column("Current (periods)", justify="center", vertical="middle")
+    table.add_column("Done", justify="center", vertical="middle")
+    table.add_column(f"Last {window}", justify="center", vertical="middle")
+    table.add_column("Avg gap", justify="center", vertical="middle")
+    table.add_column("Max gap", justify="center", vertical="middle")
+
+    # Show the habits with the longest streaks first
+    for i in (-stats["streak_longest"]).argsort(kind="stable"):
+        mean_gap = stats["mean_gap"][i]
+        table.add_row(
+            str(stats["name"][i]),
+            str(stats["period"][i]),
+            str(stats["checkins"][i]),
+            str(stats["streak_longest"][i]),
+            str(stats["streak_current"][i]),
+            f"{stats['completion_rate'][i]:.0%}",
+            f"{stats['adherence'][i]:.0%}",
+            "-" if mean_gap != mean_gap else f"{mean_gap:.1f}",
+            str(stats["max_gap"][i]) if stats["checkins"][i] > 1 else "-"
+        )
 
+    with profiling.span("render.table"):
+        console.print(table)
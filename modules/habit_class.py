@@ -2,20 +2,22 @@
 The module containing the code for the main habit class
 """
 
-# Datetime module to work with dates easily
+# Datetime module to show dates
 from datetime import datetime
 
-# Database to store habits in
+# Database module for how long each period can go unchecked and to
+# convert dates to and from the seconds they are kept as
 import modules.database as database
 
-# Rich prompt module to have user input a string from the options
-from rich.prompt import Prompt
+# Habit repository to store habits in the database and keep them
+# indexed by name
+import modules.habit_repository as repository
 
-# Rich console to display strings with styling
-from rich.console import Console
+# Console to display strings with styling
+from modules.console import console
 
-# Instantiate a default rich console
-console = Console()
+# Profiling module to time parsing dates and setting the status
+import modules.profiling as profiling
 
 
 class Habit:
@@ -34,6 +36,10 @@ class Habit:
         Mark this habit as done for its period
     set_status
         Set the users status of this habit
+    from_record
+        Make a habit class from values whose dates are already seconds
+    record
+        Return the values of this habit with its dates as seconds
 
     Attributes
     ---
@@ -41,17 +47,20 @@ class Habit:
         The name of the habit
     period: str
         The periodicity of the habit
-    started_on: str, optional
-        The date and time this habit was started
-    last_checked_on: str, optional
-        The date and time this habit was last marked as complete
+    started_on: int, optional
+        The date and time this habit was started, as whole seconds since
+        1970-01-01. Also takes a datetime or a date as text
+    last_checked_on: int, optional
+        The date and time this habit was last marked as complete, as
+        whole seconds since 1970-01-01, or None if it never was. Also
+        takes a datetime or a date as text
     streak_longest: int, optional
         The longest streak of this habit
     streak_current: int, optional
         The current streak of this habit
     """
 
-    def __init__(self, name: str, period: str, started_on: str = "None", last_checked_on: str = "None", streak_longest: int = 0, streak_current: int = 0):
+    def __init__(self, name: str, period: str, started_on: int = None, last_checked_on: int = None, streak_longest: int = 0, streak_current: int = 0):
 
         # The 2 required parameters for instantiating a habit class
         self.name = name
@@ -60,25 +69,74 @@ class Habit:
         self.streak_longest = int(streak_longest)
         self.streak_current = int(streak_current)
 
-        if started_on and started_on != "None":
-            self.started_on = datetime.strptime(
-                started_on, "%Y-%m-%d %H:%M:%S")
-        else:
-            self.started_on = datetime.strptime(
-                datetime.today().strftime("%Y-%m-%d %H:%M:%S"), "%Y-%m-%d %H:%M:%S")
-
-        if last_checked_on and last_checked_on != "None":
-            self.last_checked_on = datetime.strptime(
-                last_checked_on, "%Y-%m-%d %H:%M:%S")
-        else:
-            self.last_checked_on = last_checked_on
+        # Dates from the database are already seconds, so only dates
+        # given some other way are converted
+        with profiling.span("habit.parse_dates"):
+            self.started_on = database.to_seconds(started_on)
+            if self.started_on is None:
+                self.started_on = database.now_seconds()
+            self.last_checked_on = database.to_seconds(last_checked_on)
 
         self.days_since_checked = ""
 
         # Everytime the class is instantiated, set its status
         self.set_status()
 
+    @classmethod
+    def from_record(cls, name: str, period: str, started_on: int, last_checked_on: int, streak_longest: int, streak_current: int):
+        """
+        Make a habit class from values that have already been decoded,
+        which skips converting the dates
+
+        ...
+
+        Parameters
+        ---
+        started_on: int
+            The date and time this habit was started, as whole seconds
+            since 1970-01-01
+        last_checked_on: int
+            The date and time this habit was last marked as complete, as
+            whole seconds since 1970-01-01, or None if it never was
+
+        The rest are the same as when instantiating the class
+        """
+        habit = cls.__new__(cls)
+        habit.name = name
+        habit.period = period
+        habit.started_on = started_on
+        habit.last_checked_on = last_checked_on
+        habit.streak_longest = streak_longest
+        habit.streak_current = streak_current
+        habit.days_since_checked = ""
+        habit.set_status()
+        return habit
+
+    def record(self) -> tuple:
+        """
+        Return the decoded values of this habit class, in the order
+        from_record takes them
+        """
+        return (self.name, self.period, self.started_on, self.last_checked_on,
+                self.streak_longest, self.streak_current)
+
+    @property
+    def started(self) -> datetime:
+        """
+        The date and time this habit was started, to show
+        """
+        return database.to_datetime(self.started_on)
+
+    @property
+    def last_checked(self):
+        """
+        The date and time this habit was last marked as complete, to
+        show, or None if it never was
+        """
+        return database.to_datetime(self.last_checked_on)
+
     # Check if user is overdue on their habit
+    @profiling.timed("habit.set_status")
     def set_status(self):
         """
         Set the users status of this habit to:
@@ -87,70 +145,73 @@ class Habit:
         """
 
         # Habits that havent been checked even once after being created
-        if self.last_checked_on == "None":
+        if self.last_checked_on is None:
             # in time status so it can be checked at anytime
             self.status = "in time"
             return
 
-        self.days_since_checked = (
-            datetime.today().date() - self.last_checked_on.date()).days
-
-        if self.period == "day":
-            if self.days_since_checked <= 1:
-                self.status = "in time"
-            else:
-                self.status = "late"
-        elif self.period == "week":
-            if self.days_since_checked <= 14:
-                self.status = "in time"
-            else:
-                self.status = "late"
+        self.days_since_checked = database.now_seconds() // database.DAY - \
+            self.last_checked_on // database.DAY
+
+        # Habits of any other period are treated as monthly ones
+        late_after = database.LATE_AFTER_DAYS.get(
+            self.period, database.LATE_AFTER_DAYS["month"])
+        if self.days_since_checked <= late_after:
+            self.status = "in time"
         else:
-            if self.days_since_checked <= 61:
-                self.status = "in time"
-            else:
-                self.status = "late"
+            self.status = "late"
 
-    def __restart(self):
+    def __advance(self, restart: bool):
         """
-        Restart the streak and update the last checked on variable
+        Restart or increase the streak and update the last checked on
+        variable, the same as the database will unless another process
+        has marked this habit as done since this class was made
         """
-        self.streak_current = 1
-        self.last_checked_on = datetime.strptime(
-            datetime.today().strftime("%Y-%m-%d %H:%M:%S"), "%Y-%m-%d %H:%M:%S")
-        response = database.update(self)
-        if response == 'updated':
-            console.print(
-                f"\nYou did not check your \"{self.name}\" habit within the {self.period}, so it broke.\n", style='red')
-            console.print("We've now reset your streak back to 1.\n",
-                          style='yellow')
+        if restart:
+            self.streak_current = 1
         else:
-            console.print(f"\nThere was an error ({response})\n", style="red")
+            self.streak_current += 1
+            self.streak_longest = max(self.streak_longest, self.streak_current)
+        self.last_checked_on = database.now_seconds()
 
-    def __check(self):
+    def __restarted(self):
         """
-        Increase the streak and update the last checked on variable
+        Tell the user the streak broke and was restarted
         """
-        self.streak_current += 1
-        self.last_checked_on = datetime.strptime(
-            datetime.today().strftime("%Y-%m-%d %H:%M:%S"), "%Y-%m-%d %H:%M:%S")
         console.print(
-            f"\nSuccessfully marked your \"{self.name}\" habit as done for the {self.period}\nYou are now at a streak of {self.streak_current}\n", style="green")
+            f"\nYou did not check your \"{self.name}\" habit within the {self.period}, so it broke.\n", style='red')
+        console.print("We've now reset your streak back to 1.\n",
+                      style='yellow')
 
-        if self.streak_current > self.streak_longest:
-            self.streak_longest = self.streak_current
+    def __checked(self, streak_longest: int):
+        """
+        Tell the user the streak was increased, and if it is now longer
+        than their longest streak was
+        """
+        console.print(
+            f"\nSuccessfully marked your \"{self.name}\" habit as done for the {self.period}\nYou are now at a streak of {self.streak_current}\n", style="green")
+        if self.streak_current > streak_longest:
             console.print(
                 "This is now your new longest streak!\n", style="green")
-        database.update(self)
 
     def prompt_to_check(self):
         """
         Prompt the user to mark this habit as complete for the first 
         time in their chosen period
         """
-        if Prompt.ask(
-                f"\nType \"mark done\" to mark your \"{self.name}\" habit as done for the {self.period}\n", choices=["mark done", "leave unchecked"]) == 'mark done':
-            self.__check()
+        # Rich prompt module to have user input a string from the options
+        from rich.prompt import Prompt
+
+        try:
+            answer = Prompt.ask(
+                f"\nType \"mark done\" to mark your \"{self.name}\" habit as done for the {self.period}\n", choices=["mark done", "leave unchecked"])
+        except EOFError:
+            # There is no input to read, e.g. when the command is run by
+            # the habit server or a script, so leave it unchecked
+            answer = "leave unchecked"
+
+        if answer == 'mark done':
+            self.mark_as_done()
         else:
             console.print(
                 "\nYour habit was not marked as done\n", style="yellow")
@@ -159,7 +220,7 @@ class Habit:
         """
         Add this habit class to the database
         """
-        response = database.add(self)
+        response = repository.habits.add(self)
         if response == 'added':
             console.print(
                 "\nSuccessfully created and added:", style="green")
@@ -176,7 +237,7 @@ class Habit:
         """
         Remove this habit class from the database
         """
-        response = database.delete(self)
+        response = repository.habits.delete(self)
         if response == 'deleted':
             console.print(
                 f"\nSuccessfully deleted your \"{self.name}\" habit from the database\n", style="green")
@@ -184,17 +245,45 @@ class Habit:
             console.print(
                 f"\nYour habit could not be deleted from the database ({response})\n", style="red")
 
-    def mark_as_done(self):
+    def mark_as_done(self, quiet: bool = False):
         """
         Mark this habit as complete for the period
+
+        ...
+
+        Parameter
+        ---
+        quiet: bool, optional
+            Don't print anything, used when marking many habits at once
         """
 
-        # If the status for this habit is "late"
-        # Restart this habit
-        if self.status == "late":
-            self.__restart()
+        # The status may have changed since this class was made if it
+        # has been kept in memory, so set it again first
+        self.set_status()
+        streak_longest = self.streak_longest
+        saved = (self.streak_current, self.streak_longest, self.last_checked_on)
+        self.__advance(self.status == "late")
+
+        # The database works out again whether the habit is late and
+        # saves the streaks it gets to this class, since another process
+        # may have marked it as done since this class was made. A habit
+        # that isn't in the database keeps the streaks worked out here
+        response = repository.habits.mark_done(self)
+        if response == 'not found':
+            response = 'restarted' if self.status == "late" else 'checked'
+
+        if response == 'restarted':
+            if not quiet:
+                self.__restarted()
             return 'restarted and checked'
+        if response == 'checked':
+            if not quiet:
+                self.__checked(streak_longest)
+            return 'checked'
 
-        # Otherwise, mark it as complete
-        self.__check()
-        return 'checked'
+        # Nothing was saved, so the class goes back to what the database
+        # has, which matters when it is kept in memory by the repository
+        self.streak_current, self.streak_longest, self.last_checked_on = saved
+        if not quiet:
+            console.print(f"\nThere was an error ({response})\n", style="red")
+        return response
@@ -3,18 +3,18 @@ The module that contains the code which the users indirectly interact with to ma
 i.e creating, deleting & updating habits in a clean and simple way
 """
 
-# Rich prompts to have the user input only the allowed values
-from rich.prompt import IntPrompt, Prompt
+# Sys module to read habit names from stdin
+import sys
 
-# Rich console to print things with styling
-from rich.console import Console
+# Sqlite3 module to tell when marking many habits at once couldn't be saved
+import sqlite3
 
-from modules.habit_class import Habit
-from modules.habit_analysis import all_habits
-from modules.database import indexed_habits, habit_ids
+# Console to print things with styling
+from modules.console import console
 
-# Instantiate a default rich console
-console = Console()
+from modules.habit_class import Habit
+from modules.habit_repository import habits
+import modules.database as database
 
 # Variable to store the error message incase something goes wrong
 error_message = ""
@@ -40,10 +40,9 @@ def validate_inputs(name: str, period: str) -> bool:
 
     # Check if a habit with this name already exists in the database
     # if it does, return false and set error message = already existing habit
-    for habit in all_habits:
-        if name == habit.name:
-            error_message = f"\nYour habit was not created because you already have a habit called \"{habit.name}\".\n"
-            return False
+    if name in habits:
+        error_message = f"\nYour habit was not created because you already have a habit called \"{name}\".\n"
+        return False
 
     # Check if the period is one of the 3 options [day/week/month]
     # if it isn't, return false and set error message = wrong period
@@ -104,6 +103,10 @@ def create_habit(name: str = "", period: str = ""):
     # Seperate function so the user has the option of not providing
     # any values and be guided through the function automatically
 
+    # Rich prompts to have the user input only the allowed values, only
+    # imported by the commands that can prompt
+    from rich.prompt import IntPrompt, Prompt
+
     # If the user has not specified a habit name parameter
     try:
         if not name:
@@ -157,20 +160,25 @@ def delete_habit(name: str = ""):
     Delete a habit.
     """
     try:
-        if len(all_habits) != 0:
+        if database.count() != 0:
             if name:
-                for habit in all_habits:
-                    if habit.name == name:
-                        habit.remove_from_db()
-                        return
+                habit = habits.get(name)
+                if habit is not None:
+                    habit.remove_from_db()
+                    return
                 console.print(
                     f"\nYou have no habit called {name}", style="yellow")
             else:
+                from rich.prompt import IntPrompt
+                from modules.snapshot import snapshot_of
+
                 console.print("\nWhich habit would you like to delete?\n")
+                snapshot = snapshot_of()
+                indexed_habits, habit_ids = snapshot.index_habits()
                 console.print(indexed_habits)
                 del_index: int = IntPrompt.ask(
                     "\nYour habit", choices=habit_ids)
-                all_habits[del_index].remove_from_db()
+                habits.get(snapshot.names()[del_index]).remove_from_db()
         else:
             console.print(
                 "\nYou have no habits to delete. Get started by typing \"create habit\" to create and start tracking a new habit.\n")
@@ -179,24 +187,136 @@ def delete_habit(name: str = ""):
             "\nKeyboardInterrupt detected. Exiting function.\n", style="yellow")
 
 
-def mark_done(name: str = ""):
+def read_names(path: str) -> list:
+    """
+    Read habit names from a file, one per line, ignoring empty lines
+
+    ...
+
+    Parameter
+    ---
+    path: str
+        The path to the file, or "-" to read from stdin
+    """
+    if path == "-":
+        lines = sys.stdin.readlines()
+    else:
+        with open(path) as file:
+            lines = file.readlines()
+
+    return [line.strip() for line in lines if line.strip()]
+
+
+def mark_many(names) -> tuple:
+    """
+    Mark every habit with one of these names as done, committing them all
+    at once. A name that appears more than once is only marked once.
+
+    ...
+
+    Parameter
+    ---
+    names: iterable of str
+        The names of the habits to mark as done
+
+    Returns
+    ---
+    The names of the habits that were checked, the names of the habits that
+    were restarted, the names the user has no habit for, and the name and
+    error of each habit that couldn't be marked. If the commit fails, none
+    of them are kept, so every habit is returned as failed
+    """
+    names = list(dict.fromkeys(str(name) for name in names))
+    found = habits.get_many(names)
+    checked, restarted, missing, failed = [], [], [], []
+
     try:
-        if len(all_habits) != 0:
-            if name:
-                for habit in all_habits:
-                    if habit.name == name:
-                        habit.mark_as_done()
-                        return
+        with habits.transaction():
+            for name in names:
+                habit = found.get(name)
+                if habit is None:
+                    missing.append(name)
+                    continue
+                response = habit.mark_as_done(quiet=True)
+                if response == 'checked':
+                    checked.append(name)
+                elif response == 'restarted and checked':
+                    restarted.append(name)
+                else:
+                    failed.append((name, response))
+    except sqlite3.Error as e:
+        failed = [(name, e) for name in checked + restarted] + failed
+        checked, restarted = [], []
+
+    return checked, restarted, missing, failed
+
+
+def mark_done(*names, name="", from_file: str = ""):
+    """
+    Mark one or more habits as done
+
+    ...
+
+    Parameters
+    ---
+    names: str, optional
+        The names of the habits to mark as done, where "-" reads them from
+        stdin the same as --from-file=-
+    name: str or list, optional
+        The name of the habit to mark as done, or a list of names
+    from_file: str or list, optional
+        A file with the names of the habits to mark as done, one per line,
+        or "-" to read them from stdin, or a list of files
+    """
+    try:
+        # Put all the names together from wherever they were given
+        names = list(names)
+        if isinstance(name, (list, tuple)):
+            names.extend(name)
+        elif name:
+            names.append(name)
+        files = list(from_file) if isinstance(from_file, (list, tuple)) else [from_file] if from_file else []
+        if "-" in names:
+            names = [name for name in names if name != "-"]
+            files.append("-")
+        for path in dict.fromkeys(str(path) for path in files):
+            names.extend(read_names(path))
+
+        # Many names are marked together and only summarized
+        if len(names) > 1 or files:
+            checked, restarted, missing, failed = mark_many(names)
+            console.print(
+                f"\nMarked {len(checked) + len(restarted)} habits as done ({len(checked)} checked, {len(restarted)} restarted)", style="green")
+            if missing:
+                console.print(
+                    f"You have no habits called: {', '.join(missing)}", style="yellow")
+            if failed:
+                console.print(
+                    f"Could not mark {len(failed)} habits as done: "
+                    f"{', '.join(f'{name} ({error})' for name, error in failed)}", style="red")
+            console.print()
+            return
+
+        if database.count() != 0:
+            if names:
+                habit = habits.get(str(names[0]))
+                if habit is not None:
+                    habit.mark_as_done()
+                    return
             else:
+                from rich.prompt import IntPrompt
+                from modules.snapshot import snapshot_of
+
                 console.print(
                     "\nWhich habit would you like to mark as done?\n")
+                snapshot = snapshot_of()
+                indexed_habits, habit_ids = snapshot.index_habits()
                 console.print(indexed_habits)
                 mark_index = IntPrompt.ask("\nYour habit", choices=habit_ids)
-                all_habits[mark_index].mark_as_done()
+                habits.get(snapshot.names()[mark_index]).mark_as_done()
         else:
             console.print(
                 "\nYou have no habits to mark as done. Get started by typing \"create habit\" to create and start tracking a new habit.\n")
     except KeyboardInterrupt:
         console.print(
             "\nKeyboardInterrupt detected. Exiting function.\n", style="yellow")
-
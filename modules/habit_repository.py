@@ -0,0 +1,337 @@
+"""
+The module containing the habit repository, which keeps the habit classes
+that have been read from the database in memory so they can be looked up
+by name without going through a list of every habit
+"""
+
+# Contextmanager to make the transaction method usable with "with"
+from contextlib import contextmanager
+
+# Heapq to find the habits with the longest streaks without sorting
+import heapq
+
+# Database module to store habits in
+import modules.database as database
+
+# Imported as a module because habit_class imports this module as well
+import modules.habit_class as habit_class
+
+
+class HabitRepository:
+    """
+    Habit classes indexed by name and by period, kept in sync with the
+    database by making every add, delete and update through this class.
+
+    Habits are read from the database lazily. Looking up a name that
+    hasn't been seen yet reads only that habit, and the whole table is
+    only read once something needs every habit (or load is called).
+
+    ...
+
+    Methods
+    ---
+    load
+        Read every habit from the database
+    clear
+        Forget every habit so they are read from the database again
+    get
+        Return the habit class with a name
+    get_many
+        Return the habit classes with any of the given names
+    names
+        Return the names of all habits, optionally for a given periodicity
+    top_longest
+        Return the habit classes with the longest streaks
+    count_longest
+        Return how many habits have a given longest streak
+    add
+        Add a habit class to the database and the repository
+    delete
+        Delete a habit class from the database and the repository
+    update
+        Update a habit class in the database and the repository
+    check_in
+        Record that a habit class was marked as done
+    mark_done
+        Mark a habit class as done in the database and the repository
+    transaction
+        Group all the writes made inside it into a single commit
+
+    Attributes
+    ---
+    db: Database
+        The database the habits are stored in
+    loaded: bool
+        Whether every habit has been read from the database
+    """
+
+    def __init__(self, db: database.Database = None):
+        self.db = db or database.db
+        self.clear()
+
+    def clear(self):
+        """
+        Forget every habit so they are read from the database again
+        """
+        self._by_name = {}
+        self._by_period = {}
+
+        # True once every habit in the database is in _by_name, so a
+        # name that isn't in it doesn't exist
+        self._loaded = False
+
+    @property
+    def loaded(self) -> bool:
+        """
+        Whether every habit has been read from the database
+        """
+        return self._loaded
+
+    def _index(self, habit: object):
+        """
+        Add a habit class to the indexes, replacing any habit with its name
+        """
+        old = self._by_name.get(habit.name)
+        if old is not None:
+            self._by_period[old.period].discard(habit.name)
+        self._by_name[habit.name] = habit
+        self._by_period.setdefault(habit.period, set()).add(habit.name)
+
+    def _unindex(self, habit: object):
+        """
+        Remove a habit class from the indexes
+        """
+        old = self._by_name.pop(habit.name, None)
+        if old is not None:
+            self._by_period[old.period].discard(habit.name)
+
+    def load(self):
+        """
+        Read every habit from the database. Habits that were already read
+        keep their habit class
+        """
+        if self._loaded:
+            return
+
+        # The snapshot has the dates of every habit parsed already
+        from modules.snapshot import snapshot_of
+
+        for habit in snapshot_of(self.db).habits():
+            if habit.name not in self._by_name:
+                self._index(habit)
+        self._loaded = True
+
+    def get(self, name: str):
+        """
+        Return the habit class with this name, or None if the user has no
+        habit with this name
+
+        ...
+
+        Parameter
+        ---
+        name: str
+            The name of the habit
+        """
+        habit = self._by_name.get(name)
+        if habit is not None or self._loaded:
+            return habit
+
+        row = self.db.get_habit(name)
+        if row is None:
+            return None
+
+        habit = habit_class.Habit(*row)
+        self._index(habit)
+        return habit
+
+    def get_many(self, names) -> dict:
+        """
+        Return a dictionary of the habit classes with these names. Names
+        that haven't been seen yet are all read from the database together
+        instead of one query per name. Names the user has no habit for are
+        left out
+
+        ...
+
+        Parameter
+        ---
+        names: iterable of str
+            The names of the habits
+        """
+        names = list(names)
+        if not self._loaded:
+            unseen = [name for name in names if name not in self._by_name]
+            for row in self.db.get_habits_named(unseen):
+                self._index(habit_class.Habit(*row))
+
+        return {name: self._by_name[name] for name in names if name in self._by_name}
+
+    def __contains__(self, name: str) -> bool:
+        return self.get(name) is not None
+
+    def __len__(self) -> int:
+        self.load()
+        return len(self._by_name)
+
+    def __iter__(self):
+        self.load()
+        return iter(list(self._by_name.values()))
+
+    def names(self, period: str = "") -> set:
+        """
+        Return the names of all habits
+
+        ...
+
+        Parameter
+        ---
+        period: str, optional
+            Return only the names of habits that have this periodicity
+        """
+        self.load()
+        if period:
+            return set(self._by_period.get(period, ()))
+        return set(self._by_name)
+
+    def _habits(self, period: str = ""):
+        """
+        The habit classes, optionally only those with this periodicity
+        """
+        self.load()
+        if period:
+            return (self._by_name[name] for name in self._by_period.get(period, ()))
+        return iter(self._by_name.values())
+
+    def top_longest(self, top: int, period: str = "") -> list:
+        """
+        Return the top habit classes by longest streak, longest first. A
+        heap of only the top habits is kept while going through them, so
+        the rest are never sorted. Habits with the same longest streak may
+        come in a different order than from the database
+
+        ...
+
+        Parameters
+        ---
+        top: int
+            How many habit classes to return
+        period: str, optional
+            Return only habits that have this periodicity
+        """
+        return heapq.nlargest(int(top), self._habits(period),
+                              key=lambda habit: habit.streak_longest)
+
+    def count_longest(self, streak_longest: int, period: str = "") -> int:
+        """
+        Return how many habits have this longest streak
+
+        ...
+
+        Parameters
+        ---
+        streak_longest: int
+            The longest streak to count the habits with
+        period: str, optional
+            Count only habits that have this periodicity
+        """
+        return sum(1 for habit in self._habits(period) if habit.streak_longest == streak_longest)
+
+    def add(self, habit: object):
+        """
+        Add a habit class to the database and the repository
+
+        ...
+
+        Parameter
+        ---
+        habit: Habit
+            The habit class to be added
+        """
+        response = self.db.add(habit)
+        if response == 'added':
+            self._index(habit)
+        return response
+
+    def delete(self, habit: object):
+        """
+        Delete a habit class from the database and the repository
+
+        ...
+
+        Parameter
+        ---
+        habit: Habit
+            The habit class to be deleted
+        """
+        response = self.db.delete(habit)
+        if response == 'deleted':
+            self._unindex(habit)
+        return response
+
+    def update(self, habit: object):
+        """
+        Update a habit class in the database and the repository
+
+        ...
+
+        Parameter
+        ---
+        habit: Habit
+            The habit class to be updated
+        """
+        response = self.db.update(habit)
+        if response == 'updated' and (self._loaded or habit.name in self._by_name):
+            self._index(habit)
+        return response
+
+    def check_in(self, habit: object):
+        """
+        Record that a habit class was marked as done in the database and
+        the repository
+
+        ...
+
+        Parameter
+        ---
+        habit: Habit
+            The habit class that was marked as done
+        """
+        response = self.db.check_in(habit)
+        if response == 'checked in' and (self._loaded or habit.name in self._by_name):
+            self._index(habit)
+        return response
+
+    def mark_done(self, habit: object):
+        """
+        Mark a habit class as done in the database and keep the streaks
+        the database saved for it in the repository
+
+        ...
+
+        Parameter
+        ---
+        habit: Habit
+            The habit class to mark as done
+        """
+        response = self.db.mark_done(habit)
+        if response in ('checked', 'restarted') and (self._loaded or habit.name in self._by_name):
+            self._index(habit)
+        return response
+
+    @contextmanager
+    def transaction(self):
+        """
+        The same as Database.transaction, but if it fails the repository
+        is cleared, since it may have habits whose writes were never kept
+        """
+        try:
+            with self.db.transaction():
+                yield self
+        except BaseException:
+            self.clear()
+            raise
+
+
+# The repository for the default database
+habits = HabitRepository()
@@ -0,0 +1,262 @@
+"""
+The module containing the statistics engine, which works out the streaks,
+gaps and completion rates of every habit from its check in history.
+Everything is done on NumPy arrays for all habits at once, so there is no
+Python loop over habits or check ins no matter how long the history is.
+"""
+
+# Itertools to flatten database rows straight into NumPy arrays
+from itertools import chain
+
+# Datetime module to work out which day today is
+from datetime import date
+
+# NumPy to work with whole columns of days at once
+import numpy as np
+
+# Database module to read the check in history from
+import modules.database as database
+
+# The periods a habit can have, in the order of their period codes.
+# Habits with any other period are treated like monthly habits, the
+# same way Habit.set_status does
+PERIODS = ("day", "week", "month")
+
+# The ordinal of 1970-01-01, which is day 0 for all epoch days
+EPOCH = date(1970, 1, 1).toordinal()
+
+
+def epoch_day(day: date) -> int:
+    """
+    Return the number of days between 1970-01-01 and this date
+    """
+    return day.toordinal() - EPOCH
+
+
+def period_codes(periods) -> np.ndarray:
+    """
+    Convert a list of period names to their period codes
+    (0 -> day, 1 -> week, 2 -> anything else)
+    """
+    periods = np.asarray(periods, dtype=object)
+    return np.select([periods == "day", periods == "week"], [0, 1], 2)
+
+
+def to_periods(days, codes) -> np.ndarray:
+    """
+    Convert epoch days to the number of the day, week (starting on
+    monday) or month they fall in, depending on each ones period code.
+    Consecutive periods always have consecutive numbers.
+
+    ...
+
+    Parameters
+    ---
+    days: array
+        The epoch days to convert
+    codes: array
+        The period code to use for each day
+    """
+    days = np.asarray(days, dtype=np.int64)
+
+    # 1970-01-01 was a thursday so the monday of its week is 3 days before
+    weeks = (days + 3) // 7
+    months = days.astype("datetime64[D]").astype(
+        "datetime64[M]").astype(np.int64)
+
+    return np.select([codes == 0, codes == 1], [days, weeks], months)
+
+
+def _starts(*columns) -> np.ndarray:
+    """
+    Return a mask that is True wherever any of these columns has a
+    different value from the row before it, and for the first row
+    """
+    mask = np.ones(len(columns[0]), dtype=bool)
+    if len(mask):
+        mask[1:] = np.logical_or.reduce(
+            [column[1:] != column[:-1] for column in columns])
+    return mask
+
+
+def _group_starts(groups: np.ndarray) -> np.ndarray:
+    """
+    Return the index where each run of equal values in a sorted array starts
+    """
+    return np.flatnonzero(_starts(groups))
+
+
+def _group_max(values: np.ndarray, groups: np.ndarray, size: int) -> np.ndarray:
+    """
+    Return the largest value for each group, where groups is sorted.
+    Groups that have no values get 0
+    """
+    result = np.zeros(size, dtype=np.int64)
+    if len(values):
+        starts = _group_starts(groups)
+        result[groups[starts]] = np.maximum.reduceat(values, starts)
+    return result
+
+
+def compute_stats(codes, started, checkin_habits, checkin_days, today: int, window: int = 4) -> dict:
+    """
+    Work out the statistics of every habit from its check ins
+
+    ...
+
+    Parameters
+    ---
+    codes: array
+        The period code of each habit
+    started: array
+        The epoch day each habit was started on
+    checkin_habits: array
+        The index of the habit each check in belongs to, sorted
+    checkin_days: array
+        The epoch day of each check in, sorted within each habit
+    today: int
+        The epoch day to work out current streaks and adherence for
+    window: int, optional
+        The number of most recent periods used for rolling adherence
+
+    Returns
+    ---
+    A dictionary of arrays with one value per habit:
+
+        checkins -> the number of times it was marked as done
+        completed -> the number of periods it was marked as done in
+        streak_longest -> the most periods in a row it was done in
+        streak_current -> the periods in a row up to this or last period
+
+    Streaks count periods, not check ins, so a habit checked in several
+    times in one period only adds one to them
+        completion_rate -> completed periods out of all periods since it started
+        adherence -> completed periods out of the last window periods
+        mean_gap -> the average number of days between check ins
+        max_gap -> the most days between two check ins
+
+    and gap_distribution, the number of gaps of each length in days
+    between check ins across all habits
+    """
+    codes = np.asarray(codes, dtype=np.int64)
+    size = len(codes)
+    habits = np.asarray(checkin_habits, dtype=np.int64)
+    days = np.asarray(checkin_days, dtype=np.int64)
+
+    checkins = np.bincount(habits, minlength=size)
+
+    # The days between each check in and the one before it, for the
+    # same habit only
+    same_habit = habits[1:] == habits[:-1]
+    gaps = np.diff(days)[same_habit]
+    gap_habits = habits[1:][same_habit]
+    gap_counts = np.bincount(gap_habits, minlength=size)
+    gap_sums = np.bincount(gap_habits, weights=gaps, minlength=size)
+    mean_gap = np.divide(gap_sums, gap_counts,
+                         out=np.full(size, np.nan), where=gap_counts > 0)
+    max_gap = _group_max(gaps, gap_habits, size)
+
+    # Which period each check in was made in. More than one check in
+    # in the same period only counts once
+    periods = to_periods(days, codes[habits])
+    first_in_period = _starts(habits, periods)
+    habits = habits[first_in_period]
+    periods = periods[first_in_period]
+    completed = np.bincount(habits, minlength=size)
+
+    # A streak is a run of consecutive periods for the same habit, so a
+    # new one starts wherever the habit changes or a period was skipped.
+    # Within a streak, period minus position stays the same, so it only
+    # changes where a period was skipped
+    streak_starts = np.flatnonzero(
+        _starts(habits, periods - np.arange(len(periods))))
+    streak_lengths = np.diff(np.r_[streak_starts, len(habits)])
+    streak_habits = habits[streak_starts]
+    streak_ends = periods[streak_starts + streak_lengths - 1]
+    streak_longest = _group_max(streak_lengths, streak_habits, size)
+
+    # The last streak of a habit is its current one if it reaches the
+    # current period or the one before it, which can still be continued
+    today_periods = to_periods(np.full(size, today), codes)
+    last_streak = _starts(streak_habits[::-1])[::-1]
+    last_habits = streak_habits[last_streak]
+    streak_current = np.zeros(size, dtype=np.int64)
+    streak_current[last_habits] = np.where(
+        today_periods[last_habits] - streak_ends[last_streak] <= 1,
+        streak_lengths[last_streak], 0)
+
+    # Every period from the one the habit was started in (or its first
+    # check in, if that is earlier) up to the current one
+    start_periods = to_periods(started, codes)
+    if len(habits):
+        first_periods = _group_starts(habits)
+        first_habits = habits[first_periods]
+        start_periods[first_habits] = np.minimum(
+            start_periods[first_habits], periods[first_periods])
+    total_periods = np.maximum(today_periods - start_periods + 1, 1)
+    completion_rate = completed / total_periods
+
+    # Completed periods out of the last window periods, or out of every
+    # period since it started for habits younger than that
+    recent = periods > today_periods[habits] - window
+    adherence = np.bincount(habits[recent], minlength=size) / np.minimum(
+        total_periods, window)
+
+    return {
+        "checkins": checkins,
+        "completed": completed,
+        "streak_longest": streak_longest,
+        "streak_current": streak_current,
+        "completion_rate": completion_rate,
+        "adherence": adherence,
+        "mean_gap": mean_gap,
+        "max_gap": max_gap,
+        "gap_distribution": np.bincount(gaps) if len(gaps) else np.zeros(0, dtype=np.int64)
+    }
+
+
+def load_stats(period: str = "", window: int = 4, db: database.Database = None) -> dict:
+    """
+    Load the check in history from the database and work out the
+    statistics of every habit
+
+    ...
+
+    Parameters
+    ---
+    period: str, optional
+        Only work out the statistics of habits with this periodicity
+    window: int, optional
+        The number of most recent periods used for rolling adherence
+    db: Database, optional
+        The database to load from, the default one if not given
+
+    Returns
+    ---
+    The dictionary from compute_stats with the name and period of each
+    habit added to it
+    """
+    db = db or database.db
+
+    ids, names, periods, started = [], [], [], []
+    for habit_id, name, habit_period, started_on in db.get_habit_days(period):
+        ids.append(habit_id)
+        names.append(name)
+        periods.append(habit_period)
+        started.append(started_on)
+    ids = np.array(ids, dtype=np.int64)
+
+    # Flatten the (habit id, day) rows straight into one array instead of
+    # making a Python list of tuples first
+    rows = np.fromiter(chain.from_iterable(
+        db.get_checkin_days(period)), dtype=np.int64).reshape(-1, 2)
+
+    # Habit ids are sorted, so the index of each check ins habit can be
+    # found with a binary search
+    checkin_habits = np.searchsorted(ids, rows[:, 0])
+
+    stats = compute_stats(period_codes(periods), np.array(started, dtype=np.int64),
+                          checkin_habits, rows[:, 1], epoch_day(date.today()), window)
+    stats["name"] = names
+    stats["period"] = periods
+    return stats
@@ -13,44 +13,44 @@ from datetime import datetime, timedelta
 predefined_habits = [
     Habit("walk the dog",
           "day",
-          datetime(2022, 8, 13).strftime("%Y-%m-%d %H:%M:%S"),
-          datetime.today().strftime("%Y-%m-%d %H:%M:%S"),
+          datetime(2022, 8, 13),
+          datetime.today(),
           31,
           31),
     Habit("exercise",
           "day",
-          datetime(2022, 7, 5).strftime("%Y-%m-%d %H:%M:%S"),
-          (datetime.today() - timedelta(days=2)).strftime("%Y-%m-%d %H:%M:%S"),
+          datetime(2022, 7, 5),
+          datetime.today() - timedelta(days=2),
           5,
           2),
     Habit("laundry",
           "week",
-          datetime(2022, 8, 29).strftime("%Y-%m-%d %H:%M:%S"),
-          ((datetime.today() - timedelta(days=7)).strftime("%Y-%m-%d %H:%M:%S")),
+          datetime(2022, 8, 29),
+          datetime.today() - timedelta(days=7),
           1,
           1),
     Habit("clean the house",
           "week",
-          datetime(2022, 4, 29).strftime("%Y-%m-%d %H:%M:%S"),
-          ((datetime.today() - timedelta(days=15)).strftime("%Y-%m-%d %H:%M:%S")),
+          datetime(2022, 4, 29),
+          datetime.today() - timedelta(days=15),
           99,
           40),
     Habit("review budget & finances",
           "month",
-          datetime(2022, 1, 16).strftime("%Y-%m-%d %H:%M:%S"),
-          ((datetime.today() - timedelta(days=17)).strftime("%Y-%m-%d %H:%M:%S")),
+          datetime(2022, 1, 16),
+          datetime.today() - timedelta(days=17),
           65,
           65),
     Habit("review your inbox",
           "month",
-          datetime(2022, 1, 21).strftime("%Y-%m-%d %H:%M:%S"),
-          ((datetime.today() - timedelta(days=63)).strftime("%Y-%m-%d %H:%M:%S")),
+          datetime(2022, 1, 21),
+          datetime.today() - timedelta(days=63),
           132,
           90),
     Habit("plan the month",
           "month",
-          datetime(2022, 1, 21).strftime("%Y-%m-%d %H:%M:%S"),
-          'None',
+          datetime(2022, 1, 21),
+          None,
           0,
           0)
 ]
@@ -0,0 +1,357 @@
+"""
+The module containing the profiling tools that the --profile flag turns
+on: timing spans around the hot parts of the app, a summary of them, an
+optional cProfile dump and command latency metrics in the Prometheus text
+format.
+
+Spans cost a single check when profiling is off, so they can be left
+around code that runs once per habit.
+
+Usage
+---
+with profiling.span("render table"):
+    console.print(table)
+
+@profiling.timed("database.get_habits")
+def get_habits(self, period=""):
+    ...
+"""
+
+# Fcntl module to lock the metrics file while it is updated
+import fcntl
+
+# Functools to keep the name and docstring of timed functions
+import functools
+
+# Os module to find and replace the metrics file
+import os
+
+# Tempfile module to write the new metrics file before replacing the old one
+import tempfile
+
+# Time module to time the spans
+from time import perf_counter
+
+# The file command latencies are written to, which the node exporter
+# textfile collector can read. Can be changed with HABITS_METRICS
+METRICS_PATH = os.environ.get("HABITS_METRICS", "habits.prom")
+
+# The upper bounds of the command latency histogram buckets, in seconds
+BUCKETS = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10]
+
+# True while profiling is on
+enabled = False
+
+# The number of calls, total seconds and slowest call of every span, by name
+spans = {}
+
+# The running cProfile profiler, if a profile is being dumped
+_profiler = None
+
+
+class Span:
+    """
+    Times the code in a "with" block and adds it to the spans of its name
+
+    ...
+
+    Attributes
+    ---
+    name: str
+        The name of the span
+    """
+
+    __slots__ = ("name", "start")
+
+    def __init__(self, name: str):
+        self.name = name
+
+    def __enter__(self):
+        self.start = perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        elapsed = perf_counter() - self.start
+        record = spans.get(self.name)
+        if record is None:
+            spans[self.name] = [1, elapsed, elapsed]
+        else:
+            record[0] += 1
+            record[1] += elapsed
+            if elapsed > record[2]:
+                record[2] = elapsed
+        return False
+
+
+class _NoSpan:
+    """
+    Does nothing, used instead of a span while profiling is off
+    """
+
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NO_SPAN = _NoSpan()
+
+
+def span(name: str):
+    """
+    Return a context manager that times its block as a span of this name
+    while profiling is on
+
+    ...
+
+    Parameter
+    ---
+    name: str
+        The name of the span
+    """
+    return Span(name) if enabled else _NO_SPAN
+
+
+def timed(name: str):
+    """
+    Decorator that times every call of a function as a span of this name
+    while profiling is on
+
+    ...
+
+    Parameter
+    ---
+    name: str
+        The name of the span
+    """
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not enabled:
+                return function(*args, **kwargs)
+            with Span(name):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def start(profile_path: str = ""):
+    """
+    Turn profiling on, forgetting any spans from before
+
+    ...
+
+    Parameter
+    ---
+    profile_path: str, optional
+        Also run cProfile, to dump its stats to this file when stopped
+    """
+    global enabled, _profiler
+
+    spans.clear()
+    enabled = True
+    if profile_path:
+        # Only imported when a profile is asked for
+        import cProfile
+
+        _profiler = cProfile.Profile()
+        _profiler.enable()
+
+
+def stop(profile_path: str = ""):
+    """
+    Turn profiling off and dump the cProfile stats if it was running
+
+    ...
+
+    Parameter
+    ---
+    profile_path: str, optional
+        The file to dump the stats to, which can be read with pstats
+    """
+    global enabled, _profiler
+
+    enabled = False
+    if _profiler is not None:
+        _profiler.disable()
+        _profiler.dump_stats(profile_path)
+        _profiler = None
+
+
+def summary(elapsed: float) -> str:
+    """
+    Return a summary of every span, slowest in total first
+
+    ...
+
+    Parameter
+    ---
+    elapsed: float
+        How long the whole command took, in seconds
+    """
+    lines = [f"\nProfile ({elapsed * 1000:.2f}ms in total)\n",
+             f"{'Span':<28}{'Calls':>9}{'Total ms':>12}{'Mean ms':>11}{'Max ms':>11}"]
+    for name, (calls, total, slowest) in sorted(spans.items(), key=lambda item: -item[1][1]):
+        lines.append(
+            f"{name:<28}{calls:>9}{total * 1000:>12.2f}{total / calls * 1000:>11.3f}{slowest * 1000:>11.3f}")
+    return "\n".join(lines) + "\n"
+
+
+def parse_flag(argv: list) -> tuple:
+    """
+    Take the --profile flag out of the command line arguments, since it can
+    be given to any command. Returns the rest of the arguments, and None if
+    the flag wasn't given, "" if it was given on its own or the file to dump
+    the cProfile stats to if it was given one (--profile=FILE)
+
+    ...
+
+    Parameter
+    ---
+    argv: list
+        The command followed by its arguments
+    """
+    profile = None
+    rest = []
+    for arg in argv:
+        if arg == "--profile":
+            profile = profile or ""
+        elif arg.startswith("--profile="):
+            profile = arg.partition("=")[2]
+        else:
+            rest.append(arg)
+    return rest, profile
+
+
+def profile(function, command: str, profile_path: str = ""):
+    """
+    Run a function with profiling on, then print the summary of its spans
+    to stderr and add its latency to the metrics file
+
+    ...
+
+    Parameters
+    ---
+    function: function
+        The function to run, without arguments
+    command: str
+        The name of the command being run
+    profile_path: str, optional
+        Also dump the cProfile stats to this file
+    """
+    # Sys module to print the summary without mixing it into the output
+    import sys
+
+    start(profile_path)
+    began = perf_counter()
+    try:
+        return function()
+    finally:
+        elapsed = perf_counter() - began
+        stop(profile_path)
+        sys.stderr.write(summary(elapsed))
+        if profile_path:
+            sys.stderr.write(f"cProfile stats written to {profile_path}\n")
+        record_command(command, elapsed)
+
+
+def _read_metrics(path: str) -> dict:
+    """
+    Read the samples of a metrics file, by the series they belong to
+    """
+    samples = {}
+    if not os.path.exists(path):
+        return samples
+
+    with open(path) as file:
+        for line in file:
+            if line.startswith("#") or not line.strip():
+                continue
+            series, _, value = line.rstrip("\n").rpartition(" ")
+            try:
+                samples[series] = float(value)
+            except ValueError:
+                pass
+    return samples
+
+
+def _escape(value: str) -> str:
+    """
+    Escape a label value for the Prometheus text format
+    """
+    return value.replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def record_command(command: str, elapsed: float, path: str = METRICS_PATH):
+    """
+    Add the latency of a command, and the time spent in each span during
+    it, to the metrics file.
+
+    The Prometheus text format can only hold one value per series, so
+    instead of appending each sample the file keeps a histogram of
+    command latencies and running totals of the spans, and is replaced
+    as a whole so a scrape never sees it half written. A lock file next
+    to it stops two commands from updating it at once
+
+    ...
+
+    Parameters
+    ---
+    command: str
+        The name of the command
+    elapsed: float
+        How long the command took, in seconds
+    path: str, optional
+        The metrics file
+    """
+    # Commands that finish at the same time take turns, otherwise one of
+    # them would overwrite the file with totals missing the other
+    with open(path + ".lock", "a") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        samples = _read_metrics(path)
+        label = f"command=\"{_escape(command)}\""
+
+        def add(series: str, value: float):
+            samples[series] = samples.get(series, 0) + value
+
+        for bound in BUCKETS:
+            add(f"habits_command_duration_seconds_bucket{{{label},le=\"{bound}\"}}",
+                elapsed <= bound)
+        add(f"habits_command_duration_seconds_bucket{{{label},le=\"+Inf\"}}", 1)
+        add(f"habits_command_duration_seconds_sum{{{label}}}", elapsed)
+        add(f"habits_command_duration_seconds_count{{{label}}}", 1)
+
+        for name, (calls, total, _) in spans.items():
+            span_label = f"{label},span=\"{_escape(name)}\""
+            add(f"habits_span_seconds_total{{{span_label}}}", total)
+            add(f"habits_span_calls_total{{{span_label}}}", calls)
+
+        metrics = {
+            "habits_command_duration_seconds": ("histogram", "How long habit commands take to run"),
+            "habits_span_seconds_total": ("counter", "Time spent in each profiling span"),
+            "habits_span_calls_total": ("counter", "How many times each profiling span ran")
+        }
+        lines = []
+        for metric, (kind, description) in metrics.items():
+            lines.append(f"# HELP {metric} {description}")
+            lines.append(f"# TYPE {metric} {kind}")
+            for series, value in samples.items():
+                if series.split("{")[0] in (metric, f"{metric}_bucket", f"{metric}_sum", f"{metric}_count"):
+                    lines.append(f"{series} {value:.10g}")
+
+        # Every command writes its own temporary file next to the metrics
+        # file, so the replace stays on one filesystem
+        directory, filename = os.path.split(path)
+        descriptor, temporary = tempfile.mkstemp(prefix=f"{filename}.", suffix=".tmp", dir=directory or ".")
+        try:
+            with os.fdopen(descriptor, "w") as file:
+                file.write("\n".join(lines) + "\n")
+            # mkstemp only lets the owner read it, but the exporter has to too
+            os.chmod(temporary, 0o644)
+            os.replace(temporary, path)
+        except BaseException:
+            os.remove(temporary)
+            raise
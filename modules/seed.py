@@ -0,0 +1,280 @@
+"""
+The module containing the seeder, which fills a database with synthetic
+habits for capacity and load testing.
+
+Habits are named after the predefined habits and spread across days,
+weeks and months, with streaks and last checked dates like those of real
+users: most are kept up, some are late and a few were never marked as
+done. Each one can also be given a history of check ins going back years,
+with runs of check ins broken by the odd missed day, week or month.
+
+The same seed always makes the same habits on the same day, so a load
+test can be run again against exactly the same data. Everything is
+written with Database.bulk_insert, a chunk at a time as it is made, so
+seeding millions of rows doesn't need them all in memory at once.
+
+Usage
+---
+python . seed --habits=100000 --history --years=3 --seed=7 --output=load.db
+
+Habits are seeded into seed.db by default, never into habits.db, and a
+database that already has habits is only added to with --force.
+"""
+
+# Random module to make the synthetic habits
+import random
+
+# Bisect and accumulate to pick the period of each habit by its weight
+from bisect import bisect
+from itertools import accumulate
+
+# Datetime module to work out the dates of the habits
+from datetime import datetime
+
+# Sqlite3 module to tell when seeded habits clash with existing ones
+import sqlite3
+
+# Time module to time the seeding
+from time import perf_counter
+
+# Console to print how long the seeding took
+from modules.console import console
+
+# Database module to write the habits with and for the rules of which
+# habits are late
+import modules.database as database
+
+# The number of seconds in a day
+DAY = database.DAY
+
+# How likely a habit is to repeat once every day, week or month
+PERIOD_WEIGHTS = {"day": 0.6, "week": 0.3, "month": 0.1}
+
+# How many days each period lasts
+PERIOD_DAYS = {"day": 1, "week": 7, "month": 30}
+
+# The average number of times in a row a habit of each period is kept up
+MEAN_STREAK = {"day": 12, "week": 6, "month": 3}
+
+# How likely a habit is to have never been marked as done, and to be late
+NEVER_CHECKED = 0.05
+LATE = 0.25
+
+# The lowest and highest share of days, weeks or months a habit is marked
+# as done on in its history
+COMPLETION_RATE = (0.4, 0.95)
+
+# How many years before today habits are started on at most, by default
+YEARS = 2
+
+# How many rows are made before they are written to the database
+CHUNK_ROWS = 50000
+
+# The database habits are seeded into by default, kept apart from the
+# habits.db of the user
+OUTPUT = "seed.db"
+
+
+def name_templates() -> dict:
+    """
+    Return the names of the predefined habits of each period, which the
+    synthetic habits are named after
+    """
+    # Only needed when seeding, so it isn't imported with this module
+    from modules.predef_habits import predefined_habits
+
+    templates = {period: [] for period in PERIOD_WEIGHTS}
+    for habit in predefined_habits:
+        templates[habit.period].append(habit.name)
+    return templates
+
+
+def generate(habits: int, seed: int = 0, history: bool = False, years: int = YEARS, now: datetime = None):
+    """
+    Make synthetic habits and their check ins, in the chunks that
+    Database.bulk_insert takes. Without a history each habit that was
+    marked as done has one check in, when it was last marked as done
+
+    ...
+
+    Parameters
+    ---
+    habits: int
+        How many habits to make
+    seed: int, optional
+        The seed of the random number generator
+    history: bool, optional
+        Also make every check in of each habit since it was started
+    years: int, optional
+        How many years before today habits are started on at most
+    now: datetime, optional
+        The date and time to make the habits up to, now by default
+    """
+    # Only random() and expovariate() are used, since randint() and
+    # choice() take several times as long and are called for every habit
+    rng = random.Random(seed)
+    uniform, expovariate = rng.random, rng.expovariate
+    templates = name_templates()
+    periods = list(PERIOD_WEIGHTS)
+    weights = list(accumulate(PERIOD_WEIGHTS.values()))
+
+    now = database.to_seconds(now or datetime.today())
+    today = now - now % DAY
+    span = max(int(years), 1) * 365 + 1
+
+    habit_rows, checkin_rows = [], []
+    for number in range(habits):
+        period = periods[bisect(weights, uniform() * weights[-1])]
+        days = PERIOD_DAYS[period]
+        names = templates[period]
+        name = f"{names[int(uniform() * len(names))]} {number + 1:07d}"
+        chance = uniform()
+
+        if chance < NEVER_CHECKED:
+            started_on = min(today - int(uniform() * span) * DAY + int(uniform() * DAY), now)
+            habit_rows.append((name, period, started_on, None, 0, 0))
+        else:
+            # How many days ago it was last marked as done, which is more
+            # than it can be for late habits and at most one period for the
+            # others, then how many periods in a row it was kept up until
+            # then and how many days before that it was started
+            late_after = database.LATE_AFTER_DAYS[period]
+            if chance < NEVER_CHECKED + LATE:
+                ago = late_after + 1 + int(expovariate(1 / (days * 4)))
+            else:
+                ago = int(uniform() * (min(days, late_after) + 1))
+            streak_current = 1 + int(expovariate(1 / MEAN_STREAK[period]))
+            before = int(uniform() * span)
+
+            last_checked_on = today - ago * DAY + int(uniform() * (now - today if ago == 0 else DAY))
+            streak_started = last_checked_on - (streak_current - 1) * days * DAY
+            started_on = min(streak_started - before * DAY + int(uniform() * DAY), streak_started)
+
+            # Some habits were kept up for longer before, as long as it
+            # fits between the day they were started and their streak
+            streak_longest = streak_current
+            if uniform() < 0.5:
+                streak_longest = max(streak_current, min(
+                    1 + int(expovariate(1 / MEAN_STREAK[period])), before // days - 1))
+            habit_rows.append((name, period, started_on, last_checked_on, streak_longest, streak_current))
+
+            if not history:
+                checkin_rows.append((number, last_checked_on))
+            else:
+                # Each period before the streak is marked as done at the
+                # habits completion rate, with the period just before the
+                # streak missed and no run longer than the longest streak
+                checked = [last_checked_on - streak * days * DAY for streak in range(streak_current)]
+                rate = COMPLETION_RATE[0] + uniform() * (COMPLETION_RATE[1] - COMPLETION_RATE[0])
+                run = 0
+                day = streak_started - 2 * days * DAY
+                while day >= started_on:
+                    if run < streak_longest and uniform() < rate:
+                        checked.append(day)
+                        run += 1
+                    else:
+                        run = 0
+                    day -= days * DAY
+                checkin_rows.extend((number, checked_on) for checked_on in reversed(checked))
+
+        if len(habit_rows) + len(checkin_rows) >= CHUNK_ROWS:
+            yield habit_rows, checkin_rows
+            habit_rows, checkin_rows = [], []
+
+    if habit_rows:
+        yield habit_rows, checkin_rows
+
+
+def seed_database(path: str, habits: int, seed: int = 0, history: bool = False, years: int = YEARS,
+                  now: datetime = None, synchronous: str = "OFF") -> dict:
+    """
+    Add synthetic habits to a database, making it if it doesn't exist,
+    and return how many habits and check ins were added and how long it
+    took. Raises sqlite3.IntegrityError if a habit with the same name as
+    one of them is already in it, in which case nothing is added
+
+    ...
+
+    Parameters
+    ---
+    path: str
+        The path to the database
+    habits: int
+        How many habits to add
+    seed: int, optional
+        The seed of the random number generator
+    history: bool, optional
+        Also add every check in of each habit since it was started
+    years: int, optional
+        How many years before today habits are started on at most
+    now: datetime, optional
+        The date and time to make the habits up to, now by default
+    synchronous: str, optional
+        How often the database syncs to disk while seeding. "OFF" by
+        default, since a new database that is cut short can simply be
+        seeded again
+    """
+    db = database.Database(path, synchronous=synchronous)
+    try:
+        began = perf_counter()
+        added_habits, added_checkins = db.bulk_insert(generate(habits, seed, history, years, now))
+        seconds = perf_counter() - began
+    finally:
+        db.close()
+
+    return {"habits": added_habits, "checkins": added_checkins, "seconds": seconds}
+
+
+def seed_habits(habits: int = 1000, output: str = OUTPUT, seed: int = 0, history: bool = False,
+                years: int = YEARS, force: bool = False):
+    """
+    Fill a database with synthetic habits for capacity and load testing
+
+    ...
+
+    Parameters
+    ---
+    habits: int, optional
+        How many habits to add
+    output: str, optional
+        The database to add them to
+    seed: int, optional
+        The seed of the random number generator, the same seed makes the
+        same habits
+    history: bool, optional
+        Also add every check in of each habit since it was started
+    years: int, optional
+        How many years before today habits are started on at most
+    force: bool, optional
+        Add the habits even if the database already has habits
+    """
+    if int(habits) < 1 or int(years) < 1:
+        console.print("\n--habits and --years must be at least 1\n")
+        return
+
+    existing = database.Database(str(output))
+    try:
+        existing_habits = existing.count()
+    finally:
+        existing.close()
+    if existing_habits and not force:
+        console.print(
+            f"\n{output} already has {existing_habits} habits. Seed into a new database with --output, "
+            f"or add to it anyway with --force\n")
+        return
+
+    try:
+        # Habits that are already there are synced to disk as usual, so a
+        # seed that is cut short can't damage them
+        result = seed_database(str(output), int(habits), int(seed), bool(history), int(years),
+                               synchronous="NORMAL" if existing_habits else "OFF")
+    except sqlite3.IntegrityError:
+        console.print(
+            f"\n{output} already has habits with the same names, seed into a new database instead\n")
+        return
+
+    seconds = max(result["seconds"], 1e-9)
+    rows = result["habits"] + result["checkins"]
+    console.print(
+        f"\nSeeded {result['habits']} habits and {result['checkins']} check ins into {output} in {seconds:.2f}s "
+        f"({rows / seconds:.0f} rows/s, {result['habits'] / seconds:.0f} habits/s)\n", style="green")
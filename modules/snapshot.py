@@ -0,0 +1,457 @@
+"""
+The module containing the snapshot cache, a copy of the habits table kept
+in a file next to the database, so commands that need every habit in
+memory at once (the repository, the prompts that pick a habit) don't have
+to read every row of the database again on each run. Listings stream from
+the database instead, so they never hold every habit.
+
+The snapshot is checked against the database before it is used. Within a
+process, PRAGMA data_version tells whether anything has written to the
+database since it was last checked. Between processes, the change counter
+that migration 4 keeps on the habits table does, along with which habits
+changed, so only those habits are read again.
+
+Habits are kept as columns, with the dates as the whole seconds since
+1970-01-01 the database stores them as, which keeps the file small and
+quick to read and write.
+
+Layout
+---
+A line of JSON with the format, token and change counter the snapshot was
+made at, the byte order, how many rows the columns have, how many of them
+are habits that haven't been deleted and the size of each text column:
+
+    {"format": 3, "byteorder": "little", "token": "...", "version": 12,
+     "rows": N, "live": L, "bytes": {"names": B, "periods": P}}
+
+then as signed 64 bit integers each number column and the length of each
+name and period, N of each, and the rows of the habits that haven't been
+deleted in sort order, L of them. Last come the names and then the
+periods, encoded as UTF-8 one after another.
+
+Deleted habits are only left out of the sort order, and the rows they
+leave behind are dropped once they outnumber the habits, so a change to
+one habit only moves that habit instead of sorting every habit again. The
+file is only saved again once enough habits changed, since reading the few
+that changed since it was saved is quicker than writing every habit.
+Nothing in the file is ever run, so a file someone else put next to the
+database can at worst make the snapshot wrong until it is made again.
+"""
+
+# Array module to keep the number columns compactly
+from array import array
+
+# Bisect to keep the sort order up to date one habit at a time
+from bisect import bisect_left, insort
+
+# Accumulate to find where each name ends in the snapshot file
+from itertools import accumulate
+
+# Os module to find and replace the snapshot file
+import os
+
+# Json module to read and write the header and names of the snapshot file
+import json
+
+# Sys module to find the byte order the columns are written in
+import sys
+
+# Weakref so a snapshot is forgotten along with its database
+import weakref
+
+# Database module to read habits and the change counter with
+import modules.database as database
+
+# Profiling module to time bringing the snapshot up to date
+import modules.profiling as profiling
+
+# Bump whenever the layout of the snapshot file changes, so old files
+# are rebuilt instead of read
+FORMAT = 3
+
+# Stored instead of a date for habits that were never checked, since the
+# columns can't hold None
+MISSING = -(2 ** 63)
+
+# The number columns of a snapshot, in the order of a record
+NUMBER_COLUMNS = ["ids", "started", "last", "longest", "current"]
+
+# How many habits have to change before the snapshot file is saved again.
+# A file that is behind the database is still used, and only the habits
+# that changed since it was saved are read from the database
+SAVE_AFTER = 1000
+
+# The text columns of a snapshot, which are written as the length of each
+# value followed by every value one after another
+TEXT_COLUMNS = ["names", "periods"]
+
+
+def to_seconds(value) -> int:
+    """
+    Convert a date from the database to the value kept in the columns,
+    MISSING if there is no date
+    """
+    return MISSING if value is None else value
+
+
+def from_seconds(seconds: int):
+    """
+    Convert a value kept in the columns back to a date, None if it is
+    MISSING, the same as the habit class keeps it
+    """
+    return None if seconds == MISSING else seconds
+
+
+class Snapshot:
+    """
+    The habits of a database, kept up to date with the database and saved
+    to a file next to it
+
+    ...
+
+    Methods
+    ---
+    refresh
+        Bring the snapshot up to date with the database
+    records
+        Return the values of the habits sorted by longest streak
+    habits
+        Return habit classes sorted by longest streak
+    names
+        Return the names of the habits sorted by longest streak
+    index_habits
+        Return the indexed habits string and the list of valid habit ids
+
+    Attributes
+    ---
+    db: Database
+        The database the habits are read from
+    path: str
+        The snapshot file, or "" to keep it in memory only
+    """
+
+    def __init__(self, db: database.Database = None, path: str = None):
+        self.db = db or database.db
+        if path is None:
+            path = "" if self.db.path == ":memory:" else self.db.path + ".snapshot"
+        self.path = path
+
+        # The token and change counter of the database when the snapshot
+        # was last brought up to date
+        self._token = None
+        self._version = -1
+
+        # How many habits changed since the snapshot file was saved
+        self._unsaved = 0
+
+        # The data version of the connection when the snapshot was last
+        # checked, so unchanged databases aren't even asked for the counter
+        self._seen = None
+        self._clear()
+
+    def _clear(self):
+        """
+        Forget every habit
+        """
+        self._columns = {name: array("q") for name in NUMBER_COLUMNS}
+        self._columns["names"] = []
+        self._columns["periods"] = []
+        self._positions = {}
+        self._order = array("q")
+
+    def __len__(self) -> int:
+        self.refresh()
+        return len(self._order)
+
+    def _read(self, token: str, version: int):
+        """
+        Read the snapshot file, if there is one made from this database
+        that can be used
+
+        ...
+
+        Parameters
+        ---
+        token: str
+            The token of the database
+        version: int
+            The change counter of the database, which the snapshot can't
+            be ahead of
+        """
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, "rb") as file:
+                header = json.loads(file.readline())
+                if header.get("format") != FORMAT or header.get("byteorder") != sys.byteorder \
+                        or header.get("token") != token or not 0 <= header.get("version") <= version:
+                    return
+                rows, live = header["rows"], header["live"]
+
+                columns = {}
+                for name in [*NUMBER_COLUMNS, *TEXT_COLUMNS]:
+                    columns[name] = array("q")
+                    columns[name].fromfile(file, rows)
+                order = array("q")
+                order.fromfile(file, live)
+                for name in TEXT_COLUMNS:
+                    lengths = columns[name]
+                    text = file.read(header["bytes"][name]).decode()
+                    if (rows and min(lengths) < 0) or sum(lengths) != len(text):
+                        return
+                    ends = list(accumulate(lengths))
+                    columns[name] = [text[end - length:end] for end, length in zip(ends, lengths)]
+
+                if file.read(1) or len(set(order)) != live or (live and not 0 <= min(order) <= max(order) < rows):
+                    return
+        except (OSError, ValueError, TypeError, KeyError, EOFError):
+            # A broken or unreadable snapshot is simply made again
+            return
+
+        self._token, self._version = token, header["version"]
+        self._columns, self._order = columns, order
+        ids = columns["ids"]
+        self._positions = {ids[position]: position for position in order}
+
+    def _write(self):
+        """
+        Replace the snapshot file with this snapshot. The file is written
+        somewhere else first, so no process ever reads half of it
+        """
+        if not self.path:
+            return
+        temporary = f"{self.path}.{os.getpid()}.tmp"
+        columns = self._columns
+        texts = {name: "".join(columns[name]).encode() for name in TEXT_COLUMNS}
+        try:
+            with open(temporary, "wb") as file:
+                file.write(json.dumps({
+                    "format": FORMAT,
+                    "byteorder": sys.byteorder,
+                    "token": self._token,
+                    "version": self._version,
+                    "rows": len(columns["ids"]),
+                    "live": len(self._order),
+                    "bytes": {name: len(text) for name, text in texts.items()}
+                }).encode() + b"\n")
+                for name in NUMBER_COLUMNS:
+                    columns[name].tofile(file)
+                for name in TEXT_COLUMNS:
+                    array("q", map(len, columns[name])).tofile(file)
+                self._order.tofile(file)
+                for text in texts.values():
+                    file.write(text)
+            os.replace(temporary, self.path)
+        except OSError:
+            # The snapshot is only a cache, so it not being saved (e.g. in
+            # a read only folder) just means it is made again next time
+            if os.path.exists(temporary):
+                os.remove(temporary)
+
+    def _key(self, position: int) -> tuple:
+        """
+        What a habit is sorted by, the same as in the database, where
+        habits with the same longest streak are newest first
+        """
+        return -self._columns["longest"][position], -self._columns["ids"][position]
+
+    def _unsort(self, position: int):
+        """
+        Take a habit out of the sort order
+        """
+        order = self._order
+        del order[bisect_left(order, self._key(position), key=self._key)]
+
+    def _compact(self):
+        """
+        Drop the rows deleted habits left behind, keeping the habits in the
+        same order
+        """
+        columns, order = self._columns, self._order
+        for name in [*NUMBER_COLUMNS, "names", "periods"]:
+            column = columns[name]
+            values = [column[position] for position in order]
+            columns[name] = array("q", values) if name in NUMBER_COLUMNS else values
+        self._order = array("q", range(len(order)))
+        self._positions = dict(zip(columns["ids"], self._order))
+
+    def _apply(self, since: int) -> int:
+        """
+        Read every habit that changed after the change counter had this
+        value, or every habit if it is -1, and return how many changed
+        """
+        if since < 0:
+            self._clear()
+
+        columns, positions = self._columns, self._positions
+        deleted = 0
+        if since >= 0:
+            for habit_id in self.db.get_deleted_ids(since):
+                position = positions.pop(habit_id, None)
+                if position is not None:
+                    self._unsort(position)
+                    deleted += 1
+
+        changed = []
+        for habit_id, name, period, started_on, last_checked_on, streak_longest, streak_current in self.db.get_changed_habits(since):
+            values = (habit_id, to_seconds(started_on), to_seconds(last_checked_on),
+                      int(streak_longest), int(streak_current))
+            position = positions.get(habit_id)
+            if position is None:
+                position = positions[habit_id] = len(columns["names"])
+                for column, value in zip(NUMBER_COLUMNS, values):
+                    columns[column].append(value)
+                columns["names"].append(name)
+                columns["periods"].append(period)
+            else:
+                self._unsort(position)
+                for column, value in zip(NUMBER_COLUMNS, values):
+                    columns[column][position] = value
+                columns["names"][position] = name
+                columns["periods"][position] = period
+            changed.append(position)
+
+        if since < 0:
+            self._order = array("q", sorted(changed, key=self._key))
+        else:
+            for position in changed:
+                insort(self._order, position, key=self._key)
+
+        if len(columns["ids"]) > 2 * len(self._order) + 64:
+            self._compact()
+        return deleted + len(changed)
+
+    @profiling.timed("snapshot.refresh")
+    def refresh(self):
+        """
+        Bring the snapshot up to date with the database, reading it from
+        the snapshot file first if it hasn't been read yet, and save it if
+        it was made from scratch or SAVE_AFTER habits changed since it was
+        last saved
+        """
+        seen = self.db.data_version()
+        if seen == self._seen:
+            return
+
+        # The counter is read before the changes, so a change made while
+        # they are being read is read again next time instead of missed
+        version, token = self.db.changes_version()
+        if self._token is None:
+            self._read(token, version)
+        if token != self._token:
+            self._token, self._version = token, -1
+
+        if version != self._version:
+            rebuilt = self._version < 0
+            self._unsaved += self._apply(self._version)
+            self._version = version
+            if rebuilt or self._unsaved >= SAVE_AFTER:
+                self._write()
+                self._unsaved = 0
+        self._seen = seen
+
+    def _positions_in_order(self, period: str = "", limit: int = 0):
+        """
+        The positions of the habits sorted by longest streak
+        """
+        periods = self._columns["periods"]
+        count = 0
+        for position in self._order:
+            if period and periods[position] != period:
+                continue
+            yield position
+            count += 1
+            if count == limit:
+                return
+
+    def records(self, period: str = "", limit: int = 0):
+        """
+        Return an iterator of the values of the habits, in the order
+        Habit.from_record takes them, sorted by descending order of longest
+        streak
+
+        ...
+
+        Parameters
+        ---
+        period: str, optional
+            Return only the habits that have this periodicity
+        limit: int, optional
+            Return at most this many habits
+        """
+        self.refresh()
+        columns = self._columns
+        for position in self._positions_in_order(period, limit):
+            yield (
+                columns["names"][position],
+                columns["periods"][position],
+                from_seconds(columns["started"][position]),
+                from_seconds(columns["last"][position]),
+                columns["longest"][position],
+                columns["current"][position]
+            )
+
+    def habits(self, period: str = "", limit: int = 0):
+        """
+        Return an iterator of habit classes sorted by descending order of
+        longest streak
+
+        ...
+
+        Parameters
+        ---
+        period: str, optional
+            Return only the habits that have this periodicity
+        limit: int, optional
+            Return at most this many habits
+        """
+        # Imported here because habit_class imports the repository, which
+        # imports this module
+        from modules.habit_class import Habit
+
+        for record in self.records(period, limit):
+            if record[2] is None:
+                # Habits without a start date start now, the same as when
+                # the habit class is made from them
+                record = (*record[:2], database.now_seconds(), *record[3:])
+            yield Habit.from_record(*record)
+
+    def names(self) -> list:
+        """
+        Return the names of all habits sorted by descending order of
+        longest streak
+        """
+        self.refresh()
+        names = self._columns["names"]
+        return [names[position] for position in self._positions_in_order()]
+
+    def index_habits(self) -> tuple:
+        """
+        The same as Database.index_habits, from the snapshot
+        """
+        names = self.names()
+        indexed_habits = "".join(
+            f"[{index}] {name}\n" for index, name in enumerate(names))
+        return indexed_habits, [str(index) for index in range(len(names))]
+
+
+# The snapshot of each database, made the first time it is asked for
+_snapshots = weakref.WeakKeyDictionary()
+
+
+def snapshot_of(db: database.Database = None) -> Snapshot:
+    """
+    Return the snapshot of a database, the default one if none is given
+
+    ...
+
+    Parameter
+    ---
+    db: Database, optional
+        The database to return the snapshot of
+    """
+    db = db or database.db
+    snapshot = _snapshots.get(db)
+    if snapshot is None:
+        snapshot = _snapshots[db] = Snapshot(db)
+    return snapshot
@@ -1,7 +1,37 @@
+import asyncio
+import csv
+import io
+import json
+import multiprocessing
+import os
+import shlex
+import socket
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
 import unittest
+from contextlib import redirect_stdout
+from datetime import date, datetime
 
+from modules.console import console
+from modules.habit_class import Habit
+from modules.habit_repository import HabitRepository
 from modules.predef_habits import predefined_habits
+import modules.api as api
+import modules.columnar as columnar
+import modules.daemon as daemon
+import modules.dispatch as dispatch
+import modules.fleet as fleet
 import modules.database as database
+import modules.habit_analysis as habit_analysis
+import modules.habit_manager as habit_manager
+import modules.habit_repository as repository
+import modules.habit_stats as habit_stats
+import modules.profiling as profiling
+import modules.seed as seed
+import modules.snapshot as snapshot
 
 
 class Test(unittest.TestCase):
@@ -113,5 +143,1055 @@ class Test(unittest.TestCase):
         database.add(self.monthly_late)
 
 
+class TestSchema(unittest.TestCase):
+    """
+    Tests:
+        Migrating an old database to the latest schema
+        Using the indexes for lookups and listings
+        Adding, updating and deleting habits in bulk
+        Recording check ins
+        Grouping writes into one transaction
+        Keeping the summary of each period up to date
+        Viewing trends without writing to the database
+    """
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "habits.db")
+
+    def test_migrate_old_database(self):
+        # Make a database the way the first version of the app did,
+        # including a habit that was somehow added twice
+        with sqlite3.connect(self.path) as connection:
+            connection.execute(
+                "CREATE TABLE habits (name text, period text, started_on text, last_checked_on text, streak_longest integer, streak_current integer)")
+            connection.executemany("INSERT INTO habits VALUES (?, ?, ?, ?, ?, ?)", [
+                ("exercise", "day", "2022-07-05 00:00:00", "None", "5", "2"),
+                ("laundry", "week", "2022-08-29 00:00:00", "None", "1", "1"),
+                ("exercise", "day", "2022-07-06 00:00:00", "None", "9", "9")
+            ])
+        connection.close()
+
+        db = database.Database(self.path)
+        self.assertEqual(db.version, database.SCHEMA_VERSION)
+        self.assertEqual(db.count(), 2)
+        self.assertEqual(db.get_habit("exercise"),
+                         ("exercise", "day", database.to_seconds("2022-07-05 00:00:00"), None, 5, 2))
+        db.close()
+
+    def test_migrate_text_dates(self):
+        # Make a database with the schema from before dates were stored as
+        # seconds, with its summary and rollups kept from the text dates
+        with sqlite3.connect(self.path) as connection:
+            for number, migration in enumerate(database.MIGRATIONS[:6], 1):
+                for statement in migration:
+                    connection.execute(statement)
+                connection.execute(f"PRAGMA user_version = {number}")
+            connection.executemany(database.INSERT_HABIT, [
+                ("walk", "day", "2022-07-01 08:00:00", "2022-07-05 21:30:00", 3, 2),
+                ("laundry", "week", "2022-07-02 08:00:00", "None", 0, 0)
+            ])
+            connection.executemany(database.INSERT_CHECKIN, [
+                ("2022-07-04 07:00:00", "walk"), ("2022-07-05 21:30:00", "walk"), ("None", "walk")])
+            tables = ["habit_summary_days", "checkin_rollups", "checkin_rollup_totals"]
+            before = [connection.execute(f"SELECT * FROM {table} ORDER BY 1, 2").fetchall() for table in tables]
+        connection.close()
+
+        db = database.Database(self.path)
+        self.assertEqual(db.get_habits(), [
+            ("walk", "day", database.to_seconds("2022-07-01 08:00:00"),
+             database.to_seconds("2022-07-05 21:30:00"), 3, 2),
+            ("laundry", "week", database.to_seconds("2022-07-02 08:00:00"), None, 0, 0)])
+        self.assertEqual(db.get_checkins("walk"), [database.to_seconds("2022-07-04 07:00:00"),
+                                                   database.to_seconds("2022-07-05 21:30:00")])
+        self.assertEqual([db.connection.execute(f"SELECT * FROM {table} ORDER BY 1, 2").fetchall()
+                          for table in tables], before)
+        self.assertEqual(db.connection.execute("SELECT start FROM checkin_buckets WHERE bucket = 'week'").fetchall(),
+                         [((date(2022, 7, 4) - date(1970, 1, 1)).days,)] * 2)
+        self.assertEqual(db.connection.execute("SELECT start FROM checkin_buckets WHERE bucket = 'month'").fetchall(),
+                         [((date(2022, 7, 1) - date(1970, 1, 1)).days,)] * 2)
+
+        # The triggers keep working on the converted dates
+        db.delete(Habit("walk", "day"))
+        self.assertEqual(db.connection.execute("SELECT * FROM habit_summary_days").fetchall(), [])
+        self.assertEqual(db.get_summary(date(2022, 7, 6))[0]["never_checked"], 1)
+        db.close()
+
+    def test_indexed_queries(self):
+        db = database.Database(self.path)
+        plan = db.connection.execute(
+            "EXPLAIN QUERY PLAN SELECT name FROM habits WHERE period = ? ORDER BY streak_longest DESC", ("day",)).fetchall()
+        self.assertIn("habits_period_longest", plan[0][3])
+        plan = db.connection.execute(
+            "EXPLAIN QUERY PLAN SELECT name FROM habits WHERE name = ?", ("exercise",)).fetchall()
+        self.assertIn("INDEX", plan[0][3])
+        db.close()
+
+    def test_bulk_queries(self):
+        db = database.Database(self.path)
+        habits = [Habit(f"read \"chapter\" {i}'s notes", "day")
+                  for i in range(100)]
+        self.assertEqual(db.add_many(habits), 'added')
+        self.assertEqual(db.count("day"), 100)
+
+        for habit in habits:
+            habit.streak_current = habit.streak_longest = 3
+        self.assertEqual(db.update_many(habits), 'updated')
+        self.assertEqual(db.get_habit(habits[0].name)[4:], (3, 3))
+
+        # Adding a habit that already exists fails the whole batch
+        self.assertIsInstance(db.add_many(
+            [Habit("new habit", "week"), habits[0]]), sqlite3.IntegrityError)
+        self.assertIsNone(db.get_habit("new habit"))
+
+        self.assertEqual(db.delete_many(habits[:50]), 'deleted')
+        self.assertEqual(db.count(), 50)
+        db.close()
+
+    def test_checkins(self):
+        db = database.Database(self.path)
+        habit = Habit("exercise", "day")
+        db.add(habit)
+
+        for streak in range(1, 4):
+            habit.streak_current = habit.streak_longest = streak
+            self.assertEqual(db.check_in(habit), 'checked in')
+        self.assertEqual(len(db.get_checkins("exercise")), 3)
+        self.assertEqual(db.get_habit("exercise")[4:], (3, 3))
+
+        # Deleting a habit deletes its check ins as well
+        db.delete(habit)
+        self.assertEqual(db.connection.execute(
+            "SELECT COUNT(*) FROM checkins").fetchone()[0], 0)
+        db.close()
+
+    def test_transaction(self):
+        db = database.Database(self.path)
+        other = database.Database(self.path)
+        self.assertEqual(db.connection.execute(
+            "PRAGMA journal_mode").fetchone()[0], "wal")
+
+        habits = [Habit(f"habit {i}", "day") for i in range(10)]
+        with db.transaction():
+            db.add_many(habits)
+            for habit in habits:
+                habit.streak_current = habit.streak_longest = 1
+                db.check_in(habit)
+
+            # Nothing is written until the end of the transaction
+            self.assertEqual(other.count(), 0)
+        self.assertEqual(other.count(), 10)
+        self.assertEqual(other.get_habit("habit 0")[4:], (1, 1))
+        self.assertEqual(len(other.get_checkins("habit 9")), 1)
+
+        # If the transaction fails, none of its writes are kept
+        with self.assertRaises(sqlite3.IntegrityError):
+            with db.transaction():
+                db.delete(habits[0])
+                db.add(habits[1])
+        self.assertEqual(other.count(), 10)
+        db.close()
+        other.close()
+
+    def test_summary(self):
+        db = database.Database(self.path)
+        db.add_many([Habit("exercise", "day", "2022-07-01 08:00:00", "2022-07-03 08:00:00", 4, 2),
+                     Habit("laundry", "week", "2022-07-01 08:00:00", "2022-07-01 09:00:00", 1, 1),
+                     Habit("read", "day", "2022-07-01 08:00:00", "2022-07-05 21:00:00", 6, 6),
+                     Habit("walk", "day", "2022-07-01 08:00:00")])
+
+        # The summary matches the status each habit class works out
+        def expected(today):
+            habits = [Habit(*row) for row in db.get_habits()]
+            summaries = {}
+            for habit in habits:
+                habit.days_since_checked = habit.last_checked_on is not None and \
+                    (today - habit.last_checked.date()).days
+                late = habit.last_checked_on is not None and \
+                    habit.days_since_checked > database.LATE_AFTER_DAYS[habit.period]
+                summary = summaries.setdefault(habit.period, [0, 0, 0, 0])
+                summary[0] += 1
+                summary[1] += late
+                summary[2] += habit.last_checked_on is None
+                summary[3] += habit.streak_current
+            return [(period, *summaries[period]) for period in ["day", "week"] if period in summaries]
+
+        def summary(today):
+            return [(summary["period"], summary["habits"], summary["late"], summary["never_checked"],
+                     round(summary["streak_current_average"] * summary["habits"]))
+                    for summary in db.get_summary(today)]
+
+        today = date(2022, 7, 6)
+        self.assertEqual(summary(today), expected(today))
+        self.assertEqual(summary(today)[0], ("day", 3, 1, 1, 8))
+
+        read = Habit(*db.get_habit("read"))
+        read.last_checked_on, read.streak_current = datetime(2022, 7, 6, 7), 7
+        db.check_in(read)
+        db.delete(Habit("laundry", "week"))
+        self.assertEqual(summary(today), expected(today))
+        self.assertEqual(summary(date(2022, 7, 9)), expected(date(2022, 7, 9)))
+        db.close()
+
+    def test_habits_pages(self):
+        db = database.Database(self.path)
+        db.add_many([Habit(f"habit {index}", ["day", "week"][index % 2], streak_longest=streak)
+                     for index, streak in enumerate([2, 5, 2, 2, 0, 5, 2, 1])])
+
+        def pages(period, limit):
+            rows, token = db.get_habits_page(period, limit)
+            while token:
+                yield rows
+                rows, token = db.get_habits_page(period, limit, token)
+            yield rows
+
+        # The pages together are every habit in the same order, with the
+        # habits that share a longest streak split between pages
+        for period in ["", "day", "week"]:
+            for limit in [1, 3, 4, 100]:
+                self.assertEqual([row for page in pages(period, limit) for row in page],
+                                 db.get_habits(period))
+        self.assertEqual([len(page) for page in pages("", 3)], [3, 3, 2])
+
+        # Deleting a habit from an earlier page doesn't shift the next one
+        first, token = db.get_habits_page("", 3)
+        db.delete(Habit(first[0][0], "day"))
+        self.assertEqual(db.get_habits_page("", 3, token)[0], db.get_habits()[2:5])
+
+        with self.assertRaises(ValueError):
+            db.get_habits_page("", 3, "not-a-token")
+        db.close()
+
+    def test_rollups(self):
+        db = database.Database(self.path)
+        db.add_many([Habit("exercise", "day", "2022-07-01 08:00:00"),
+                     Habit("read", "day", "2022-07-01 08:00:00")])
+        for name, checked_on in [("exercise", datetime(2022, 7, 3, 8)), ("exercise", datetime(2022, 7, 4, 23)),
+                                 ("exercise", datetime(2022, 8, 1, 7)), ("read", datetime(2022, 7, 4, 9))]:
+            habit = Habit(*db.get_habit(name))
+            habit.last_checked_on = checked_on
+            db.check_in(habit)
+
+        # Day numbers since 1970-01-01, where 2022-07-04 is a monday
+        july_3, july_4, august_1 = 19176, 19177, 19205
+        june_27 = july_3 - 6
+        self.assertEqual(db.get_trend("day", 0), [(july_3, 1), (july_4, 2), (august_1, 1)])
+        self.assertEqual(db.get_trend("week", 0), [(june_27, 1), (july_4, 2), (august_1, 1)])
+        self.assertEqual(db.get_trend("month", july_3, "exercise"), [(august_1, 1)])
+        self.assertEqual(db.get_trend("month", 0, "exercise"), [(july_3 - 2, 2), (august_1, 1)])
+
+        # Making them again a chunk at a time gives the same rollups
+        trends = {bucket: db.get_trend(bucket, 0) for bucket in database.BUCKETS}
+        db.reset_rollups()
+        self.assertEqual(db.rollups_pending(), 4)
+        self.assertEqual(db.backfill_rollups(chunk_size=3), 4)
+        self.assertEqual(db.rollups_pending(), 0)
+        self.assertEqual({bucket: db.get_trend(bucket, 0) for bucket in database.BUCKETS}, trends)
+
+        db.delete(Habit("exercise", "day"))
+        self.assertEqual(db.get_trend("day", 0), [(july_4, 1)])
+        db.close()
+
+    def test_trend_does_not_backfill(self):
+        db = database.Database(self.path)
+        db.add(Habit("exercise", "day", "2022-07-01 08:00:00"))
+        habit = Habit(*db.get_habit("exercise"))
+        habit.last_checked_on = datetime(2022, 7, 3, 8)
+        db.check_in(habit)
+        db.reset_rollups()
+
+        # Viewing the trend only reads, and says how to add what's missing
+        default, database.db = database.db, db
+        try:
+            with console.capture() as capture:
+                habit_analysis.show_trend(bucket="day", last=1)
+        finally:
+            database.db = default
+        self.assertIn("backfill trends", capture.get())
+        self.assertEqual(db.rollups_pending(), 1)
+        db.close()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+
+class TestRepository(unittest.TestCase):
+    """
+    Tests:
+        Looking up habits by name and period
+        Keeping the repository in sync with the database
+    """
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.db = database.Database(
+            os.path.join(self.directory.name, "habits.db"))
+        self.db.add_many([Habit("exercise", "day"), Habit("laundry", "week")])
+        self.habits = HabitRepository(self.db)
+
+    def test_lookup(self):
+        # Looking up one habit doesn't read the others
+        self.assertEqual(self.habits.get("exercise").period, "day")
+        self.assertNotIn("laundry", self.habits._by_name)
+        self.assertIsNone(self.habits.get("read"))
+
+        self.assertEqual(len(self.habits), 2)
+        self.assertEqual(self.habits.names("week"), {"laundry"})
+        self.assertIs(self.habits.get("exercise"),
+                      self.habits.get("exercise"))
+
+    def test_sync(self):
+        self.habits.load()
+        self.assertEqual(self.habits.add(Habit("read", "day")), 'added')
+        self.assertIn("read", self.habits)
+        self.assertEqual(self.habits.names("day"), {"exercise", "read"})
+
+        self.assertEqual(self.habits.delete(
+            self.habits.get("exercise")), 'deleted')
+        self.assertNotIn("exercise", self.habits)
+        self.assertIsNone(self.db.get_habit("exercise"))
+
+        habit = self.habits.get("laundry")
+        habit.streak_current = habit.streak_longest = 4
+        self.assertEqual(self.habits.check_in(habit), 'checked in')
+        self.assertEqual(self.db.get_habit("laundry")[4:], (4, 4))
+
+    def test_top_longest(self):
+        for name, period, streak_longest in [("read", "day", 5), ("walk", "day", 7),
+                                              ("swim", "week", 5), ("cook", "day", 5)]:
+            habit = Habit(name, period)
+            habit.streak_longest = streak_longest
+            self.habits.add(habit)
+
+        self.assertEqual(self.db.top_longest(2), [("walk", "day", 7), ("cook", "day", 5)])
+        self.assertEqual(self.db.count_longest(5), 3)
+        self.assertEqual(self.db.count_longest(5, "day"), 2)
+
+        # The heap over the habits in memory ranks them the same way
+        self.habits.load()
+        self.assertEqual([habit.streak_longest for habit in self.habits.top_longest(3, "day")], [7, 5, 5])
+        self.assertEqual(self.habits.count_longest(5), 3)
+        self.assertEqual(self.habits.count_longest(0, "week"), 1)
+
+    def tearDown(self):
+        self.db.close()
+        self.directory.cleanup()
+
+
+class TestMarkMany(unittest.TestCase):
+    """
+    Tests:
+        Reading habit names from files and stdin
+        Marking many habits as done in one transaction
+        Leaving habits in memory as they were when a write fails
+    """
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.db = database.Database(os.path.join(self.directory.name, "habits.db"))
+        self.db.add_many([Habit("exercise", "day", "2022-07-01 08:00:00", datetime.today(), 3, 3),
+                          Habit("read", "day", "2022-07-01 08:00:00", "2022-07-02 08:00:00", 2, 2)])
+
+        # mark_many and the habit classes use the default repository
+        self.default_db = repository.habits.db
+        repository.habits.db = self.db
+        repository.habits.clear()
+
+    def test_read_names(self):
+        path = os.path.join(self.directory.name, "names.txt")
+        with open(path, "w") as file:
+            file.write("exercise\n\n  read  \n\n")
+        self.assertEqual(habit_manager.read_names(path), ["exercise", "read"])
+
+        stdin = sys.stdin
+        sys.stdin = io.StringIO("walk\n \nrun")
+        try:
+            self.assertEqual(habit_manager.read_names("-"), ["walk", "run"])
+        finally:
+            sys.stdin = stdin
+
+    def test_mark_many(self):
+        statements = []
+        self.db.connection.set_trace_callback(statements.append)
+        self.assertEqual(habit_manager.mark_many(["exercise", "read", "swim", "exercise"]),
+                         (["exercise"], ["read"], ["swim"], []))
+        self.db.connection.set_trace_callback(None)
+        self.assertEqual(statements.count("BEGIN IMMEDIATE"), 1)
+        self.assertEqual([self.db.get_habit(name)[4:] for name in ["exercise", "read"]], [(4, 4), (2, 1)])
+
+        # When the commit fails nothing is kept and every habit failed
+        self.db.connection.execute(
+            "CREATE TEMP TRIGGER fail BEFORE INSERT ON checkins BEGIN SELECT RAISE(ABORT, 'disk full'); END")
+        checked, restarted, missing, failed = habit_manager.mark_many(["exercise", "read"])
+        self.assertEqual((checked, restarted, missing), ([], [], []))
+        self.assertEqual([(name, str(error)) for name, error in failed],
+                         [("exercise", "disk full"), ("read", "disk full")])
+        self.assertEqual([self.db.get_habit(name)[4:] for name in ["exercise", "read"]], [(4, 4), (2, 1)])
+
+    def test_failed_write(self):
+        habit = repository.habits.get("exercise")
+        before = (habit.streak_current, habit.streak_longest, habit.last_checked_on)
+        self.db.connection.execute(
+            "CREATE TEMP TRIGGER fail BEFORE INSERT ON checkins BEGIN SELECT RAISE(ABORT, 'disk full'); END")
+        self.assertIsInstance(habit.mark_as_done(quiet=True), sqlite3.Error)
+
+        # The habit kept by the repository still matches the database
+        self.assertIs(repository.habits.get("exercise"), habit)
+        self.assertEqual((habit.streak_current, habit.streak_longest, habit.last_checked_on), before)
+        self.assertEqual(self.db.get_habit("exercise")[3:], (before[2], before[1], before[0]))
+
+    def tearDown(self):
+        repository.habits.db = self.default_db
+        repository.habits.clear()
+        self.db.close()
+        self.directory.cleanup()
+
+
+class TestSnapshot(unittest.TestCase):
+    """
+    Tests:
+        Keeping the snapshot in step with changes made by other connections
+    """
+
+    def test_changes(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "habits.db")
+            writer = database.Database(path)
+            writer.add_many([Habit("exercise", "day"), Habit("laundry", "week"),
+                             Habit("read", "day")])
+
+            def rows(db):
+                return list(snapshot.Snapshot(db).records())
+
+            reader = database.Database(path)
+            self.assertEqual(rows(reader), writer.get_habits())
+            self.assertTrue(os.path.exists(path + ".snapshot"))
+
+            # Only the changed habits are read again
+            cached = snapshot.Snapshot(reader)
+            cached.refresh()
+            habit = Habit(*writer.get_habit("laundry"))
+            habit.streak_current = habit.streak_longest = 9
+            writer.check_in(habit)
+            writer.delete(Habit("exercise", "day"))
+            writer.add(Habit("walk", "month"))
+            self.assertEqual(len(list(writer.get_changed_habits(cached._version))), 2)
+            self.assertEqual(cached.names(), ["laundry", "walk", "read"])
+            self.assertEqual(rows(reader), writer.get_habits())
+            self.assertEqual(cached.index_habits()[1], ["0", "1", "2"])
+
+            # A few changes aren't saved, and are read again by the next
+            # snapshot made from the file
+            with open(path + ".snapshot", "rb") as file:
+                self.assertLess(json.loads(file.readline())["version"], cached._version)
+            saved = snapshot.Snapshot(reader)
+            self.assertEqual(saved.names(), cached.names())
+            self.assertEqual(saved._unsaved, 3)
+
+            # A different database in the same place is read from scratch
+            writer.close()
+            reader.close()
+            os.remove(path)
+            database.Database(path).add(Habit("swim", "day"))
+            self.assertEqual(snapshot.Snapshot(database.Database(path)).names(), ["swim"])
+
+    def test_untrusted_file(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "habits.db")
+            db = database.Database(path)
+            db.add_many([Habit("exercise", "day"), Habit("read", "day")])
+            snapshot.Snapshot(db).refresh()
+            with open(path + ".snapshot", "rb") as file:
+                header, rest = file.readline(), file.read()
+
+            # Files that aren't snapshots, are cut short or were made from
+            # another database are made again instead of read
+            token = json.loads(header)["token"]
+            for contents in [b"\x80\x04K\x01.", header + rest[:-8],
+                             header.replace(token.encode(), b"0" * len(token)) + rest]:
+                with open(path + ".snapshot", "wb") as file:
+                    file.write(contents)
+                cached = snapshot.Snapshot(db)
+                self.assertEqual(cached.names(), ["read", "exercise"])
+                with open(path + ".snapshot", "rb") as file:
+                    self.assertEqual(file.readline(), header)
+            db.close()
+
+
+class TestColumnar(unittest.TestCase):
+    """
+    Tests:
+        Exporting habits and check ins and reading them back
+        Closing every file when an export fails
+    """
+
+    def test_export(self):
+        with tempfile.TemporaryDirectory() as directory:
+            db = database.Database(os.path.join(directory, "habits.db"))
+            db.add_many([Habit("exercise", "day", "2022-07-01 08:00:00"),
+                         Habit("über \"read\"", "week", "2022-07-02 08:00:00"),
+                         Habit("laundry", "month", "2022-07-03 08:00:00")])
+            for name, day in [("laundry", 4), ("exercise", 5), ("exercise", 3)]:
+                habit = Habit(*db.get_habit(name))
+                habit.last_checked_on, habit.streak_current = datetime(2022, 7, day, 9), day
+                db.check_in(habit)
+            db.delete(Habit("exercise", "day"))
+            db.add(Habit("exercise", "day", "2022-07-06 08:00:00"))
+
+            path = os.path.join(directory, "habits.columnar")
+            columnar.write_export(path, db)
+            columnar.write_export(path, db)
+            export = columnar.open_export(path)
+
+            july_1 = 19174
+            self.assertEqual([export.name(row) for row in range(len(export))],
+                             ["über \"read\"", "laundry", "exercise"])
+            self.assertEqual([export.period(row) for row in range(len(export))], ["week", "month", "day"])
+            self.assertEqual(export.habits["started_on"].tolist(), [july_1 + 1, july_1 + 2, july_1 + 5])
+            self.assertEqual(export.habits["last_checked_on"].tolist(), [export.missing, july_1 + 3, export.missing])
+            self.assertEqual(export.habits["streak_current"].tolist(), [0, 4, 0])
+            self.assertEqual(export.checkins["habit"].tolist(), [1])
+            self.assertEqual(export.checkins_of(1).tolist(), [july_1 + 3])
+            self.assertEqual(export.checkins_of(2).tolist(), [])
+            db.close()
+
+    def test_failed_export(self):
+        with tempfile.TemporaryDirectory() as directory:
+            db = database.Database(os.path.join(directory, "habits.db"))
+            db.add(Habit("exercise", "day", "2022-07-01 08:00:00"))
+            path = os.path.join(directory, "habits.columnar")
+            columnar.write_export(path, db)
+
+            # Keep every column file that is opened, to check they are closed
+            opened = []
+
+            class ColumnFile(columnar._ColumnFile):
+                def __init__(self, *args):
+                    super().__init__(*args)
+                    opened.append(self)
+
+            def fail():
+                raise sqlite3.OperationalError("disk I/O error")
+
+            default, columnar._ColumnFile = columnar._ColumnFile, ColumnFile
+            db.get_checkin_days = fail
+            try:
+                with self.assertRaises(sqlite3.OperationalError):
+                    columnar.write_export(path, db)
+            finally:
+                columnar._ColumnFile = default
+
+            self.assertEqual(len(opened), len(columnar.HABIT_COLUMNS) + len(columnar.CHECKIN_COLUMNS) + 1)
+            self.assertTrue(all(column.file.closed for column in opened))
+
+            # The export from before is left as it was
+            self.assertEqual([file for file in os.listdir(directory) if file.startswith("habits.columnar")],
+                             ["habits.columnar"])
+            self.assertEqual(columnar.open_export(path).name(0), "exercise")
+            db.close()
+
+
+def mark_done_many_times(path: str, name: str, times: int, start):
+    """
+    Mark a habit as done over and over from its own connection, each time
+    from a habit class made before, so its streak is always out of date
+    """
+    db = database.Database(path, busy_timeout=30)
+    habit = Habit(*db.get_habit(name))
+    start.wait()
+    for _ in range(times):
+        stale = Habit(*db.get_habit(name))
+        response = db.mark_done(habit)
+        assert response == "checked", response
+        habit = stale
+    db.close()
+
+
+class TestConcurrency(unittest.TestCase):
+    """
+    Tests:
+        Marking the same habit as done from many processes at once
+    """
+
+    def test_mark_done_from_many_processes(self):
+        processes = int(os.environ.get("STRESS_PROCESSES", 8))
+        times = int(os.environ.get("STRESS_TIMES", 50))
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "habits.db")
+            db = database.Database(path)
+            db.add_many([Habit("exercise", "day"), Habit("read", "day")])
+
+            start = multiprocessing.Event()
+            workers = [multiprocessing.Process(target=mark_done_many_times, args=(path, "exercise", times, start))
+                       for _ in range(processes)]
+            for worker in workers:
+                worker.start()
+            start.set()
+            for worker in workers:
+                worker.join(120)
+            self.assertEqual([worker.exitcode for worker in workers], [0] * processes)
+
+            # Every mark was counted, however out of date its habit class was
+            _, _, _, _, streak_longest, streak_current = db.get_habit("exercise")
+            self.assertEqual((streak_current, streak_longest), (processes * times, processes * times))
+            self.assertEqual(len(db.get_checkins("exercise")), processes * times)
+            self.assertEqual(db.get_summary()[0]["streak_current_average"], processes * times / 2)
+            db.close()
+
+
+class TestFleet(unittest.TestCase):
+    """
+    Tests:
+        Merging the summaries of many databases read by a process pool
+    """
+
+    def test_fleet_summary(self):
+        with tempfile.TemporaryDirectory() as directory:
+            today = date(2022, 7, 6)
+            expected = {}
+            for user, streaks in enumerate([[3, 9], [5], [], [7, 1, 9]]):
+                os.makedirs(os.path.join(directory, str(user)))
+                db = database.Database(os.path.join(directory, str(user), "habits.db"))
+                db.add_many([Habit(f"habit {index}", ["day", "week"][index % 2], "2022-07-01 08:00:00",
+                                   f"2022-07-0{index + 1} 08:00:00" if index else "None", streak, 1)
+                             for index, streak in enumerate(streaks)])
+                for summary in db.get_summary(today):
+                    totals = expected.setdefault(summary["period"], [0, 0, 0])
+                    totals[0] += summary["habits"]
+                    totals[1] += summary["late"]
+                    totals[2] += summary["never_checked"]
+                db.close()
+            with open(os.path.join(directory, "notes.db"), "w") as file:
+                file.write("not a database" * 100)
+
+            paths = fleet.find_databases([os.path.join(directory, "**", "*.db")])
+            self.assertEqual(len(paths), 5)
+            summary = fleet.fleet_summary(paths, top=3, workers=2, today=today)
+            self.assertEqual(summary["databases"], 4)
+            self.assertEqual([path for path, _ in summary["failed"]], [os.path.join(directory, "notes.db")])
+            self.assertEqual({period: [totals["habits"], totals["late"], totals["never_checked"]]
+                              for period, totals in summary["periods"].items()}, expected)
+            self.assertEqual([habit[0] for habit in summary["longest"]], [9, 9, 7])
+
+
+class TestSeed(unittest.TestCase):
+    """
+    Tests:
+        Seeding databases with reproducible synthetic habits and check ins
+    """
+
+    def test_seed(self):
+        with tempfile.TemporaryDirectory() as directory:
+            now = datetime(2022, 7, 6, 12, 0, 0)
+            paths = [os.path.join(directory, f"{name}.db") for name in ["first", "second"]]
+            database.Database(paths[1]).add(Habit("walk", "day", "2022-07-01 08:00:00", "2022-07-05 08:00:00", 2, 2))
+            for path in paths:
+                result = seed.seed_database(path, 300, seed=4, history=True, now=now)
+                self.assertEqual(result["habits"], 300)
+                self.assertGreater(result["checkins"], 300)
+
+            first, second = (database.Database(path) for path in paths)
+            habits = first.connection.execute(f"SELECT {database.HABIT_COLUMNS} FROM habits ORDER BY id").fetchall()
+            self.assertEqual(habits, second.connection.execute(
+                f"SELECT {database.HABIT_COLUMNS} FROM habits WHERE name != 'walk' ORDER BY id").fetchall())
+            self.assertTrue(all(started_on <= database.to_seconds(now) and last_checked_on <= database.to_seconds(now)
+                                and longest >= current
+                                for _, _, started_on, last_checked_on, longest, current in habits
+                                if last_checked_on is not None))
+
+            # The triggers and indexes are back and everything they keep
+            # up to date matches the habits and check ins
+            for db in [first, second]:
+                self.assertEqual(db.count(), len(db.get_habits()))
+                self.assertEqual(sum(row["habits"] - row["never_checked"] for row in db.get_summary(now.date())),
+                                 db.connection.execute(
+                                     "SELECT COUNT(*) FROM habits WHERE last_checked_on IS NOT NULL").fetchone()[0])
+                self.assertEqual(db.backfill_rollups(), result["checkins"])
+                self.assertEqual(sum(completions for _, completions in db.get_trend("day", 0)), db.connection.execute(
+                    "SELECT COUNT(*) FROM checkins").fetchone()[0])
+                self.assertIn("habits_longest", [row[0] for row in db.connection.execute(
+                    "SELECT name FROM sqlite_master WHERE type = 'index'")])
+            version = first.changes_version()[0]
+            first.add(Habit("run", "day"))
+            self.assertEqual(first.changes_version()[0], version + 1)
+            self.assertEqual(first.count("day"), len(first.get_habits("day")))
+
+            # Seeding the same habits again adds none of them
+            with self.assertRaises(sqlite3.IntegrityError):
+                seed.seed_database(paths[0], 300, seed=4, now=now)
+            self.assertEqual(first.count(), 301)
+
+            # A database that already has habits is left alone without --force
+            with redirect_stdout(io.StringIO()) as output:
+                seed.seed_habits(10, paths[0], seed=5)
+            self.assertIn("--force", output.getvalue())
+            self.assertEqual(first.count(), 301)
+            first.close()
+            second.close()
+
+
+class TestOutput(unittest.TestCase):
+    """
+    Tests:
+        Writing habits in machine readable formats as they are read
+        Printing the command that shows the next page
+    """
+
+    def test_formats(self):
+        july_1, july_2 = database.to_seconds("2022-07-01 08:00:00"), database.to_seconds("2022-07-02 08:00:00")
+        rows = [("walk", "day", july_1, None, 3, 1),
+                ("say \"hi\", then\tleave", "week", july_1, july_2, 1, 1)]
+
+        def write(format):
+            output = io.StringIO()
+            with redirect_stdout(output):
+                habit_analysis.write_rows(habit_analysis.HABIT_FIELDS,
+                                          habit_analysis.habit_values(iter(rows)), format)
+            return output.getvalue()
+
+        self.assertEqual([json.loads(line)["last_checked_on"] for line in write("jsonl").splitlines()],
+                         [None, "2022-07-02 08:00:00"])
+        self.assertEqual(list(csv.reader(io.StringIO(write("csv"))))[2][0], rows[1][0])
+        self.assertEqual(list(csv.reader(io.StringIO(write("tsv")), delimiter="\t")),
+                         [habit_analysis.HABIT_FIELDS,
+                          ["walk", "day", "2022-07-01 08:00:00", "", "3", "1"],
+                          [rows[1][0], "week", "2022-07-01 08:00:00", "2022-07-02 08:00:00", "1", "1"]])
+
+    def test_next_page_command(self):
+        # Pasted into a shell, it runs the same command with the same options
+        self.assertEqual(shlex.split(habit_analysis.next_page_command("day", 50, "MzoxMg", "csv")),
+                         ["show habits", "--period=day", "--format=csv", "--after=MzoxMg", "--limit=50"])
+        self.assertEqual(shlex.split(habit_analysis.next_page_command("", 50, "MzoxMg")),
+                         ["show habits", "--after=MzoxMg", "--limit=50"])
+
+
+class TestDispatch(unittest.TestCase):
+    """
+    Tests:
+        Parsing command line arguments without fire
+    """
+
+    def test_parse_args(self):
+        self.assertEqual(dispatch.parse_args(["walk", "--limit=3", "--period", "day", "--verbose"]),
+                         (["walk"], {"limit": 3, "period": "day", "verbose": True}))
+        self.assertEqual(dispatch.parse_args(["--name", "a", "--name=b", "--name=[c,d]"]),
+                         ([], {"name": ["a", "b", "c", "d"]}))
+        self.assertEqual(dispatch.parse_args(["--from-file", "-"]), ([], {"from_file": "-"}))
+        self.assertEqual(dispatch.parse_args(["-"]), (["-"], {}))
+        self.assertIsNone(dispatch.parse_args(["-x"]))
+
+
+class TestDaemon(unittest.TestCase):
+    """
+    Tests:
+        Deciding which commands can be sent to the server
+    """
+
+    def test_needs_prompt(self):
+        self.assertTrue(daemon.needs_prompt(["create habit", "--name=run"]))
+        self.assertFalse(daemon.needs_prompt(
+            ["create habit", "--name=run", "--period=day"]))
+        self.assertTrue(daemon.needs_prompt(["delete habit"]))
+        self.assertFalse(daemon.needs_prompt(["delete habit", "run"]))
+        self.assertTrue(daemon.needs_prompt(["mark done"]))
+        self.assertTrue(daemon.needs_prompt(["mark done", "--from-file=-"]))
+        self.assertTrue(daemon.needs_prompt(["mark done", "--from-file", "-"]))
+        self.assertTrue(daemon.needs_prompt(["mark done", "-"]))
+        self.assertFalse(daemon.needs_prompt(["mark done", "--from-file", "names.txt"]))
+        self.assertFalse(daemon.needs_prompt(["mark done", "run", "walk"]))
+        self.assertFalse(daemon.needs_prompt(["show habits"]))
+
+    def test_streams(self):
+        self.assertTrue(daemon.streams(["show habits", "--format=csv"]))
+        self.assertTrue(daemon.streams(["longest streak", "--format", "jsonl"]))
+        self.assertFalse(daemon.streams(["show habits", "--format=table"]))
+        self.assertFalse(daemon.streams(["show habits", "--period=day"]))
+
+    def test_forward_without_server(self):
+        with tempfile.TemporaryDirectory() as directory:
+            self.assertFalse(daemon.forward(
+                ["show habits"], os.path.join(directory, "habits.sock")))
+
+    def test_forward_exit_code(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "habits.sock")
+            with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as server:
+                server.bind(path)
+                server.listen(1)
+
+                # A server that answers one request with a failed command
+                def answer():
+                    connection, _ = server.accept()
+                    with connection, connection.makefile("rwb") as stream:
+                        stream.readline()
+                        stream.write(json.dumps({"output": "failed\n", "exit_code": 2}).encode() + b"\n")
+                thread = threading.Thread(target=answer)
+                thread.start()
+
+                output = io.StringIO()
+                with redirect_stdout(output), self.assertRaises(SystemExit) as exit:
+                    daemon.forward(["show habits"], path)
+                thread.join()
+            self.assertEqual(exit.exception.code, 2)
+            self.assertEqual(output.getvalue(), "failed\n")
+
+
+class TestAPI(unittest.TestCase):
+    """
+    Tests:
+        Rejecting requests that don't match a route
+        Marking habits as done, and answering when the write fails
+    """
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        path = os.path.join(self.directory.name, "habits.db")
+        setup = database.Database(path)
+        setup.add(Habit("walk", "day"))
+        setup.close()
+
+        # The writer thread of the API uses the default database and
+        # repository, so they are pointed at this database until the end
+        self.default_db = database.db
+        database.db = repository.habits.db = database.Database(path)
+        repository.habits.clear()
+
+    def test_route_errors(self):
+        habit_api = api.HabitAPI(readers=1)
+        for method, target, status in [
+            ("GET", "/nothing", 404),
+            ("PUT", "/habits", 405),
+            ("GET", "/habits?limit=ten", 400),
+            ("GET", f"/habits?limit={api.MAX_LIMIT + 1}", 400),
+            ("GET", "/longest?limit=-1", 400),
+            ("GET", "/habits?period=year", 400),
+            ("GET", "/habits?after=not-a-token", 400),
+            ("POST", "/habits", 400)
+        ]:
+            with self.assertRaises(api.HTTPError) as error:
+                asyncio.run(api.route(habit_api, method, target, b""))
+            self.assertEqual(error.exception.status, status)
+        habit_api.close()
+
+    def test_mark_done(self):
+        habit_api = api.HabitAPI(readers=1)
+        try:
+            status, data = asyncio.run(api.route(habit_api, "POST", "/habits/walk/done", b""))
+            self.assertEqual((status, data["result"], data["habit"]["streak_current"]), (200, "checked", 1))
+
+            # A write that fails is answered with its error, and the
+            # connection keeps answering requests
+            repository.habits.mark_done = lambda habit: sqlite3.OperationalError("database is locked")
+
+            async def request() -> bytes:
+                server = await asyncio.start_server(
+                    lambda reader, writer: api.handle(habit_api, reader, writer), "127.0.0.1", 0)
+                try:
+                    reader, writer = await asyncio.open_connection(*server.sockets[0].getsockname()[:2])
+                    writer.write(b"POST /habits/walk/done HTTP/1.1\r\n\r\n"
+                                 b"GET /habits/walk HTTP/1.1\r\nConnection: close\r\n\r\n")
+                    await writer.drain()
+                    response = await reader.read()
+                    writer.close()
+                    return response
+                finally:
+                    server.close()
+
+            response = asyncio.run(request())
+            self.assertTrue(response.startswith(b"HTTP/1.1 500 Internal Server Error\r\n"), response)
+            self.assertIn(b'{"error": "database is locked"}', response)
+            self.assertIn(b"HTTP/1.1 200 OK\r\n", response)
+            self.assertIn(b'"streak_current": 1', response)
+        finally:
+            del repository.habits.mark_done
+            habit_api.close()
+
+    def test_bad_content_length(self):
+        async def request(content_length: str) -> bytes:
+            habit_api = api.HabitAPI(readers=1)
+            server = await asyncio.start_server(
+                lambda reader, writer: api.handle(habit_api, reader, writer), "127.0.0.1", 0)
+            try:
+                reader, writer = await asyncio.open_connection(*server.sockets[0].getsockname()[:2])
+                writer.write(f"POST /habits HTTP/1.1\r\nContent-Length: {content_length}\r\n\r\n".encode())
+                await writer.drain()
+                response = await reader.read()
+                writer.close()
+                return response
+            finally:
+                server.close()
+                habit_api.close()
+
+        # The request is answered and the connection closed, since where
+        # the next request starts can't be known
+        for content_length in ["-5", "ten", str(api.MAX_BODY + 1)]:
+            response = asyncio.run(request(content_length))
+            self.assertTrue(response.startswith(b"HTTP/1.1 400 Bad Request\r\n"), response)
+            self.assertIn(b"Connection: close\r\n", response)
+
+    def tearDown(self):
+        # The connection belongs to the writer thread, so it is only
+        # dropped here, not closed
+        database.db = repository.habits.db = self.default_db
+        repository.habits.clear()
+        self.directory.cleanup()
+
+
+def record_many_times(path: str, times: int, start):
+    """
+    Record the latency of a command over and over, racing other processes
+    that are updating the same metrics file
+    """
+    start.wait()
+    for _ in range(times):
+        profiling.record_command("mark done", 0.001, path)
+
+
+class TestProfiling(unittest.TestCase):
+    """
+    Tests:
+        Timing spans and writing command latencies as metrics
+        Updating the metrics file from many processes at once
+    """
+
+    def test_spans_and_metrics(self):
+        self.assertEqual(profiling.parse_flag(["show habits", "--profile=out", "--limit=1"]),
+                         (["show habits", "--limit=1"], "out"))
+        self.assertEqual(profiling.parse_flag(["show habits"]), (["show habits"], None))
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "habits.prom")
+            for elapsed in [0.003, 0.2]:
+                profiling.start()
+                with profiling.span("work"):
+                    pass
+                profiling.stop()
+                profiling.record_command("mark done", elapsed, path)
+
+            # Spans are not recorded while profiling is off
+            with profiling.span("work"):
+                pass
+            self.assertEqual(profiling.spans["work"][0], 1)
+
+            with open(path) as file:
+                metrics = file.read()
+        self.assertIn("# TYPE habits_command_duration_seconds histogram", metrics)
+        self.assertIn('habits_command_duration_seconds_bucket{command="mark done",le="0.005"} 1\n', metrics)
+        self.assertIn('habits_command_duration_seconds_bucket{command="mark done",le="+Inf"} 2\n', metrics)
+        self.assertIn('habits_command_duration_seconds_count{command="mark done"} 2\n', metrics)
+        self.assertIn('habits_span_calls_total{command="mark done",span="work"} 2\n', metrics)
+
+    def test_metrics_from_many_processes(self):
+        processes, times = 4, 25
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "habits.prom")
+            start = multiprocessing.Event()
+            workers = [multiprocessing.Process(target=record_many_times, args=(path, times, start))
+                       for _ in range(processes)]
+            for worker in workers:
+                worker.start()
+            start.set()
+            for worker in workers:
+                worker.join(60)
+            self.assertEqual([worker.exitcode for worker in workers], [0] * processes)
+
+            # No update was lost and no temporary files were left behind
+            with open(path) as file:
+                metrics = file.read()
+            self.assertIn(f'habits_command_duration_seconds_count{{command="mark done"}} {processes * times}\n',
+                          metrics)
+            self.assertEqual(sorted(os.listdir(directory)), ["habits.prom", "habits.prom.lock"])
+
+
+class TestStartup(unittest.TestCase):
+    """
+    Tests:
+        Importing only what "mark done" needs when the app starts
+    """
+
+    # The most time importing modules can take when marking a habit as
+    # done, in milliseconds. Can be changed with STARTUP_BUDGET_MS for
+    # slower machines
+    budget = float(os.environ.get("STARTUP_BUDGET_MS", 250))
+
+    def test_mark_done_startup(self):
+        app = os.path.dirname(os.path.abspath(__file__))
+        with tempfile.TemporaryDirectory() as directory:
+            db = database.Database(os.path.join(directory, "habits.db"))
+            db.add(Habit("exercise", "day"))
+            db.close()
+
+            result = subprocess.run(
+                [sys.executable, "-X", "importtime", app,
+                    "mark done", "--name=exercise"],
+                cwd=directory, capture_output=True, text=True)
+
+        # Each line is "import time: self | cumulative | name", with the
+        # name indented under the module that imported it
+        imported = {}
+        for line in result.stderr.splitlines():
+            if line.startswith("import time:") and "|" in line:
+                _, cumulative, name = line.split("|")
+                if cumulative.strip().isdigit():
+                    imported[name.strip()] = (name, int(cumulative))
+        total = sum(cumulative for name, cumulative in imported.values()
+                    if not name[1:].startswith(" ")) / 1000
+
+        self.assertIn("Successfully marked", result.stdout)
+        for module in ["fire", "numpy", "asyncio", "modules.predef_habits", "modules.habit_analysis", "rich.table"]:
+            self.assertNotIn(module, imported)
+        self.assertLess(total, self.budget)
+
+
+class TestStats(unittest.TestCase):
+    """
+    Tests:
+        Working out streaks, gaps and completion rates from check ins
+    """
+
+    def test_compute_stats(self):
+        # A daily habit checked on days 0, 1, 2, 5, 5 and 6, a weekly
+        # habit checked in weeks 0, 1 and 3, and a monthly habit that
+        # was never checked
+        stats = habit_stats.compute_stats(
+            codes=[0, 1, 2],
+            started=[0, 0, 0],
+            checkin_habits=[0, 0, 0, 0, 0, 0, 1, 1, 1, 1],
+            checkin_days=[0, 1, 2, 5, 5, 6, 0, 4, 5, 18],
+            today=21,
+            window=4)
+
+        self.assertEqual(list(stats["checkins"]), [6, 4, 0])
+        self.assertEqual(list(stats["completed"]), [5, 3, 0])
+        self.assertEqual(list(stats["streak_longest"]), [3, 2, 0])
+
+        # The daily habit was last checked on day 6, so its streak broke
+        self.assertEqual(list(stats["streak_current"]), [0, 1, 0])
+        self.assertEqual(list(stats["max_gap"]), [3, 13, 0])
+        self.assertAlmostEqual(stats["completion_rate"][1], 3 / 4)
+        self.assertAlmostEqual(stats["adherence"][1], 3 / 4)
+        self.assertEqual(stats["adherence"][0], 0)
+        self.assertEqual(stats["gap_distribution"][1], 4)
+
+    def test_same_period(self):
+        # A daily habit checked three times on day 6 and a weekly habit
+        # checked on days 4 and 6 of week 1, both still going today
+        stats = habit_stats.compute_stats(
+            codes=[0, 1],
+            started=[0, 0],
+            checkin_habits=[0, 0, 0, 1, 1],
+            checkin_days=[6, 6, 6, 4, 6],
+            today=6,
+            window=4)
+
+        self.assertEqual(list(stats["checkins"]), [3, 2])
+        self.assertEqual(list(stats["completed"]), [1, 1])
+        self.assertEqual(list(stats["streak_longest"]), [1, 1])
+        self.assertEqual(list(stats["streak_current"]), [1, 1])
+        self.assertEqual(list(stats["max_gap"]), [0, 2])
+
+
 if __name__ == "__main__":
     unittest.main()